@@ -3,31 +3,64 @@
 # Do Not Redistribute 
 # Long Live Bitcoin! 
 
-import argparse, hmac, hashlib, time, json, urllib, urllib2, requests, pytz, elasticsearch, poloinex, uuid, datetime
-from time import sleep
+import argparse, hmac, hashlib, time, json, urllib, urllib2, requests, pytz, elasticsearch, poloinex, uuid, datetime, os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "python"))
+from es_spool import Spool, DEFAULT_SPOOL_DIR, isRetryable
+from doc_ids import getDocumentId, writeDocument, ID_STRATEGIES, DEFAULT_ID_STRATEGY
+from rate_scheduler import RateScheduler, FixedRateClock
 ELASTICSEARCH_HOST = "https://search-bitcoins-2sfk7jzreyq3cfjwvia2mj7d4m.us-west-2.es.amazonaws.com/" 
+# seconds between the starts of two polls, poloniex calls also wait for its rate budget
+POLL_INTERVAL = 0.5
+scheduler = RateScheduler()
+# a ticker is only indexed when one of these differs from the values last indexed for its symbol
+FINGERPRINT_FIELDS = ["last", "highestBid", "lowestAsk", "baseVolume", "quoteVolume", "isFrozen"]
+# minutes after which an unchanged ticker is indexed anyway (marked as a heartbeat), 0 never does
+DEFAULT_HEARTBEAT_MINUTES = 0
+fingerprints = {}
 
 def getArgs(): 
 	parser = argparse.ArgumentParser(description='BTC elastic search data collector')
 	parser.add_argument('--host', default=ELASTICSEARCH_HOST) 
 	parser.add_argument('--forever', action='store_true', default=False)
 	parser.add_argument('--max_records', action='store_true', default=3600)
+	parser.add_argument('--poll_interval', type=float, default=POLL_INTERVAL)
+	parser.add_argument('--heartbeat_minutes', type=float, default=DEFAULT_HEARTBEAT_MINUTES)
+	parser.add_argument('--spool_dir', default=os.path.join(DEFAULT_SPOOL_DIR, "poloinex_tickers"))
+	parser.add_argument('--id_strategy', choices=ID_STRATEGIES, default=DEFAULT_ID_STRATEGY)
 	args = parser.parse_args()
 	return args
 
 def getIndeces(elasticHost): 
 	pass
 
-def getDtoList(connector): 
+# returns None for a ticker that needs no document, otherwise whether the document is only a heartbeat
+def checkTicker(symbol, itemDict, now, heartbeatSeconds): 
+	fingerprint = tuple([itemDict.get(field) for field in FINGERPRINT_FIELDS])
+	previous = fingerprints.get(symbol)
+	if previous == None or previous[0] != fingerprint: 
+		fingerprints[symbol] = (fingerprint, now)
+		return False
+	if heartbeatSeconds > 0 and now - previous[1] >= heartbeatSeconds: 
+		fingerprints[symbol] = (fingerprint, now)
+		return True
+	return None
+
+# only the pairs whose ticker changed since it was last indexed are returned
+def getDtoList(connector, heartbeatSeconds=0): 
 	dtoList = []
-	tickerData = connector.returnTicker()
+	tickerData = scheduler.call("poloniex", "returnTicker", connector.returnTicker)
+	now = time.time()
 	for item in tickerData: 
+		itemDict = tickerData[item]
+		heartbeat = checkTicker(item, itemDict, now, heartbeatSeconds)
+		if heartbeat == None: 
+			continue
 		dto = {}
 		uniqueId = uuid.uuid4()
 		dto["uuid"] = str(uniqueId)
 		dto["date"] = datetime.datetime.utcnow()
 		dto["symbol"] = item
-		itemDict = tickerData[item]
+		dto["heartbeat"] = heartbeat
 		for key in itemDict: 
 			dto[key] = itemDict[key]
 		dtoList.append(dto)
@@ -55,6 +88,7 @@ def putMapping(es, indexName, docType):
 					"quoteVolume": {"type": "float"},
 					"high24hr": {"type": "float"},
 					"isFrozen": {"type": "string"},
+					"heartbeat": {"type": "boolean"},
 					"highestBid": {"type": "float"},
 					"percentChange": {"type": "float"},
 					"low24hr": {"type": "float"},
@@ -68,8 +102,16 @@ def putMapping(es, indexName, docType):
 		raise 
 
 def injectData(es, indexName, docType, docBody, conDocs): 	
-	putNewDocumentRequest = es.create(index=indexName, doc_type=docType, ignore=[400], id=uuid.uuid4(), body=docBody)
-	successful = putNewDocumentRequest["created"]
+	docId = getDocumentId(args.id_strategy, docType, docBody)
+	try: 
+		successful = writeDocument(es, indexName, docType, docId, docBody)
+	except elasticsearch.exceptions.TransportError as e: 
+		if not isRetryable(e): 
+			raise
+		# cluster is down, the document is replayed from disk once it is back
+		spool.append(indexName, docType, docId, docBody)
+		print "ES cluster unavailable, spooled data for " + docType + " to disk"
+		return
 	if successful == True: 
 		print "Added data for " + docType + " (docs consecutively added this run: " + str(conDocs) + ")"
 	else: 
@@ -82,12 +124,15 @@ if __name__ == "__main__":
 	#print args.host
 	conDocs = 0
 	es = elasticsearch.Elasticsearch(args.host, verify_certs=True) 
+	spool = Spool(args.spool_dir)
+	spool.startReplayThread(es)
 	createIndex(es, indexName) 
 	putMapping(es, indexName, docType) 
 	connector = poloinex.poloniex("", "")
+	clock = FixedRateClock(args.poll_interval)
 	while 1 == 1: 
-		tickerData = getDtoList(connector)
-		sleep(0.5)
+		clock.wait()
+		tickerData = getDtoList(connector, args.heartbeat_minutes * 60)
 		for dataPoint in tickerData: 
 			conDocs = conDocs + 1
 			injectData(es, indexName, docType, dataPoint, conDocs)
\ No newline at end of file
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Connect latency of a websocket against a local TLS echo server, up to and
+# including the first message (the server sends it in the same write as the
+# handshake response, as bitfinex does with its info event).  "upgrade" is
+# the time from the established TLS connection to the first message, "connect"
+# includes the TCP and TLS handshakes as well.
+# "recv_line" reads the upgrade response one byte per SSL read like the old
+# handshake, "recv_headers" is the buffered reader.  Needs the openssl binary
+# to make a throwaway certificate.
+# Usage: python3 bench_connect.py
+
+import os, sys, ssl, time, base64, socket, hashlib, tempfile, threading, subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bitfinex"))
+import websocket
+from websocket import _handshake, _socket, _abnf, _http
+
+CONNECTS = 200
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+RESPONSE_HEADERS = [
+	"HTTP/1.1 101 Switching Protocols",
+	"Date: Sat, 02 Jul 2016 10:00:00 GMT",
+	"Connection: upgrade",
+	"Upgrade: websocket",
+	"Set-Cookie: __cfduid=d0123456789abcdef0123456789abcdef1467453600; expires=Sun, 02-Jul-17 10:00:00 GMT; path=/; domain=.example.com; HttpOnly",
+	"Server: cloudflare-nginx",
+	"CF-RAY: 2bbf0123456789ab-FRA"
+]
+INFO_EVENT = b'{"event":"info","version":1.1}'
+
+def createCertificate(directory):
+	certPath = os.path.join(directory, "cert.pem")
+	keyPath = os.path.join(directory, "key.pem")
+	subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost", "-keyout", keyPath, "-out", certPath], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	return certPath, keyPath
+
+def serveClient(conn):
+	try:
+		request = b""
+		while b"\r\n\r\n" not in request:
+			request += conn.recv(4096)
+		key = [line.split(b":", 1)[1].strip() for line in request.split(b"\r\n") if line.lower().startswith(b"sec-websocket-key:")][0]
+		accept = base64.b64encode(hashlib.sha1(key + GUID.encode()).digest()).decode()
+		response = "\r\n".join(RESPONSE_HEADERS + ["Sec-WebSocket-Accept: " + accept, "", ""]).encode()
+		conn.sendall(response + _abnf.ABNF(1, 0, 0, 0, _abnf.ABNF.OPCODE_TEXT, 0, INFO_EVENT).format())
+		while True:
+			data = conn.recv(65536)
+			if not data:
+				break
+			conn.sendall(data)
+	except (OSError, ssl.SSLError):
+		pass
+	finally:
+		conn.close()
+
+def startServer(certPath, keyPath):
+	context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+	context.load_cert_chain(certPath, keyPath)
+	listener = socket.socket()
+	listener.bind(("127.0.0.1", 0))
+	listener.listen(16)
+	def acceptForever():
+		while True:
+			conn, addr = listener.accept()
+			conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			try:
+				conn = context.wrap_socket(conn, server_side=True)
+			except (OSError, ssl.SSLError):
+				conn.close()
+				continue
+			threading.Thread(target=serveClient, args=(conn,), daemon=True).start()
+	threading.Thread(target=acceptForever, daemon=True).start()
+	return listener.getsockname()[1]
+
+def recvHeadersByLine(sock, bufsize=4096):
+	lines = []
+	while True:
+		line = _socket.recv_line(sock)
+		lines.append(line)
+		if not line.strip():
+			return lines, b""
+
+def percentile(timings, fraction):
+	timings = sorted(timings)
+	return timings[int(len(timings) * fraction)] * 1000
+
+def measure(port, connects):
+	url = "wss://127.0.0.1:" + str(port) + "/ws"
+	totals = []
+	handshakes = []
+	for i in range(connects):
+		start = time.perf_counter()
+		ws = websocket.WebSocket(sslopt={"cert_reqs": ssl.CERT_NONE})
+		ws.sock, addrs = _http.connect(url, ws.sock_opt, _http.proxy_info())
+		connected = time.perf_counter()
+		ws.handshake_response = _handshake.handshake(ws.sock, *addrs)
+		ws.frame_buffer.reset(ws.handshake_response.unread)
+		ws.connected = True
+		message = ws.recv()
+		end = time.perf_counter()
+		assert message == INFO_EVENT.decode()
+		totals.append(end - start)
+		handshakes.append(end - connected)
+		ws.close()
+	return percentile(handshakes, 0.5), percentile(handshakes, 0.9), percentile(totals, 0.5)
+
+if __name__ == "__main__":
+	with tempfile.TemporaryDirectory() as directory:
+		port = startServer(*createCertificate(directory))
+		implementations = [("recv_line", recvHeadersByLine), ("recv_headers", _socket.recv_headers)]
+		print("%-14s%16s%16s%16s   (ms, %d connects)" % ("reader", "upgrade p50", "upgrade p90", "connect p50", CONNECTS))
+		for name, reader in implementations:
+			_handshake.recv_headers = reader
+			measure(port, 10)
+			print("%-14s%16.3f%16.3f%16.3f" % ((name,) + measure(port, CONNECTS)))
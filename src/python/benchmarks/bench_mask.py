@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Throughput of websocket frame masking (ABNF.mask) for 1 KB to 1 MB payloads,
+# compared with the old byte-at-a-time loop.
+# Usage: python3 bench_mask.py
+
+import os, sys, array, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bitfinex"))
+from websocket import _abnf
+
+SIZES = [1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024]
+
+def maskLoop(maskKey, data):
+	_m = array.array("B", maskKey)
+	_d = array.array("B", data)
+	for i in range(len(_d)):
+		_d[i] ^= _m[i % 4]
+	return _d.tobytes()
+
+def measure(fn, maskKey, data):
+	runs = max(1, int(2 * 1024 * 1024 / len(data)))
+	seconds = min(timeit.repeat(lambda: fn(maskKey, data), number=runs, repeat=3))
+	return len(data) * runs / seconds / (1024 * 1024)
+
+if __name__ == "__main__":
+	maskKey = os.urandom(4)
+	implementations = [("loop", maskLoop), ("int.from_bytes", _abnf._mask_int)]
+	if _abnf.numpy:
+		implementations.append(("numpy", _abnf._mask_numpy))
+	implementations.append(("ABNF.mask", _abnf.ABNF.mask))
+	print("%-10s" % "size" + "".join(["%18s" % name for name, fn in implementations]) + "   (MB/s)")
+	for size in SIZES:
+		data = os.urandom(size)
+		row = "%-10s" % (str(size // 1024) + " KB")
+		for name, fn in implementations:
+			row += "%18.1f" % measure(fn, maskKey, data)
+		print(row)
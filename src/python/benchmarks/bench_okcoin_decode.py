@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Decoding of okcoin binary websocket messages.  "old" is the previous
+# decompressobj + flush, decode('UTF-8'), json.loads pipeline, "decoder" is
+# DeflateJsonDecoder.iterItems consumed in full, "first item" is the time
+# until iterItems hands over the first channel of a push.
+# Usage: python3 bench_okcoin_decode.py
+
+import os, sys, json, zlib, random, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from deflate_json import DeflateJsonDecoder
+
+def getDepth(pair):
+	bids = [[round(430 - i * 0.01, 2), round(random.random() * 10, 3)] for i in range(60)]
+	asks = [[round(430 + i * 0.01, 2), round(random.random() * 10, 3)] for i in range(60)]
+	return { "channel": "ok_sub_spotusd_" + pair + "_depth_60", "data": { "bids": bids, "asks": asks, "timestamp": 1467453600000 } }
+
+def getTicker(pair):
+	return { "channel": "ok_sub_spotusd_" + pair + "_ticker", "data": { "buy": "430.01", "high": "440.2", "last": "430.05", "low": "425.0", "sell": "430.09", "timestamp": "1467453600000", "vol": "12,345.67" } }
+
+def getTrades(pair, count):
+	return { "channel": "ok_sub_spotusd_" + pair + "_trades", "data": [[str(100000 + i), "430.05", "0.5", "10:00:00", "bid"] for i in range(count)] }
+
+def deflate(items):
+	compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+	return compressor.compress(json.dumps(items).encode("utf-8")) + compressor.flush()
+
+# (name, message)
+WORKLOADS = [
+	("ticker", deflate([getTicker("btc")])),
+	("trades x20", deflate([getTrades("btc", 20)])),
+	("depth_60", deflate([getDepth("btc")])),
+	("all channels", deflate([getDepth("btc"), getDepth("ltc"), getTicker("btc"), getTicker("ltc"), getTrades("btc", 50), getTrades("ltc", 50)] * 4))
+]
+
+def decodeOld(data):
+	decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+	inflated = decompressor.decompress(data)
+	inflated += decompressor.flush()
+	for item in json.loads(inflated.decode(encoding="UTF-8")):
+		pass
+
+def decodeNew(decoder, data):
+	for item in decoder.iterItems(data):
+		pass
+
+def firstItem(decoder, data):
+	for item in decoder.iterItems(data):
+		break
+
+def measure(fn):
+	runs = 2000
+	return min(timeit.repeat(fn, number=runs, repeat=3)) / runs * 1000000
+
+if __name__ == "__main__":
+	print("%-14s%8s%12s%12s%12s   (us/message)" % ("message", "bytes", "old", "decoder", "first item"))
+	for name, data in WORKLOADS:
+		decoder = DeflateJsonDecoder()
+		row = "%-14s%8d" % (name, len(data))
+		row += "%12.1f" % measure(lambda: decodeOld(data))
+		row += "%12.1f" % measure(lambda: decodeNew(decoder, data))
+		row += "%12.1f" % measure(lambda: firstItem(DeflateJsonDecoder(), data))
+		print(row)
+		print("    " + decoder.formatStats())
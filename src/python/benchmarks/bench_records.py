@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Cost of turning one book update into its _bulk action/source lines.  "dict"
+# is the previous getOrderDto (fresh dict, uuid4 and datetime.now per record)
+# serialized with the elasticsearch JSONSerializer, "record" is an OrderRecord
+# sharing one FrameStamp per frame, written with toJson and a prebuilt action
+# prefix.  A frame of 1 is a single book update, 100 is a book snapshot.
+# Usage: python3 bench_records.py
+
+import os, sys, uuid, datetime, timeit, pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from elasticsearch.serializer import JSONSerializer
+from records import OrderRecord, FrameStamp, nextUuid, encodeString
+
+TIMEZONE = pytz.timezone("UTC")
+SERIALIZER = JSONSerializer()
+ACTION_PREFIX = '{"create":{"_index":"live_crypto_orderbooks","_type":"bitfinex","_id":'
+
+def getLevels(count):
+	return [[430.0 + i * 0.01, float(i % 7 + 1), (i % 2 * 2 - 1) * 1.25] for i in range(count)]
+
+def getOrderDict(dataSet, currencyPair):
+	orderDto = {}
+	orderDto["uuid"] = str(uuid.uuid4())
+	orderDto["date"] = datetime.datetime.now(TIMEZONE)
+	orderDto["currency_pair"] = currencyPair
+	orderDto["price"] = float(dataSet[0])
+	orderDto["count"] = float(dataSet[1])
+	volVal = float(dataSet[2])
+	orderDto["volume"] = volVal
+	if volVal < 0:
+		orderDto["order_type"] = "ASK"
+		orderDto["absolute_volume"] = float(volVal * -1)
+	else:
+		orderDto["order_type"] = "BID"
+		orderDto["absolute_volume"] = float(volVal)
+	return orderDto
+
+def bodyDict(levels):
+	body = []
+	for level in levels:
+		action = { "create": { "_index": "live_crypto_orderbooks", "_type": "bitfinex", "_id": str(uuid.uuid4()) } }
+		body.append(SERIALIZER.dumps(action) + "\n" + SERIALIZER.dumps(getOrderDict(level, "BTCUSD")) + "\n")
+	return body
+
+def bodyRecord(levels):
+	body = []
+	stamp = FrameStamp()
+	for level in levels:
+		volVal = float(level[2])
+		record = OrderRecord(uuid=nextUuid(), date=stamp, currency_pair="BTCUSD", price=float(level[0]), count=float(level[1]), volume=volVal, absolute_volume=abs(volVal), order_type="ASK" if volVal < 0 else "BID")
+		body.append(ACTION_PREFIX + encodeString(nextUuid()) + "}}\n" + record.toJson() + "\n")
+	return body
+
+def measure(fn, levels, number):
+	return min(timeit.repeat(lambda: fn(levels), number=number, repeat=5)) / number / len(levels) * 1000000
+
+# bytes held by the container of one document, not counting the values it shares with others
+def getDocumentSize():
+	level = getLevels(1)[0]
+	record = OrderRecord(uuid=nextUuid(), date=FrameStamp(), currency_pair="BTCUSD", price=level[0], count=level[1], volume=level[2], absolute_volume=abs(level[2]), order_type="ASK")
+	return sys.getsizeof(getOrderDict(level, "BTCUSD")), sys.getsizeof(record)
+
+if __name__ == "__main__":
+	implementations = [("dict", bodyDict), ("record", bodyRecord)]
+	print("%-10s" % "frame" + "".join(["%12s" % name for name, fn in implementations]) + "   (us per update)")
+	for frameSize, number in [(1, 20000), (100, 200)]:
+		levels = getLevels(frameSize)
+		row = "%-10s" % frameSize
+		for name, fn in implementations:
+			row += "%12.2f" % measure(fn, levels, number)
+		print(row)
+	print("document container: dict %d bytes, record %d bytes" % getDocumentSize())
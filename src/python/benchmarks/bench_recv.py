@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Frame parsing throughput of websocket's frame_buffer, reading a recorded
+# stream of unmasked server frames in 16 KB socket reads.  "list+join" is the
+# old recv_strict that kept a list of chunks and joined/sliced them on every
+# read, "recv_into" is the preallocated buffer filled with recv_into.
+# Usage: python3 bench_recv.py
+
+import os, sys, struct, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bitfinex"))
+from websocket import _abnf
+
+READ_SIZE = 16384
+
+# (name, payload size, frame count)
+WORKLOADS = [
+	("ticker 200 B", 200, 20000),
+	("trades 4 KB", 4 * 1024, 2000),
+	("book 64 KB", 64 * 1024, 200),
+	("snapshot 1 MB", 1024 * 1024, 20)
+]
+
+class StreamSock:
+	def __init__(self, data):
+		self.data = memoryview(data)
+		self.offset = 0
+
+	def recv(self, bufsize):
+		bufsize = min(bufsize, READ_SIZE)
+		chunk = self.data[self.offset:self.offset + bufsize].tobytes()
+		self.offset += len(chunk)
+		return chunk
+
+	def recv_into(self, buffer, nbytes):
+		nbytes = min(nbytes, READ_SIZE, len(self.data) - self.offset)
+		buffer[:nbytes] = self.data[self.offset:self.offset + nbytes]
+		self.offset += nbytes
+		return nbytes
+
+class ListJoinFrameBuffer(_abnf.frame_buffer):
+	def __init__(self, recv_fn, skip_utf8_validation):
+		_abnf.frame_buffer.__init__(self, recv_fn, skip_utf8_validation)
+		self.chunks = []
+
+	def recv_header(self):
+		header = self.recv_strict(2)
+		b1 = header[0]
+		b2 = header[1]
+		self.header = (b1 >> 7 & 1, b1 >> 6 & 1, b1 >> 5 & 1, b1 >> 4 & 1, b1 & 0xf, b2 >> 7 & 1, b2 & 0x7f)
+
+	def recv_length(self):
+		length_bits = self.header[6] & 0x7f
+		if length_bits == 0x7e:
+			self.length = struct.unpack("!H", self.recv_strict(2))[0]
+		elif length_bits == 0x7f:
+			self.length = struct.unpack("!Q", self.recv_strict(8))[0]
+		else:
+			self.length = length_bits
+
+	def recv_strict(self, bufsize):
+		shortage = bufsize - sum(len(x) for x in self.chunks)
+		while shortage > 0:
+			data = self.recv(min(16384, shortage))
+			self.chunks.append(data)
+			shortage -= len(data)
+		unified = b"".join(self.chunks)
+		if shortage == 0:
+			self.chunks = []
+			return unified
+		self.chunks = [unified[bufsize:]]
+		return unified[:bufsize]
+
+def getStream(payloadSize, frameCount):
+	frame = _abnf.ABNF(1, 0, 0, 0, _abnf.ABNF.OPCODE_BINARY, 0, os.urandom(payloadSize)).format()
+	return frame * frameCount
+
+def parseListJoin(stream, frameCount):
+	sock = StreamSock(stream)
+	buf = ListJoinFrameBuffer(sock.recv, True)
+	for i in range(frameCount):
+		buf.recv_frame()
+
+def parseRecvInto(stream, frameCount):
+	sock = StreamSock(stream)
+	buf = _abnf.frame_buffer(sock.recv, True, sock.recv_into)
+	for i in range(frameCount):
+		buf.recv_frame()
+
+def measure(fn, stream, frameCount):
+	seconds = min(timeit.repeat(lambda: fn(stream, frameCount), number=1, repeat=5))
+	return len(stream) / seconds / (1024 * 1024)
+
+if __name__ == "__main__":
+	implementations = [("list+join", parseListJoin), ("recv_into", parseRecvInto)]
+	print("%-16s" % "workload" + "".join(["%14s" % name for name, fn in implementations]) + "   (MB/s)")
+	for name, payloadSize, frameCount in WORKLOADS:
+		stream = getStream(payloadSize, frameCount)
+		row = "%-16s" % name
+		for implementation, fn in implementations:
+			row += "%14.1f" % measure(fn, stream, frameCount)
+		print(row)
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Cost of validating and decoding a text message, as WebSocketApp.run_forever
+# does for every bitfinex frame.  "dfa+decode" is the old pure python DFA
+# followed by a second bytes.decode, "decode_utf8" validates and decodes in
+# one call of the built-in codec.
+# Usage: python3 bench_utf8.py
+
+import os, sys, json, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bitfinex"))
+from websocket import _utils
+
+def getMessage(levels):
+	book = [[round(430.1 + i * 0.01, 2), 3, round(1.5 + i, 4)] for i in range(levels)]
+	return json.dumps([17, book]).encode("utf-8")
+
+# (name, message)
+WORKLOADS = [
+	("trade update", json.dumps([5, "te", "1234-BTCUSD", 1467327825, 430.12, -0.25]).encode("utf-8")),
+	("book 25 levels", getMessage(25)),
+	("book 1000 levels", getMessage(1000)),
+	("non-ascii 4 KB", (u"é中\U0001f600x" * 400).encode("utf-8"))
+]
+
+def dfaAndDecode(data):
+	if not _utils._validate_utf8_dfa(data):
+		raise ValueError()
+	return data.decode("utf-8")
+
+def decodeOnce(data):
+	valid, text = _utils.decode_utf8(data)
+	if not valid:
+		raise ValueError()
+	return text
+
+def measure(fn, data):
+	runs = max(1, int(1024 * 1024 / len(data)))
+	seconds = min(timeit.repeat(lambda: fn(data), number=runs, repeat=3))
+	return seconds / runs * 1000000
+
+if __name__ == "__main__":
+	implementations = [("dfa+decode", dfaAndDecode), ("decode_utf8", decodeOnce)]
+	print("%-18s%8s" % ("message", "bytes") + "".join(["%14s" % name for name, fn in implementations]) + "   (us/message)")
+	for name, data in WORKLOADS:
+		row = "%-18s%8d" % (name, len(data))
+		for implementation, fn in implementations:
+			row += "%14.2f" % measure(fn, data)
+		print(row)
@@ -29,14 +29,25 @@ __copyright__   = "Copyright 2016, seclorum"
 import os
 import sys
 import json
+import time
 import uuid
+import socket
 import pytz
 import datetime
 import argparse
 import requests
 import elasticsearch
 
-from websocket import create_connection
+from websocket import create_connection, WebSocketException
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bulk_sink import BulkSink, DEFAULT_BULK_MAX_DOCS, DEFAULT_BULK_MAX_BYTES, DEFAULT_BULK_MAX_LATENCY
+from es_spool import Spool, DEFAULT_SPOOL_DIR
+from bitfinex_orderbook import OrderBook
+from candles import CandleAggregator, getCandleDto, DEFAULT_OPEN_CANDLE_INTERVAL
+from records import OrderRecord, TradeRecord, TickerRecord, FrameStamp, nextUuid
+from doc_ids import DEFAULT_ID_STRATEGY
+from reconnect import ReconnectManager, OUTAGE_INDEX_NAME, DEFAULT_RECONNECT_BASE_DELAY, DEFAULT_RECONNECT_MAX_DELAY
 
 DEFAULT_DOCTYPE_NAME = "bitfinex"
 DEFAULT_INDEX_NAME = "live_orderbooks"
@@ -44,19 +55,96 @@ DEFAULT_API_URL = "https://api.bitfinex.com/v1"
 DEFAULT_WEBSOCKETS_URL = "wss://api2.bitfinex.com:3000/ws"
 DEFAULT_ELASTICSEARCH_URL = "https://es.btcdata.org:9200"
 TIMEZONE = pytz.timezone("UTC")
-DEFAULT_INDECES = ["live_crypto_orderbooks", "live_crypto_tickers", "live_crypto_trades"]
+DEFAULT_INDECES = ["live_crypto_orderbooks", "live_crypto_tickers", "live_crypto_trades", "live_crypto_candlesticks", OUTAGE_INDEX_NAME]
+
+# "snapshot" keeps the book in memory and indexes it every DEFAULT_BOOK_SNAPSHOT_INTERVAL seconds,
+# "deltas" indexes every raw book update as it arrives
+BOOK_INDEX_SNAPSHOT = "snapshot"
+BOOK_INDEX_DELTAS = "deltas"
+DEFAULT_BOOK_INDEX_MODE = BOOK_INDEX_SNAPSHOT
+DEFAULT_BOOK_SNAPSHOT_INTERVAL = 10
+# number of levels per side written with each snapshot, None for the whole book
+DEFAULT_BOOK_DEPTH = None
+# offer permessage-deflate, servers that do not support it just answer without it
+DEFAULT_PERMESSAGE_DEFLATE = True
+# every channel sends a heartbeat every few seconds, a connection silent for this long is treated as dropped
+DEFAULT_RECV_TIMEOUT = 30
+# /symbols rarely changes, it is read from this file while the file is younger than DEFAULT_SYMBOLS_CACHE_TTL seconds
+DEFAULT_SYMBOLS_CACHE_PATH = "bitfinex_symbols.json"
+DEFAULT_SYMBOLS_CACHE_TTL = 3600
+CHANNELS_PER_SYMBOL = 3
+
+def readSymbolsCache(cachePath):
+	try:
+		with open(cachePath) as cacheFile:
+			return json.load(cacheFile)
+	except (IOError, OSError, ValueError):
+		return None
+
+# a stale cache is still used when the api cannot be reached, a ttl of 0 always asks the api
+def getCachedSymbols(apiUrl=DEFAULT_API_URL, cachePath=DEFAULT_SYMBOLS_CACHE_PATH, ttl=DEFAULT_SYMBOLS_CACHE_TTL):
+	if cachePath != None and os.path.exists(cachePath) and time.time() - os.path.getmtime(cachePath) < ttl:
+		symbols = readSymbolsCache(cachePath)
+		if symbols != None:
+			return symbols
+	symbolsApiEndpoint = apiUrl + "/symbols"
+	print ("SYMBOLS ENDPOINT: " + symbolsApiEndpoint)
+	try:
+		req = requests.get(symbolsApiEndpoint)
+		symbols = req.json()
+	except Exception:
+		symbols = readSymbolsCache(cachePath) if cachePath != None else None
+		if symbols == None:
+			raise
+		print ("SYMBOLS API UNAVAILABLE, USING THE CACHED LIST FROM " + cachePath)
+		return symbols
+	if cachePath != None:
+		tempPath = cachePath + ".tmp"
+		with open(tempPath, "w") as cacheFile:
+			json.dump(symbols, cacheFile)
+		os.rename(tempPath, cachePath)
+	return symbols
 
 class Bitfinex:
-	def __init__(self, wsUrl=DEFAULT_WEBSOCKETS_URL, esUrl=DEFAULT_ELASTICSEARCH_URL, apiUrl=DEFAULT_API_URL):
+	def __init__(self, wsUrl=DEFAULT_WEBSOCKETS_URL, esUrl=DEFAULT_ELASTICSEARCH_URL, apiUrl=DEFAULT_API_URL, bulkMaxDocs=DEFAULT_BULK_MAX_DOCS, bulkMaxBytes=DEFAULT_BULK_MAX_BYTES, bulkMaxLatency=DEFAULT_BULK_MAX_LATENCY, spoolDir=os.path.join(DEFAULT_SPOOL_DIR, DEFAULT_DOCTYPE_NAME), bookIndexMode=DEFAULT_BOOK_INDEX_MODE, bookSnapshotInterval=DEFAULT_BOOK_SNAPSHOT_INTERVAL, bookDepth=DEFAULT_BOOK_DEPTH, openCandleInterval=DEFAULT_OPEN_CANDLE_INTERVAL, idStrategy=DEFAULT_ID_STRATEGY, symbols=None, symbolsCachePath=DEFAULT_SYMBOLS_CACHE_PATH, symbolsCacheTtl=DEFAULT_SYMBOLS_CACHE_TTL, reconnectBaseDelay=DEFAULT_RECONNECT_BASE_DELAY, reconnectMaxDelay=DEFAULT_RECONNECT_MAX_DELAY):
 		self.wsUrl = wsUrl
 		self.esUrl = esUrl
 		self.apiUrl = apiUrl
-		self.symbols = self.getSymbols()
+		self.symbolsCachePath = symbolsCachePath
+		self.symbolsCacheTtl = symbolsCacheTtl
+		self.bulkMaxDocs = bulkMaxDocs
+		self.bulkMaxBytes = bulkMaxBytes
+		self.bulkMaxLatency = bulkMaxLatency
+		self.spoolDir = spoolDir
+		self.idStrategy = idStrategy
+		self.bookIndexMode = bookIndexMode
+		self.bookSnapshotInterval = bookSnapshotInterval
+		self.bookDepth = bookDepth
+		self.orderBooks = {}
+		self.lastBookSnapshot = {}
+		# candles are built from the trades channel, bitfinex has no kline channel of its own
+		self.candles = CandleAggregator(self.postCandle, openCandleInterval=openCandleInterval)
+		# pair -> (timestamp of the newest trade in the candles, sequence ids seen at that timestamp)
+		self.lastCandleTrades = {}
+		self.lastCandleSweep = time.time()
+		self.startedAt = time.time()
+		self.messageCount = 0
+		self.lastMessageAt = None
+		self.firstDataAt = None
+		self.channelMappings = {}
+		self.reconnects = ReconnectManager(DEFAULT_DOCTYPE_NAME, self.postOutage, reconnectBaseDelay, reconnectMaxDelay)
+		# a worker of bitfinex_supervisor is given its share of the symbols, everyone else takes them all
+		if symbols == None:
+			symbols = self.getSymbols()
+		self.symbols = symbols
 		self.connectWebsocket()
+		# the subscriptions are answered while the indices and mappings below are set up, run() picks the answers up
+		self.subscribeChannels()
 		self.connectElasticsearch()
 		self.createIndices()
 		self.getCompletedTradesMapping()
 		self.getOrderbookElasticsearchMapping()
+		self.getKlineMapping()
 		self.createMappings()
 
 
@@ -74,12 +162,13 @@ class Bitfinex:
 			self.es.indices.put_mapping(index="live_crypto_orderbooks", doc_type=DEFAULT_DOCTYPE_NAME, body=self.orderbookMapping)
 			self.es.indices.put_mapping(index="live_crypto_trades", doc_type=DEFAULT_DOCTYPE_NAME, body=self.completedTradeMapping)
 			self.es.indices.put_mapping(index="live_crypto_tickers", doc_type=DEFAULT_DOCTYPE_NAME, body=self.orderbookMapping)
+			self.es.indices.put_mapping(index="live_crypto_candlesticks", doc_type=DEFAULT_DOCTYPE_NAME, body=self.klineMapping)
 		except:
 			raise
 
 	def connectWebsocket(self):
 		try:
-			self.ws = create_connection(self.wsUrl)
+			self.ws = create_connection(self.wsUrl, timeout=DEFAULT_RECV_TIMEOUT, permessage_deflate=DEFAULT_PERMESSAGE_DEFLATE)
 		except:
 			raise
 		return True
@@ -87,19 +176,15 @@ class Bitfinex:
 	def connectElasticsearch(self):
 		try:
 			self.es = elasticsearch.Elasticsearch([self.esUrl])
+			self.spool = Spool(self.spoolDir)
+			self.spool.startReplayThread(self.es)
+			self.sink = BulkSink(self.es, self.bulkMaxDocs, self.bulkMaxBytes, self.bulkMaxLatency, spool=self.spool, idStrategy=self.idStrategy)
 		except:
 			raise
 		return True
 
 	def getSymbols(self):
-		symbolsApiEndpoint = self.apiUrl + "/symbols"
-		print ("SYMBOLS ENDPOINT: " + symbolsApiEndpoint)
-		try:
-			req = requests.get(symbolsApiEndpoint)
-			reqJson = req.json()
-		except:
-			raise
-		return reqJson
+		return getCachedSymbols(self.apiUrl, self.symbolsCachePath, self.symbolsCacheTtl)
 
 	def getOrderbookElasticsearchMapping(self):
 		self.orderbookMapping = {
@@ -160,102 +245,112 @@ class Bitfinex:
 		}
 		return self.bitfinexTickerMapping
 
-	def getOrderDto(self, dataSet, currencyPair):
-		orderDto = {}
-		recordDate = datetime.datetime.now(TIMEZONE)
-		uuidVar = uuid.uuid4()
-		uuidStr = str(uuidVar)
-		orderDto["uuid"] = uuidStr
-		orderDto["date"] = recordDate
-		orderDto["currency_pair"] = currencyPair
+	def getKlineMapping(self):
+		self.klineMapping = {
+			"bitfinex": {
+				"properties": {
+					"uuid": { "type": "string", "index": "no"},
+					"date": {"type": "date"},
+					"timestamp": {"type": "string", "index": "no"},
+					"open_price": {"type": "float"},
+					"highest_price": {"type": "float"},
+					"lowest_price": {"type": "float"},
+					"close_price": {"type": "float"},
+					"volume": {"type": "float"},
+					"trade_count": {"type": "integer"},
+					"closed": {"type": "boolean"},
+					"currency_symbol": {"type": "string"},
+					"contract_type": {"type": "string"}
+				}
+			}
+		}
+		return self.klineMapping
+
+	# stamp is the FrameStamp of the frame the data came in, every record built from one frame shares it
+	def getOrderDto(self, dataSet, currencyPair, stamp=None):
 		if (len(dataSet) != 3):
 			print (dataSet)
 			raise IOError("Invalid data set passed to getOrderDto")
-		orderDto["price"] = float(dataSet[0])
-		orderDto["count"] = float(dataSet[1])
+		if stamp == None:
+			stamp = FrameStamp()
 		volVal = float(dataSet[2])
-		orderDto["volume"] = volVal
 		if volVal < 0:
-			orderDto["order_type"] = "ASK"
-			orderDto["absolute_volume"] = float(volVal * -1)
+			orderType = "ASK"
 		else:
-			orderDto["order_type"] = "BID"
-			orderDto["absolute_volume"] = float(volVal)
-		return orderDto
+			orderType = "BID"
+		return OrderRecord(uuid=nextUuid(), date=stamp, currency_pair=currencyPair, price=float(dataSet[0]), count=float(dataSet[1]), volume=volVal, absolute_volume=abs(volVal), order_type=orderType)
 
-	def getCompletedTradeDto(self, theResult, completedTrade, currencyPair):
+	def getCompletedTradeDto(self, theResult, completedTrade, currencyPair, stamp=None):
 		sliceData = theResult[1]
 
 		if str(sliceData) == 'hb': 
 			return None
 		else: 
-			tradeDto = {}
-			recordDate = datetime.datetime.now(TIMEZONE)
-			uuidVar = uuid.uuid4()
-			uuidStr = str(uuidVar)
-			tradeDto["uuid"] = str(uuidVar) 
-			tradeDto["date"] = recordDate
-			tradeDto["currency_pair"] = str(currencyPair)
-	# print (theResult)
+			if stamp == None:
+				stamp = FrameStamp()
+			currencyPair = str(currencyPair)
 			if len(completedTrade) == 2: 
 				sliceData = completedTrade[1]
 				sliceList = []
 				for data in sliceData: 
 					if len(data) == 4: 
-						tradeDataDto = {}
-						tradeDataDto["uuid"] = str(uuidVar) 
-						tradeDataDto["sequence_id"] = str(data[0])
-						tradeDataDto["timestamp"] = str(data[1])
-						tradeDataDto["price"] = float(data[2])
-						volVal = data[3]
-						tradeDataDto["volume"] = float(volVal)
+						volVal = float(data[3])
 						if volVal < 0: 
-							absVol = volVal * -1
-							tradeDataDto["order_type"] = "ASK" 
+							orderType = "ASK"
 						else: 
-							absVol = volVal
-							tradeDataDto["order_type"] = "BID"
-						tradeDataDto["absolute_volume"] = float(absVol)
-						sliceList.append(tradeDataDto)
+							orderType = "BID"
+						sliceList.append(TradeRecord(uuid=nextUuid(), date=stamp, currency_pair=currencyPair, sequence_id=str(data[0]), timestamp=str(data[1]), price=float(data[2]), volume=volVal, absolute_volume=abs(volVal), order_type=orderType))
 				return sliceList
-						# print(data)
 			else: 
 				# [7, 'tu', '1494638-BTCUSD', 16304465, 1458389060, 407.66, 0.05]
-				tradeDto = {}
-				# raise IOError("completed trade result is length two with chan ID not length 2 heart beat or slice list")
-				if len(completedTrade) >= 2: 
-					sequenceType = completedTrade[1]
-					if sequenceType == "te": 
-						tradeDto["sequence_id"] = completedTrade[2]
-						tradeDto["timestamp"] = completedTrade[3]
-						tradeDto["price"] = float(completedTrade[4])
-						volVal = float(completedTrade[5])
-					elif sequenceType == "tu": 
-						tradeDto["sequence_id"] = completedTrade[2]
-						tradeDto["order_id"] = completedTrade[3]
-						tradeDto["timestamp"] = completedTrade[4]
-						tradeDto["price"] = completedTrade[5]
-						volVal = float(completedTrade[6])
-					else: 
-						raise IOError("WEIRD") 
-					tradeDto["volume"] = float(volVal)
-					if volVal < 0: 
-						absVol = volVal * -1
-						tradeDto["order_type"] = "ASK" 
-					else: 
-						absVol = volVal
-						tradeDto["order_type"] = "BID"
-					tradeDto["absolute_volume"] = float(absVol)
-				return tradeDto
+				if len(completedTrade) < 2: 
+					return None
+				orderId = None
+				sequenceType = completedTrade[1]
+				if sequenceType == "te": 
+					sequenceId, timestamp, price, volVal = completedTrade[2:6]
+				elif sequenceType == "tu": 
+					sequenceId, orderId, timestamp, price, volVal = completedTrade[2:7]
+					orderId = str(orderId)
+				else: 
+					raise IOError("WEIRD") 
+				volVal = float(volVal)
+				if volVal < 0: 
+					orderType = "ASK"
+				else: 
+					orderType = "BID"
+				return TradeRecord(uuid=nextUuid(), date=stamp, currency_pair=currencyPair, sequence_id=str(sequenceId), order_id=orderId, timestamp=str(timestamp), price=float(price), volume=volVal, absolute_volume=abs(volVal), order_type=orderType)
 
+	# documents are buffered and written in batches by the bulk sink, failures are reported per document
 	def postDto(self, dto, indexName=DEFAULT_INDEX_NAME, docType=DEFAULT_DOCTYPE_NAME):
-		newDocUploadRequest = self.es.create(index=indexName, doc_type=docType, id=uuid.uuid4(), body=dto)
-		return newDocUploadRequest["created"]
+		return self.sink.add(dto, indexName, docType)
+
+	def postCandle(self, currencyPairSymbol, intervalName, candle, closed):
+		return self.postDto(getCandleDto(currencyPairSymbol, intervalName, candle, closed), "live_crypto_candlesticks", DEFAULT_DOCTYPE_NAME)
 
-	def getChannelMappings(self):
-		allChannelsSubscribed = False
-		channelDict = {}
-		channelMappings = {}
+	def addTradesToCandles(self, tradesDto, currencyPairSymbol):
+		# the snapshot sent on subscribe only holds the last few trades, fed in it would publish
+		# closed candles for past buckets made of those few trades, so candles start with the live trades
+		if type(tradesDto) is list:
+			return
+		# a "tu" message repeats an execution already seen as "te", only with the trade id filled in
+		if tradesDto.order_id != None:
+			return
+		# a trade the exchange sends again (say after a reconnect) is not counted twice
+		timestamp = float(tradesDto.timestamp)
+		lastTimestamp, sequenceIds = self.lastCandleTrades.get(currencyPairSymbol, (None, set()))
+		if lastTimestamp != None and (timestamp < lastTimestamp or (timestamp == lastTimestamp and tradesDto.sequence_id in sequenceIds)):
+			return
+		if timestamp != lastTimestamp:
+			sequenceIds = set()
+		sequenceIds.add(tradesDto.sequence_id)
+		self.lastCandleTrades[currencyPairSymbol] = (timestamp, sequenceIds)
+		self.candles.addTrade(currencyPairSymbol, timestamp, tradesDto.price, tradesDto.volume)
+
+	# every subscribe request goes out at once, each channel is mapped as soon as its "subscribed" event comes back
+	def subscribeChannels(self):
+		self.channelMappings = {}
+		self.subscribeSentAt = time.time()
 		for symbol in self.symbols:
 			self.ws.send(json.dumps({
 				"event": "subscribe",
@@ -274,40 +369,53 @@ class Bitfinex:
 			    "channel": "trades",
 			    "pair": symbol,
 			}))
-		while (allChannelsSubscribed == False):
-			resultData = self.ws.recv()
-			try:
-				dataJson = json.loads(resultData)
-					# print (dataJson)
-				pairName = str(dataJson["pair"])
-				print ("PAIR NAME IS: " + pairName)
-				pairChannelType = str(dataJson["channel"])
-				identifier = pairName
-				channelId = dataJson["chanId"]
-				channelDict[channelId] = identifier
-				channelMappings[channelId] = dataJson
-				symbolLength = len(self.symbols)
-				# CHANNELS ARE ALL SUBSCRIBED WHEN SYMBOL LENGTH * # # # # # # # # 
-				targetLength = symbolLength * 3 
-				# IF THIS SAVED YOU HOURS OF DEBUGGING, YOU'RE FUCKING WELCOME * #
-				if (len(channelDict) == targetLength):
-					allChannelsSubscribed = True
-					print ("all channels subscribed..")
-			except TypeError:
-				pass
-			except:
-				raise
-		return channelMappings
 
-	def updateOrderBookIndex(self, theResult, dataJson, currencyPairSymbol):
+	# a new connection with the same subscriptions, the book channels answer with a fresh snapshot
+	# so the in-memory books start over instead of carrying levels that changed while we were away.
+	# The candles are kept, the trades snapshot is never added to them and lastCandleTrades drops
+	# any trade that was already counted before the connection dropped
+	def resubscribe(self):
+		try:
+			self.ws.close()
+		except Exception:
+			pass
+		self.connectWebsocket()
+		self.orderBooks = {}
+		self.lastBookSnapshot = {}
+		self.firstDataAt = None
+		self.subscribeChannels()
+
+	def reconnect(self, reason):
+		self.reconnects.disconnected(reason, self.lastMessageAt)
+		self.reconnects.reconnect(self.resubscribe)
+
+	def postOutage(self, outage):
+		self.postDto(outage, OUTAGE_INDEX_NAME, DEFAULT_DOCTYPE_NAME)
+
+	def handleEvent(self, dataJson):
+		event = dataJson.get("event")
+		if event == "subscribed":
+			self.channelMappings[dataJson["chanId"]] = dataJson
+			if len(self.channelMappings) == len(self.symbols) * CHANNELS_PER_SYMBOL:
+				print ("all channels subscribed in " + "%.3f" % (time.time() - self.subscribeSentAt) + " seconds")
+		elif event == "error":
+			print ("SUBSCRIPTION ERROR: " + str(dataJson))
+		else:
+			print (dataJson)
+
+	def updateOrderBookIndex(self, theResult, dataJson, currencyPairSymbol, stamp=None):
+		if currencyPairSymbol not in self.orderBooks:
+			self.orderBooks[currencyPairSymbol] = OrderBook(currencyPairSymbol)
+		orderBook = self.orderBooks[currencyPairSymbol]
 		if len(dataJson) == 2:
 			orderList = theResult[1]
 			if orderList == 'hb':
 				# print ("^^^^^^^^^^^^^WHO KNOCKS^^^^^^^^^^^^^^")
-				pass
-			else:
+				return
+			orderBook.applySnapshot(orderList)
+			if self.bookIndexMode == BOOK_INDEX_DELTAS:
 				for orderItem in orderList:
-					orderDto = self.getOrderDto(orderItem, currencyPairSymbol)
+					orderDto = self.getOrderDto(orderItem, currencyPairSymbol, stamp)
 					print (orderDto)
 					postedDto = self.postDto(orderDto)
 					if postedDto == False:
@@ -315,56 +423,69 @@ class Bitfinex:
 		elif len(dataJson) == 4:
 			dataSet = dataJson[1:]
 			# print (currencyPairSymbol)
-			curDto = self.getOrderDto(dataSet, currencyPairSymbol)
-			postedDto = self.postDto(curDto)
-			if postedDto == False:
-				raise IOError("Unable to add new document to ES..." )
+			orderBook.applyUpdate(dataSet[0], dataSet[1], dataSet[2])
+			if self.bookIndexMode == BOOK_INDEX_DELTAS:
+				curDto = self.getOrderDto(dataSet, currencyPairSymbol, stamp)
+				postedDto = self.postDto(curDto)
+				if postedDto == False:
+					raise IOError("Unable to add new document to ES..." )
 		else:
 			raise IOError("Invalid orderbook item")
+		if self.bookIndexMode == BOOK_INDEX_SNAPSHOT:
+			self.indexOrderBookSnapshot(orderBook, stamp=stamp)
 
+	# writes the top bookDepth levels of the in-memory book, at most once every bookSnapshotInterval seconds per pair
+	def indexOrderBookSnapshot(self, orderBook, force=False, stamp=None):
+		currencyPairSymbol = orderBook.currencyPair
+		if stamp == None:
+			stamp = FrameStamp()
+		if not force and stamp.seconds - self.lastBookSnapshot.get(currencyPairSymbol, 0) < self.bookSnapshotInterval:
+			return False
+		self.lastBookSnapshot[currencyPairSymbol] = stamp.seconds
+		for level in orderBook.getLevels(self.bookDepth):
+			postedDto = self.postDto(self.getOrderDto(level, currencyPairSymbol, stamp))
+			if postedDto == False:
+				raise IOError("Unable to add new document to ES..." )
+		return True
 
-	def getTickerDto(self, theResult, tickerData, currencyPairSymbol): 
-		tickerDto = {}
-		recordDate = datetime.datetime.now(TIMEZONE)
-		uuidVar = uuid.uuid4()
-		uuidStr = str(uuidVar)
-		tickerDto["uuid"] = str(uuidVar)
-		tickerDto["date"] = recordDate
-		tickerDto["currency_pair"] = currencyPairSymbol
 
+	def getTickerDto(self, theResult, tickerData, currencyPairSymbol, stamp=None): 
+		if stamp == None:
+			stamp = FrameStamp()
 		print (tickerData)
-		bidPrice = float(tickerData[1])
-		bidVol = float(tickerData[2])
-		askPrice = float(tickerData[3])
-		askVol = float(tickerData[4])
-		dailyChange = float(tickerData[5])
-		dailyDelta = float(tickerData[6])
-		lastPrice = float(tickerData[7])
-		volume = float(tickerData[8])
-		highPrice = float(tickerData[9])
-		lowPrice = float(tickerData[10])
-		tickerDto = {}
-		tickerDto["last_price"] = lastPrice
-		tickerDto["volume"] = volume
-		tickerDto["high"] = highPrice
-		tickerDto["ask"] = askPrice
-		tickerDto["low"] = lowPrice
-		tickerDto["bid"] = bidPrice
-		tickerDto["daily_change"] = dailyChange
-		tickerDto["daily_delta"] = dailyDelta
-		tickerDto["ask_volume"] = askVol
-		tickerDto["bid_volume"] = bidVol
-		return tickerDto
+		return TickerRecord(uuid=nextUuid(), date=stamp, currency_pair=currencyPairSymbol, bid=float(tickerData[1]), bid_volume=float(tickerData[2]), ask=float(tickerData[3]), ask_volume=float(tickerData[4]), daily_change=float(tickerData[5]), daily_delta=float(tickerData[6]), last_price=float(tickerData[7]), volume=float(tickerData[8]), high=float(tickerData[9]), low=float(tickerData[10]))
+
+	def getStats(self):
+		stats = self.sink.getStats()
+		stats["symbols"] = len(self.symbols)
+		stats["channels"] = len(self.channelMappings)
+		stats["messages"] = self.messageCount
+		stats["uptime"] = time.time() - self.startedAt
+		stats["last_message_at"] = self.lastMessageAt
+		stats.update(self.reconnects.getStats())
+		return stats
 
 	def run(self):
 		try:
-			resultData = self.ws.recv()
-			self.channelMappings = self.getChannelMappings()
 			while (True):
 				# print ("^__^")
-				resultData = self.ws.recv()
+				try:
+					resultData = self.ws.recv()
+				except (WebSocketException, socket.error) as e:
+					self.reconnect(e.__class__.__name__ + " " + str(e))
+					continue
+				# one clock read per frame, shared by every record built from it
+				stamp = FrameStamp()
+				self.messageCount += 1
+				self.lastMessageAt = stamp.seconds
 				dataJson = json.loads(resultData)
+				if type(dataJson) is dict:
+					self.handleEvent(dataJson)
+					continue
 				theResult = list(dataJson)
+				if stamp.seconds - self.lastCandleSweep >= 1:
+					self.lastCandleSweep = stamp.seconds
+					self.candles.closeExpired(stamp.seconds)
 				try:
 					curChanId = int(theResult[0])
 					# print (curChanId in self.channelMappings)
@@ -375,6 +496,9 @@ class Bitfinex:
 				try:
 					hbCounter = 0
 					chanId = int(theResult[0])
+					if self.firstDataAt == None:
+						self.firstDataAt = stamp.seconds
+						print ("first data " + "%.3f" % (stamp.seconds - self.subscribeSentAt) + " seconds after subscribing")
 					# currencyPairSymbol = str(channelDict[chanId])
 					currencyPairSymbol = str(self.channelMappings[chanId]["pair"])
 					channelType = str(self.channelMappings[chanId]["channel"])
@@ -385,9 +509,11 @@ class Bitfinex:
 							print("HEARTBEAT COUNTER (Trades Channel): " + str(hbCounter))
 					else: 
 						if channelType == "book":
-							self.updateOrderBookIndex(theResult, dataJson, currencyPairSymbol)
+							self.updateOrderBookIndex(theResult, dataJson, currencyPairSymbol, stamp)
 						elif channelType == "trades": 
-							tradesDto = self.getCompletedTradeDto(theResult, dataJson, currencyPairSymbol)
+							tradesDto = self.getCompletedTradeDto(theResult, dataJson, currencyPairSymbol, stamp)
+							if tradesDto != None: 
+								self.addTradesToCandles(tradesDto, currencyPairSymbol)
 							if type(tradesDto) is list: 
 								for dto in tradesDto: 
 									self.postDto(dto, "live_crypto_trades", DEFAULT_DOCTYPE_NAME)
@@ -398,7 +524,7 @@ class Bitfinex:
 								if hbCounter % 10 == 0: 
 									print ('HB INTERVAL OF 10!') 
 						elif channelType == "ticker": 
-							tickerDto = self.getTickerDto(theResult, dataJson, currencyPairSymbol)
+							tickerDto = self.getTickerDto(theResult, dataJson, currencyPairSymbol, stamp)
 							# print("OOOOOO")							
 							# print("OOOOOO")
 							# print("OOOOOO")
@@ -412,10 +538,12 @@ class Bitfinex:
 				except ValueError:
 					pass
 				except KeyError:
-					self.channelMappings = self.getChannelMappings()
+					# data for a channel we never got a subscribed event for, the connection is out of step with us
 					print ("")
-					print ("HORSE SHIT FROM CHANNEL: " + str(channelType))
+					print ("HORSE SHIT FROM CHANNEL: " + str(theResult[0]))
 					print (resultData)
-					raise
+					self.reconnect("data for unknown channel " + str(theResult[0]))
 		except:
 			raise
+		finally:
+			self.sink.close()
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# Author: Joseph Bull ("***Curren*cy*tsea***")
+# Program: bitfinex_orderbook.py
+# Description: In-memory price level order book for the bitfinex book channel (P0 precision)
+# Copyright (c) 2016 currentsea, Joseph Bull
+
+__author__ = "Joseph 'currentsea' Bull"
+__copyright__   = "Copyright 2016, seclorum"
+
+from bisect import bisect_left
+
+# One side of the book.  Prices are kept in an ascending list searched with
+# bisect, the count/amount of each level lives in a dict keyed by price.
+class PriceLadder:
+	def __init__(self, descending=False):
+		self.descending = descending
+		self.prices = []
+		self.levels = {}
+
+	def __len__(self):
+		return len(self.prices)
+
+	def set(self, price, count, amount):
+		if price not in self.levels:
+			self.prices.insert(bisect_left(self.prices, price), price)
+		self.levels[price] = (count, amount)
+
+	def remove(self, price):
+		if price in self.levels:
+			del self.levels[price]
+			del self.prices[bisect_left(self.prices, price)]
+
+	def clear(self):
+		self.prices = []
+		self.levels = {}
+
+	def best(self):
+		if len(self.prices) == 0:
+			return None
+		if self.descending:
+			return self.prices[-1]
+		return self.prices[0]
+
+	# [price, count, amount] from the best price outwards
+	def getLevels(self, depth=None):
+		prices = self.prices
+		if self.descending:
+			prices = prices[::-1] if depth == None else prices[:-depth - 1:-1]
+		elif depth != None:
+			prices = prices[:depth]
+		return [[price, self.levels[price][0], self.levels[price][1]] for price in prices]
+
+class OrderBook:
+	def __init__(self, currencyPair):
+		self.currencyPair = currencyPair
+		self.bids = PriceLadder(descending=True)
+		self.asks = PriceLadder()
+		self.updateCount = 0
+
+	# snapshot is the [[price, count, amount], ...] list sent right after subscribing
+	def applySnapshot(self, snapshot):
+		self.bids.clear()
+		self.asks.clear()
+		for level in snapshot:
+			self.applyUpdate(level[0], level[1], level[2])
+
+	# count == 0 removes the level, the sign of amount tells which side it is on (1 bid, -1 ask)
+	def applyUpdate(self, price, count, amount):
+		price = float(price)
+		count = float(count)
+		amount = float(amount)
+		if amount > 0:
+			side, otherSide = self.bids, self.asks
+		else:
+			side, otherSide = self.asks, self.bids
+		if count == 0:
+			side.remove(price)
+		else:
+			# a level that crossed over can no longer exist on the other side
+			otherSide.remove(price)
+			side.set(price, count, amount)
+		self.updateCount += 1
+
+	def getBestBid(self):
+		return self.bids.best()
+
+	def getBestAsk(self):
+		return self.asks.best()
+
+	def getSpread(self):
+		if len(self.bids) == 0 or len(self.asks) == 0:
+			return None
+		return self.asks.best() - self.bids.best()
+
+	# top depth levels of each side (the whole book if depth is None), bids first
+	def getLevels(self, depth=None):
+		return self.bids.getLevels(depth) + self.asks.getLevels(depth)
@@ -0,0 +1,348 @@
+#!/usr/bin/python3
+# Author: Joseph Bull ("***Curren*cy*tsea***")
+# Program: bitfinex_supervisor.py
+# Description: Runs the bitfinex collector as several worker processes, each with a share of the symbols
+# Copyright (c) 2016 currentsea, Joseph Bull
+
+__author__ = "Joseph 'currentsea' Bull"
+__copyright__   = "Copyright 2016, seclorum"
+
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+
+try:
+	import queue
+except ImportError:
+	# Python 2
+	import Queue as queue
+
+from bitfinex import Bitfinex, getCachedSymbols, DEFAULT_API_URL, DEFAULT_DOCTYPE_NAME, DEFAULT_SYMBOLS_CACHE_PATH
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from es_spool import Spool, DEFAULT_SPOOL_DIR
+
+DEFAULT_WORKER_COUNT = multiprocessing.cpu_count()
+# seconds between the stats reports of a worker, a worker that misses three in a row is restarted
+DEFAULT_STATS_INTERVAL = 10
+DEFAULT_SYMBOLS_REFRESH_INTERVAL = 3600
+# a worker that dies more than maxRestarts times within restartWindow seconds is retired and its symbols go to the others
+DEFAULT_MAX_RESTARTS = 5
+DEFAULT_RESTART_WINDOW = 300
+DEFAULT_RESTART_DELAY = 5
+# seconds a stopped worker gets to flush its bulk sink before it is killed
+DEFAULT_STOP_TIMEOUT = 30
+DEFAULT_SPOOL_ROOT = os.path.join(DEFAULT_SPOOL_DIR, DEFAULT_DOCTYPE_NAME)
+
+def getSpoolDir(spoolRoot, slot):
+	return os.path.join(spoolRoot, "worker-" + str(slot))
+
+# slots that have a spool directory under spoolRoot
+def findSpoolSlots(spoolRoot):
+	slots = []
+	if os.path.isdir(spoolRoot):
+		for fileName in os.listdir(spoolRoot):
+			if fileName.startswith("worker-") and fileName[len("worker-"):].isdigit():
+				slots.append(int(fileName[len("worker-"):]))
+	return sorted(slots)
+
+# SIGTERM unwinds the collector like any other exit, so run() flushes the bulk sink on the way out
+def stopOnTerm(signum, frame):
+	raise SystemExit(0)
+
+# Runs in the worker process: one websocket connection and one bulk sink for
+# the given symbols, plus a thread that sends the collector's stats back.
+# adoptSlots are slots outside the supervisor's slots (retired ones, or left
+# over from a run with more workers) whose spool this worker replays next to
+# its own
+def runWorker(slot, symbols, statsQueue, statsInterval, spoolRoot, options, adoptSlots=()):
+	bitfinex = Bitfinex(symbols=symbols, spoolDir=getSpoolDir(spoolRoot, slot), **options)
+	adopted = []
+	for adoptSlot in adoptSlots:
+		spool = Spool(getSpoolDir(spoolRoot, adoptSlot))
+		spool.startReplayThread(bitfinex.es)
+		adopted.append(spool)
+	def report():
+		while True:
+			time.sleep(statsInterval)
+			statsQueue.put((slot, os.getpid(), time.time(), bitfinex.getStats()))
+	reporter = threading.Thread(target=report, name="bitfinex-stats")
+	reporter.daemon = True
+	reporter.start()
+	signal.signal(signal.SIGTERM, stopOnTerm)
+	try:
+		bitfinex.run()
+	finally:
+		bitfinex.spool.close()
+		for spool in adopted:
+			spool.close()
+
+# Splits the symbols from /v1/symbols across workerCount processes and keeps
+# them running.  A symbol stays on the worker it was given as long as that
+# worker exists, so new symbols, removed symbols and retired workers only
+# restart the workers whose share actually changed.
+class BitfinexSupervisor:
+	def __init__(self, workerCount=DEFAULT_WORKER_COUNT, apiUrl=DEFAULT_API_URL, statsInterval=DEFAULT_STATS_INTERVAL, symbolsRefreshInterval=DEFAULT_SYMBOLS_REFRESH_INTERVAL, maxRestarts=DEFAULT_MAX_RESTARTS, restartWindow=DEFAULT_RESTART_WINDOW, restartDelay=DEFAULT_RESTART_DELAY, spoolRoot=DEFAULT_SPOOL_ROOT, symbolsCachePath=DEFAULT_SYMBOLS_CACHE_PATH, workerOptions=None, stopTimeout=DEFAULT_STOP_TIMEOUT):
+		if workerCount < 1:
+			raise ValueError("workerCount must be at least 1")
+		self.apiUrl = apiUrl
+		self.statsInterval = statsInterval
+		self.symbolsRefreshInterval = symbolsRefreshInterval
+		self.maxRestarts = maxRestarts
+		self.restartWindow = restartWindow
+		self.restartDelay = restartDelay
+		self.stopTimeout = stopTimeout
+		self.spoolRoot = spoolRoot
+		self.symbolsCachePath = symbolsCachePath
+		self.workerOptions = workerOptions or {}
+		self.slots = list(range(workerCount))
+		self.retired = []
+		self.symbols = []
+		self.assignment = {}
+		# (adopter slot, slots it replays the spools of) as last started, see getAdoptionChanges
+		self.adoption = (None, [])
+		self.processes = {}
+		self.startedAt = {}
+		self.nextStart = {}
+		self.restarts = {}
+		self.reports = {}
+		self.statsQueue = multiprocessing.Queue()
+		self.lastSymbolsRefresh = 0
+		self.lastStatsPrint = time.time()
+		self.running = False
+
+	# startup takes the cached list if it is fresh, the periodic refresh always asks the api
+	def getSymbols(self, ttl=None):
+		if ttl == None:
+			ttl = self.symbolsRefreshInterval
+		return [str(symbol) for symbol in getCachedSymbols(self.apiUrl, self.symbolsCachePath, ttl)]
+
+	# returns the slots whose symbols changed
+	def rebalance(self, symbols):
+		symbolSet = set(symbols)
+		placed = set()
+		assignment = {}
+		for slot in self.slots:
+			kept = [symbol for symbol in self.assignment.get(slot, []) if symbol in symbolSet and symbol not in placed]
+			assignment[slot] = kept
+			placed.update(kept)
+		for symbol in symbols:
+			if symbol not in placed:
+				smallest = min(self.slots, key=lambda slot: len(assignment[slot]))
+				assignment[smallest].append(symbol)
+				placed.add(symbol)
+		# even out what removed symbols left behind, moving as few symbols as possible
+		while True:
+			largest = max(self.slots, key=lambda slot: len(assignment[slot]))
+			smallest = min(self.slots, key=lambda slot: len(assignment[slot]))
+			if len(assignment[largest]) - len(assignment[smallest]) <= 1:
+				break
+			assignment[smallest].append(assignment[largest].pop())
+		for slot in self.slots:
+			assignment[slot] = sorted(assignment[slot])
+		changed = [slot for slot in self.slots if assignment[slot] != self.assignment.get(slot)]
+		self.assignment = assignment
+		self.symbols = list(symbols)
+		return changed
+
+	# the spools nobody writes to any more are replayed by the first worker that has symbols
+	def getAdopter(self):
+		for slot in self.slots:
+			if len(self.assignment.get(slot, [])) > 0:
+				return slot
+		return None
+
+	# a live slot without symbols is not an orphan, it can be given symbols (and open its spool) at the next refresh
+	def getOrphanSlots(self):
+		return [slot for slot in findSpoolSlots(self.spoolRoot) if slot not in self.slots]
+
+	# a spool must only ever be open in one process, so when the adopter or the orphans change
+	# the old adopter has to let go of them before anyone opens them again
+	def getAdoptionChanges(self):
+		adopter = self.getAdopter()
+		orphans = self.getOrphanSlots() if adopter != None else []
+		if (adopter, orphans) == self.adoption:
+			return []
+		return [slot for slot in set([self.adoption[0], adopter]) if slot != None]
+
+	def startWorker(self, slot):
+		symbols = self.assignment.get(slot, [])
+		if len(symbols) == 0:
+			# more workers than symbols
+			return None
+		adoptSlots = []
+		if slot == self.getAdopter():
+			adoptSlots = self.getOrphanSlots()
+			self.adoption = (slot, adoptSlots)
+		process = multiprocessing.Process(target=runWorker, name="bitfinex-worker-" + str(slot), args=(slot, symbols, self.statsQueue, self.statsInterval, self.spoolRoot, self.workerOptions, adoptSlots))
+		process.daemon = True
+		process.start()
+		self.processes[slot] = process
+		self.startedAt[slot] = time.time()
+		self.reports.pop(slot, None)
+		print ("STARTED BITFINEX WORKER " + str(slot) + " (PID " + str(process.pid) + ") FOR " + str(len(symbols)) + " SYMBOLS: " + ", ".join(symbols))
+		if len(adoptSlots) > 0:
+			print ("BITFINEX WORKER " + str(slot) + " REPLAYS THE SPOOLS OF SLOTS " + ", ".join([str(adoptSlot) for adoptSlot in adoptSlots]))
+		return process
+
+	# SIGTERM lets the worker flush its sink, it is only killed when that takes longer than stopTimeout
+	def stopWorker(self, slot):
+		if self.adoption[0] == slot:
+			self.adoption = (None, [])
+		process = self.processes.pop(slot, None)
+		if process != None and process.is_alive():
+			process.terminate()
+			process.join(self.stopTimeout)
+			if process.is_alive():
+				print ("!! BITFINEX WORKER " + str(slot) + " DID NOT STOP WITHIN " + str(self.stopTimeout) + " SECONDS, KILLING IT")
+				os.kill(process.pid, signal.SIGKILL)
+				process.join()
+
+	# every worker is stopped before any is started, so a spool is closed by its old owner before the new one opens it
+	def restartWorkers(self, slots):
+		for slot in slots:
+			self.stopWorker(slot)
+		for slot in slots:
+			self.startWorker(slot)
+
+	# a worker is restarted when it exited or stopped reporting, and retired when it keeps dying
+	def checkWorkers(self):
+		now = time.time()
+		for slot in list(self.slots):
+			if len(self.assignment.get(slot, [])) == 0:
+				continue
+			process = self.processes.get(slot)
+			if process != None and process.is_alive():
+				lastReport = self.reports.get(slot, {}).get("reported_at", self.startedAt[slot])
+				if now - lastReport < self.statsInterval * 3:
+					continue
+				print ("!! BITFINEX WORKER " + str(slot) + " SENT NO STATS FOR " + str(int(now - lastReport)) + " SECONDS, RESTARTING IT")
+				self.stopWorker(slot)
+			if process != None:
+				self.processes.pop(slot, None)
+				print ("!! BITFINEX WORKER " + str(slot) + " EXITED WITH CODE " + str(process.exitcode))
+				restarts = [restartTime for restartTime in self.restarts.get(slot, []) if now - restartTime < self.restartWindow]
+				restarts.append(now)
+				self.restarts[slot] = restarts
+				self.nextStart[slot] = now + self.restartDelay
+				if len(restarts) > self.maxRestarts and len(self.slots) > 1:
+					self.retireWorker(slot)
+					continue
+			if now >= self.nextStart.get(slot, 0):
+				self.startWorker(slot)
+
+	def retireWorker(self, slot):
+		print ("!! BITFINEX WORKER " + str(slot) + " DIED " + str(len(self.restarts[slot])) + " TIMES IN " + str(self.restartWindow) + " SECONDS, MOVING ITS SYMBOLS TO THE OTHER WORKERS")
+		self.slots.remove(slot)
+		self.retired.append(slot)
+		self.assignment.pop(slot, None)
+		changed = self.rebalance(self.symbols)
+		# the adopter is restarted so it picks up the spool of the retired slot
+		for slot in self.getAdoptionChanges():
+			if slot not in changed:
+				changed.append(slot)
+		self.restartWorkers(changed)
+
+	def refreshSymbols(self):
+		self.lastSymbolsRefresh = time.time()
+		try:
+			symbols = self.getSymbols(0)
+		except Exception as e:
+			print ("SYMBOLS REFRESH FAILED: " + str(e))
+			return False
+		if sorted(symbols) == sorted(self.symbols):
+			return False
+		changed = self.rebalance(symbols)
+		for slot in self.getAdoptionChanges():
+			if slot not in changed:
+				changed.append(slot)
+		print ("BITFINEX SYMBOLS CHANGED, RESTARTING WORKERS " + ", ".join([str(slot) for slot in changed]))
+		self.restartWorkers(changed)
+		return True
+
+	def drainStats(self):
+		while True:
+			try:
+				slot, pid, reportedAt, stats = self.statsQueue.get_nowait()
+			except queue.Empty:
+				return
+			previous = self.reports.get(slot)
+			stats["pid"] = pid
+			stats["reported_at"] = reportedAt
+			stats["messages_per_second"] = 0.0
+			stats["indexed_per_second"] = 0.0
+			if previous != None and previous["pid"] == pid and reportedAt > previous["reported_at"]:
+				elapsed = reportedAt - previous["reported_at"]
+				stats["messages_per_second"] = (stats["messages"] - previous["messages"]) / elapsed
+				stats["indexed_per_second"] = (stats["indexed"] - previous["indexed"]) / elapsed
+			self.reports[slot] = stats
+
+	def getStats(self):
+		now = time.time()
+		workers = {}
+		total = { "workers": len(self.slots), "alive": 0, "retired": len(self.retired), "symbols": 0, "messages_per_second": 0.0, "indexed_per_second": 0.0, "indexed": 0, "failed": 0, "spooled": 0, "pending": 0, "restarts": 0 }
+		for slot in self.slots:
+			process = self.processes.get(slot)
+			report = self.reports.get(slot, {})
+			worker = dict(report)
+			worker["alive"] = process != None and process.is_alive()
+			worker["symbols"] = len(self.assignment.get(slot, []))
+			worker["restarts"] = len(self.restarts.get(slot, []))
+			worker["report_age"] = now - report["reported_at"] if "reported_at" in report else None
+			workers[slot] = worker
+			if worker["alive"]:
+				total["alive"] += 1
+			total["symbols"] += worker["symbols"]
+			total["restarts"] += worker["restarts"]
+			for key in ["messages_per_second", "indexed_per_second", "indexed", "failed", "spooled", "pending"]:
+				total[key] += report.get(key, 0)
+		return { "workers": workers, "total": total }
+
+	def formatStats(self):
+		stats = self.getStats()
+		total = stats["total"]
+		lines = ["BITFINEX WORKERS: " + str(total["alive"]) + "/" + str(total["workers"]) + " ALIVE (" + str(total["retired"]) + " RETIRED), " + str(total["symbols"]) + " SYMBOLS, " + "%.1f" % total["messages_per_second"] + " MSG/S, " + "%.1f" % total["indexed_per_second"] + " DOCS/S, INDEXED " + str(total["indexed"]) + ", FAILED " + str(total["failed"]) + ", SPOOLED " + str(total["spooled"]) + ", RESTARTS " + str(total["restarts"])]
+		for slot in sorted(stats["workers"]):
+			worker = stats["workers"][slot]
+			lines.append("  WORKER " + str(slot) + ": " + ("ALIVE" if worker["alive"] else "DOWN") + ", " + str(worker["symbols"]) + " SYMBOLS, " + "%.1f" % worker.get("messages_per_second", 0.0) + " MSG/S, PENDING " + str(worker.get("pending", 0)) + ", RECONNECTS " + str(worker.get("outages", 0)) + ", RESTARTS " + str(worker["restarts"]))
+		return "\n".join(lines)
+
+	def run(self):
+		self.running = True
+		self.rebalance(self.getSymbols())
+		self.lastSymbolsRefresh = time.time()
+		for slot in self.slots:
+			self.startWorker(slot)
+		try:
+			while self.running:
+				time.sleep(1)
+				self.drainStats()
+				self.checkWorkers()
+				if time.time() - self.lastSymbolsRefresh >= self.symbolsRefreshInterval:
+					self.refreshSymbols()
+				if time.time() - self.lastStatsPrint >= self.statsInterval:
+					self.lastStatsPrint = time.time()
+					print (self.formatStats())
+		finally:
+			self.stop()
+
+	def stop(self):
+		self.running = False
+		for slot in list(self.processes.keys()):
+			self.stopWorker(slot)
+
+def getArgs():
+	parser = argparse.ArgumentParser(description="Bitfinex collector split across worker processes")
+	parser.add_argument("--workers", type=int, default=DEFAULT_WORKER_COUNT)
+	parser.add_argument("--stats_interval", type=float, default=DEFAULT_STATS_INTERVAL)
+	parser.add_argument("--spool_root", default=DEFAULT_SPOOL_ROOT)
+	return parser.parse_args()
+
+if __name__ == "__main__":
+	args = getArgs()
+	supervisor = BitfinexSupervisor(args.workers, statsInterval=args.stats_interval, spoolRoot=args.spool_root)
+	supervisor.run()
@@ -40,7 +40,7 @@ if hasattr(socket, "TCP_KEEPCNT"):
 _default_timeout = None
 
 __all__ = ["DEFAULT_SOCKET_OPTION", "sock_opt", "setdefaulttimeout", "getdefaulttimeout",
-           "recv", "recv_line", "send"]
+           "recv", "recv_into", "recv_line", "recv_headers", "send"]
 
 class sock_opt(object):
     def __init__(self, sockopt, sslopt):
@@ -91,6 +91,39 @@ def recv(sock, bufsize):
     return bytes
 
 
+def recv_into(sock, buffer, nbytes):
+    """
+    Receive up to nbytes directly into buffer (a bytearray or memoryview)
+    and return how many bytes were read.
+    """
+    if not sock:
+        raise WebSocketConnectionClosedException("socket is already closed.")
+
+    try:
+        if hasattr(sock, "recv_into"):
+            n = sock.recv_into(buffer, nbytes)
+        else:
+            bytes = sock.recv(nbytes)
+            n = 0
+            if bytes:
+                n = len(bytes)
+                buffer[:n] = bytes
+    except socket.timeout as e:
+        message = extract_err_message(e)
+        raise WebSocketTimeoutException(message)
+    except SSLError as e:
+        message = extract_err_message(e)
+        if message == "The read operation timed out":
+            raise WebSocketTimeoutException(message)
+        else:
+            raise
+
+    if not n:
+        raise WebSocketConnectionClosedException("Connection is already closed.")
+
+    return n
+
+
 def recv_line(sock):
     line = []
     while True:
@@ -101,6 +134,29 @@ def recv_line(sock):
     return six.b("").join(line)
 
 
+def recv_headers(sock, bufsize=4096):
+    """
+    Receive an http header block in chunks of bufsize.
+
+    return value: tuple of the header lines, up to and including the empty
+     line that ends them, and the bytes that were received after it.
+    """
+    lines = []
+    data = six.b("")
+    start = 0
+    while True:
+        end = data.find(six.b("\n"), start)
+        if end == -1:
+            data = data[start:] + recv(sock, bufsize)
+            start = 0
+            continue
+        line = data[start:end + 1]
+        start = end + 1
+        lines.append(line)
+        if not line.strip():
+            return lines, data[start:]
+
+
 def send(sock, data):
     if isinstance(data, six.text_type):
         data = data.encode('utf-8')
@@ -9,6 +9,10 @@ import os
 import os.path
 import base64
 import socket
+import hashlib
+import threading
+import zlib
+import time
 try:
     from ssl import SSLError
 except ImportError:
@@ -23,6 +27,11 @@ else:
 
 import uuid
 
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
 if six.PY3:
     from base64 import decodebytes as base64decode
 else:
@@ -31,11 +40,13 @@ else:
 
 # websocket-client
 import websocket as ws
-from websocket._handshake import _create_sec_websocket_key
+from websocket._handshake import _create_sec_websocket_key, _get_handshake_headers
+from websocket._deflate import permessage_deflate
 from websocket._url import parse_url, get_proxy_info
-from websocket._utils import validate_utf8
+from websocket._utils import validate_utf8, decode_utf8
 from websocket._handshake import _validate as _validate_header
 from websocket._http import read_headers
+from websocket._socket import recv_headers
 
 
 # Skip test to access the internet.
@@ -231,6 +242,23 @@ class WebSocketTest(unittest.TestCase):
         HeaderSockMock("data/header02.txt")
         self.assertRaises(ws.WebSocketException, read_headers, HeaderSockMock("data/header02.txt"))
 
+    def testRecvHeadersKeepsUnreadBytes(self):
+        s = SockMock()
+        s.add_packet(six.b("HTTP/1.1 101 Switching Protocols\r\nUpgrade: web"))
+        s.add_packet(six.b("socket\r\n\r\n\x81\x02hi\x81"))
+        lines, unread = recv_headers(s, 16)
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1], six.b("Upgrade: websocket\r\n"))
+        self.assertEqual(unread, six.b("\x81\x02hi\x81"))
+
+        # the frames that came with the handshake response are not lost
+        sock = ws.WebSocket()
+        sock.sock = s
+        sock.frame_buffer.reset(unread)
+        s.add_packet(six.b("\x03bye"))
+        self.assertEqual(sock.recv(), "hi")
+        self.assertEqual(sock.recv(), "bye")
+
     def testSend(self):
         # TODO: add longer frame data
         sock = ws.WebSocket()
@@ -323,6 +351,64 @@ class WebSocketTest(unittest.TestCase):
         with self.assertRaises(ws.WebSocketConnectionClosedException):
             sock.recv()
 
+    def testRecvSeveralFramesInOnePacket(self):
+        sock = ws.WebSocket()
+        s = sock.sock = SockMock()
+        # two unmasked TEXT frames "foo" and "bar", split in the middle of the second header
+        s.add_packet(six.b("\x81\x03foo\x81"))
+        s.add_packet(six.b("\x03bar"))
+        self.assertEqual(sock.recv(), "foo")
+        self.assertEqual(sock.recv(), "bar")
+
+    def testRecvFrameLargerThanBuffer(self):
+        sock = ws.WebSocket()
+        s = sock.sock = SockMock()
+        payload = os.urandom(200000)
+        frame = ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_BINARY, 0, payload)
+        data = frame.format()
+        # deliver it in uneven pieces so the buffer has to grow mid-frame
+        for i in range(0, len(data), 7777):
+            s.add_packet(data[i:i + 7777])
+        s.add_packet(ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_BINARY, 0, six.b("x" * 300)).format())
+        self.assertEqual(sock.recv(), payload)
+        self.assertEqual(sock.recv(), six.b("x" * 300))
+
+    def testRecvIntoSocket(self):
+        sock = ws.WebSocket()
+        s, peer = socket.socketpair()
+        sock.sock = s
+        try:
+            payload = os.urandom(70000)
+            peer.sendall(ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_BINARY, 0, payload).format())
+            peer.sendall(ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b("ok")).format())
+            self.assertEqual(sock.recv(), payload)
+            self.assertEqual(sock.recv(), "ok")
+        finally:
+            s.close()
+            peer.close()
+
+    def testRecvTextSplitBetweenFragments(self):
+        sock = ws.WebSocket()
+        s = sock.sock = SockMock()
+        # "\u03ba\u1f79" with the second character split over the two frames
+        s.add_packet(ws.ABNF(0, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b("\xce\xba\xe1")).format())
+        s.add_packet(ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_CONT, 0, six.b("\xbd\xb9")).format())
+        opcode, frame = sock.recv_data_frame()
+        self.assertEqual(frame.data, six.b("\xce\xba\xe1\xbd\xb9"))
+        if six.PY3:
+            self.assertEqual(frame.text, u"\u03ba\u1f79")
+        s.add_packet(ws.ABNF(0, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b("\xce\xba\xe1")).format())
+        s.add_packet(ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_CONT, 0, six.b("\xbd\xb9")).format())
+        self.assertEqual(sock.recv(), six.u("\u03ba\u1f79") if six.PY3 else six.b("\xce\xba\xe1\xbd\xb9"))
+
+    def testRecvInvalidUtf8(self):
+        sock = ws.WebSocket()
+        s = sock.sock = SockMock()
+        s.add_packet(ws.ABNF(0, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b("\xce\xba\xe1")).format())
+        s.add_packet(ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_CONT, 0, six.b("\x41")).format())
+        with self.assertRaises(ws.WebSocketPayloadException):
+            sock.recv()
+
     def testRecvWithFireEventOfFragmentation(self):
         sock = ws.WebSocket(fire_cont_frame=True)
         s = sock.sock = SockMock()
@@ -544,6 +630,304 @@ class WebSocketAppTest(unittest.TestCase):
         self.assertEqual(WebSocketAppTest.get_mask_key_id, id(my_mask_key_func))
 
 
+def serve_websocket(listener, data):
+    """
+    Accept one client on listener, answer its handshake and send data
+    in the same write as the response.
+    """
+    conn, _ = listener.accept()
+    request = six.b("")
+    while six.b("\r\n\r\n") not in request:
+        request += conn.recv(4096)
+    key = [line.split(six.b(":"), 1)[1].strip() for line in request.split(six.b("\r\n"))
+           if line.lower().startswith(six.b("sec-websocket-key:"))][0]
+    accept = base64.b64encode(hashlib.sha1(key + six.b("258EAFA5-E914-47DA-95CA-C5AB0DC85B11")).digest())
+    conn.sendall(six.b("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                       "Connection: Upgrade\r\nSec-WebSocket-Accept: ") + accept + six.b("\r\n\r\n") + data)
+    return conn
+
+
+class WebSocketServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.listeners = []
+        self.conns = []
+
+    def tearDown(self):
+        for sock in self.listeners + self.conns:
+            sock.close()
+
+    def start_server(self, data):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        self.listeners.append(listener)
+        thread = threading.Thread(target=lambda: self.conns.append(serve_websocket(listener, data)))
+        thread.daemon = True
+        thread.start()
+        return "ws://127.0.0.1:%d/" % listener.getsockname()[1]
+
+
+class WebSocketLoopTest(WebSocketServerTestCase):
+
+    def run_loop(self, loop):
+        timer = threading.Timer(5, loop.stop)
+        timer.start()
+        try:
+            loop.run_forever()
+        finally:
+            timer.cancel()
+
+    def testHasFrame(self):
+        buf = ws._abnf.frame_buffer(None, False)
+        data = ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_BINARY, 1, six.b("x" * 300)).format()
+        for i in range(len(data)):
+            buf.reset(data[:i])
+            self.assertFalse(buf.has_frame())
+        buf.reset(data)
+        self.assertTrue(buf.has_frame())
+        self.assertEqual(buf.recv_frame().data, six.b("x" * 300))
+        self.assertFalse(buf.has_frame())
+
+    def testManyConnections(self):
+        loop = ws.WebSocketLoop()
+        received = []
+        closed = []
+
+        def on_message(app, message):
+            received.append((app.url, message))
+
+        def on_close(app):
+            closed.append(app.url)
+            if len(closed) == 3:
+                loop.stop()
+
+        urls = []
+        for i in range(3):
+            data = ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b("hello %d" % i)).format()
+            data += ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_PING, 0, six.b("p")).format()
+            data += ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_CLOSE, 0, six.b("\x03\xe8")).format()
+            urls.append(self.start_server(data))
+            loop.add(ws.WebSocketApp(urls[-1], on_message=on_message, on_close=on_close))
+        self.run_loop(loop)
+
+        self.assertEqual(sorted(received), sorted([(url, "hello %d" % i) for i, url in enumerate(urls)]))
+        self.assertEqual(sorted(closed), sorted(urls))
+        # every client answered the ping before the close
+        for conn in self.conns:
+            frames = ws._abnf.frame_buffer(conn.recv, True)
+            self.assertEqual(frames.recv_frame().opcode, ws.ABNF.OPCODE_PONG)
+            self.assertEqual(frames.recv_frame().opcode, ws.ABNF.OPCODE_CLOSE)
+
+    def testPingTimeout(self):
+        loop = ws.WebSocketLoop()
+        errors = []
+
+        def on_close(app):
+            loop.stop()
+
+        url = self.start_server(six.b(""))
+        loop.add(ws.WebSocketApp(url, on_error=lambda app, e: errors.append(e), on_close=on_close),
+                 ping_interval=0.1, ping_timeout=0.05)
+        self.run_loop(loop)
+
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(isinstance(errors[0], ws.WebSocketTimeoutException))
+        frames = ws._abnf.frame_buffer(self.conns[0].recv, True)
+        self.assertEqual(frames.recv_frame().opcode, ws.ABNF.OPCODE_PING)
+
+
+class WebSocketAppRunForeverTest(WebSocketServerTestCase):
+
+    def run_app(self, url, count):
+        received = []
+        done = threading.Event()
+
+        def on_message(app, message):
+            received.append(message)
+            if len(received) == count:
+                done.set()
+
+        app = ws.WebSocketApp(url, on_message=on_message)
+        thread = threading.Thread(target=app.run_forever)
+        thread.daemon = True
+        thread.start()
+        # the server sends nothing more, so every frame has to come out of the receive buffer
+        done.wait(2)
+        app.keep_running = False
+        for conn in self.conns:
+            conn.close()
+        thread.join(5)
+        return received
+
+    def get_frames(self, *messages):
+        return six.b("").join([ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b(message)).format() for message in messages])
+
+    def testFramesSentWithTheHandshakeResponse(self):
+        url = self.start_server(self.get_frames("one"))
+        self.assertEqual(self.run_app(url, 1), ["one"])
+
+    def testFramesSentInOneWrite(self):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        self.listeners.append(listener)
+
+        def serve():
+            conn = serve_websocket(listener, six.b(""))
+            self.conns.append(conn)
+            time.sleep(0.2)
+            conn.sendall(self.get_frames("one", "two", "three"))
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        url = "ws://127.0.0.1:%d/" % listener.getsockname()[1]
+        self.assertEqual(self.run_app(url, 3), ["one", "two", "three"])
+
+
+class PermessageDeflateTest(unittest.TestCase):
+
+    def compressed_frames(self, messages, fragment=None):
+        """
+        Server side: deflate messages in one context and frame them.
+        """
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        data = six.b("")
+        for message in messages:
+            payload = compressor.compress(message) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            payload = payload[:-4]
+            if fragment:
+                data += ws.ABNF(0, 1, 0, 0, ws.ABNF.OPCODE_TEXT, 0, payload[:fragment]).format()
+                data += ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_CONT, 0, payload[fragment:]).format()
+            else:
+                data += ws.ABNF(1, 1, 0, 0, ws.ABNF.OPCODE_TEXT, 0, payload).format()
+        return data
+
+    def testAccept(self):
+        deflate = permessage_deflate.accept("permessage-deflate")
+        self.assertEqual((deflate.server_no_context_takeover, deflate.client_max_window_bits), (False, 15))
+        deflate = permessage_deflate.accept("permessage-deflate; server_no_context_takeover; client_max_window_bits=10")
+        self.assertEqual((deflate.server_no_context_takeover, deflate.client_max_window_bits), (True, 10))
+        deflate = permessage_deflate.accept("permessage-deflate; client_max_window_bits=8")
+        self.assertFalse(deflate.compress_enabled)
+        for value in ("x-webkit-deflate-frame", "permessage-deflate; foo",
+                      "permessage-deflate; server_max_window_bits=16",
+                      "permessage-deflate, permessage-deflate"):
+            self.assertRaises(ws.WebSocketException, permessage_deflate.accept, value)
+
+    def testOffer(self):
+        headers, key = _get_handshake_headers("/", "example.com", 80, {"permessage_deflate": True})
+        self.assertTrue("Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits" in headers)
+        headers, key = _get_handshake_headers("/", "example.com", 80, {})
+        self.assertFalse([h for h in headers if h.startswith("Sec-WebSocket-Extensions")])
+
+    def testRecvWithContextTakeover(self):
+        messages = [six.b('{"event":"info"}'), six.b('{"event":"info","version":1}') * 3]
+        sock = ws.WebSocket()
+        s = sock.sock = SockMock()
+        sock.set_deflate(permessage_deflate())
+        s.add_packet(self.compressed_frames(messages))
+        s.add_packet(self.compressed_frames([six.b("x" * 1000)], fragment=3))
+        for message in messages + [six.b("x" * 1000)]:
+            self.assertEqual(sock.recv(), message.decode("utf-8") if six.PY3 else message)
+
+    def testRsv1NeedsNegotiation(self):
+        sock = ws.WebSocket()
+        s = sock.sock = SockMock()
+        s.add_packet(self.compressed_frames([six.b("hello")]))
+        self.assertRaises(ws.WebSocketProtocolException, sock.recv)
+
+    def testSend(self):
+        sock = ws.WebSocket()
+        s = sock.sock = SockMock()
+        sock.set_deflate(permessage_deflate(client_no_context_takeover=True))
+        sock.send("hello")
+        sock.send("hello")
+        frames = ws._abnf.frame_buffer(SockMock().recv, True)
+        frames.allow_rsv1 = True
+        for sent in s.sent:
+            frames.reset(sent)
+            frame = frames.recv_frame()
+            self.assertEqual(frame.rsv1, 1)
+            decompressor = zlib.decompressobj(-15)
+            self.assertEqual(decompressor.decompress(frame.data + six.b("\x00\x00\xff\xff")), six.b("hello"))
+
+
+@unittest.skipUnless(sys.version_info >= (3, 5), "the asyncio client needs python 3.5")
+class AsyncWebSocketTest(WebSocketServerTestCase):
+
+    def setUp(self):
+        WebSocketServerTestCase.setUp(self)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        WebSocketServerTestCase.tearDown(self)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(asyncio.wait_for(coroutine, 5))
+
+    def testRecv(self):
+        data = ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b("hello")).format()
+        data += ws.ABNF(0, 0, 0, 0, ws.ABNF.OPCODE_TEXT, 0, six.b("\xce\xba\xe1")).format()
+        data += ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_PING, 0, six.b("p")).format()
+        data += ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_CONT, 0, six.b("\xbd\xb9")).format()
+        data += ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_BINARY, 0, six.b("x" * 70000)).format()
+        data += ws.ABNF(1, 0, 0, 0, ws.ABNF.OPCODE_CLOSE, 0, six.b("\x03\xe8")).format()
+        url = self.start_server(data)
+
+        sock = self.run_async(ws.create_async_connection(url))
+        self.assertEqual(sock.handshake_response.status, 101)
+        self.assertEqual(self.run_async(sock.__anext__()), "hello")
+        self.assertEqual(self.run_async(sock.__anext__()), u"\u03ba\u1f79")
+        self.assertEqual(self.run_async(sock.recv()), six.b("x" * 70000))
+        with self.assertRaises(StopAsyncIteration):
+            self.run_async(sock.__anext__())
+        self.run_async(sock.close())
+
+        # the ping was answered and the close frame echoed
+        frames = ws._abnf.frame_buffer(self.conns[0].recv, True)
+        self.assertEqual(frames.recv_frame().opcode, ws.ABNF.OPCODE_PONG)
+        self.assertEqual(frames.recv_frame().opcode, ws.ABNF.OPCODE_CLOSE)
+
+    def testSend(self):
+        url = self.start_server(six.b(""))
+        sock = self.run_async(ws.create_async_connection(url))
+        self.run_async(sock.send("hi"))
+        self.run_async(sock.send_binary(six.b("\x00\x01")))
+        self.run_async(sock.close(timeout=0.1))
+
+        frames = ws._abnf.frame_buffer(self.conns[0].recv, True)
+        frame = frames.recv_frame()
+        self.assertEqual((frame.opcode, frame.data), (ws.ABNF.OPCODE_TEXT, six.b("hi")))
+        frame = frames.recv_frame()
+        self.assertEqual((frame.opcode, frame.data), (ws.ABNF.OPCODE_BINARY, six.b("\x00\x01")))
+        self.assertEqual(frames.recv_frame().opcode, ws.ABNF.OPCODE_CLOSE)
+
+
+class MaskTest(unittest.TestCase):
+
+    def _mask_reference(self, mask_key, data):
+        key = bytearray(mask_key)
+        return bytes(bytearray(b ^ key[i % 4] for i, b in enumerate(bytearray(data))))
+
+    def testMask(self):
+        mask_key = six.b("abcd")
+        for length in (0, 1, 3, 4, 5, 127, 4095, 4096, 4097, 65537):
+            data = os.urandom(length)
+            self.assertEqual(ws.ABNF.mask(mask_key, data), self._mask_reference(mask_key, data))
+
+    def testMaskText(self):
+        self.assertEqual(ws.ABNF.mask("abcd", "hello"), six.b("\x09\x07\x0f\x08\x0e"))
+        self.assertEqual(ws.ABNF.mask(six.b("abcd"), None), six.b(""))
+
+    def testMaskRoundTrip(self):
+        mask_key = os.urandom(4)
+        data = os.urandom(100000)
+        self.assertEqual(ws.ABNF.mask(mask_key, ws.ABNF.mask(mask_key, data)), data)
+
+
 class SockOptTest(unittest.TestCase):
     @unittest.skipUnless(TEST_WITH_INTERNET, "Internet-requiring tests are disabled")
     def testSockOpt(self):
@@ -560,6 +944,18 @@ class UtilsTest(unittest.TestCase):
         self.assertEqual(state, False)
         state = validate_utf8(six.b(''))
         self.assertEqual(state, True)
+        # an incomplete sequence at the end may be finished by the next fragment
+        state = validate_utf8(six.b('abc\xf0\x90\x80'))
+        self.assertEqual(state, True)
+        state = validate_utf8(six.b('abc\xf0\x90\x80abc'))
+        self.assertEqual(state, False)
+
+    @unittest.skipUnless(six.PY3, "text is only decoded on python 3")
+    def testDecodeUtf8(self):
+        self.assertEqual(decode_utf8(six.b('\xce\xba\xe1\xbd\xb9')), (True, u'\u03ba\u1f79'))
+        self.assertEqual(decode_utf8(six.b('\xed\xa0\x80')), (False, None))
+        self.assertEqual(decode_utf8(six.b('\xe1\xbd')), (True, None))
+        self.assertEqual(decode_utf8(six.b('\xe1\xbd\x41')), (False, None))
 
 class ProxyInfoTest(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Buffers DTOs and writes them to elasticsearch through the _bulk API instead
+# of doing one es.create round trip per document.  A batch is flushed when it
+# holds maxDocs documents, when it grows past maxBytes of request body, or when
+# the oldest buffered document has waited maxLatency seconds.  If a spool is
+# given, documents the cluster could not take right now are written to it
+# instead of being reported as failed.  Document ids are chosen by idStrategy,
+# see doc_ids.py.
+
+import time, threading, elasticsearch
+from es_spool import isRetryable
+from records import toSource, encodeString
+from doc_ids import getDocumentId, getActionPrefix, getBulkAction, DEFAULT_ID_STRATEGY, CONFLICT_STATUS
+
+DEFAULT_BULK_MAX_DOCS = 500
+DEFAULT_BULK_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BULK_MAX_LATENCY = 1.0
+
+class BulkSink:
+	def __init__(self, es, maxDocs=DEFAULT_BULK_MAX_DOCS, maxBytes=DEFAULT_BULK_MAX_BYTES, maxLatency=DEFAULT_BULK_MAX_LATENCY, onFailure=None, spool=None, idStrategy=DEFAULT_ID_STRATEGY):
+		self.es = es
+		self.maxDocs = maxDocs
+		self.maxBytes = maxBytes
+		self.maxLatency = maxLatency
+		if onFailure == None:
+			onFailure = self.logFailure
+		self.onFailure = onFailure
+		self.spool = spool
+		self.idStrategy = idStrategy
+		self.serializer = es.transport.serializer
+		self.lock = threading.RLock()
+		# signalled when a batch another thread took has been sent and counted
+		self.landed = threading.Condition(self.lock)
+		self.sending = 0
+		self.timer = None
+		self.batch = []
+		self.batchBytes = 0
+		# the action line only differs in its _id, the part before it (or the whole line without one) is built once per index/type
+		self.actions = {}
+		self.docsIndexed = 0
+		self.docsFailed = 0
+		self.docsSpooled = 0
+		self.docsDuplicate = 0
+		self.flushCount = 0
+
+	def add(self, dto, indexName, docType, docId=None):
+		if docId == None:
+			docId = getDocumentId(self.idStrategy, docType, dto)
+		with self.lock:
+			actions = self.actions.get((indexName, docType))
+			if actions == None:
+				actions = (getActionPrefix(indexName, docType), getBulkAction(indexName, docType, None))
+				self.actions[(indexName, docType)] = actions
+		if docId == None:
+			action = actions[1]
+		else:
+			action = actions[0] + encodeString(str(docId)) + "}}"
+		body = action + "\n" + toSource(dto, self.serializer) + "\n"
+		full = False
+		with self.lock:
+			self.batch.append((indexName, docType, docId, dto, body))
+			self.batchBytes += len(body)
+			if len(self.batch) >= self.maxDocs or self.batchBytes >= self.maxBytes:
+				full = True
+			elif self.timer == None:
+				self.timer = threading.Timer(self.maxLatency, self.flush)
+				self.timer.daemon = True
+				self.timer.start()
+		# flushed outside the lock, so the other producers keep adding while this batch is on its way
+		if full:
+			self.flush()
+		return True
+
+	def flush(self):
+		with self.lock:
+			if self.timer != None:
+				self.timer.cancel()
+				self.timer = None
+			batch = self.batch
+			self.batch = []
+			self.batchBytes = 0
+			if len(batch) == 0:
+				# a batch the timer took may still be on its way, the counters include it once this returns
+				while self.sending > 0:
+					self.landed.wait()
+				return 0
+			self.sending += 1
+		# the counters are summed up here and applied under the lock in one go, another thread may be flushing too
+		counts = (0, 0, 0, 0)
+		try:
+			counts = self.sendBatch(batch)
+		finally:
+			indexed, failed, spooled, duplicate = counts
+			with self.lock:
+				self.sending -= 1
+				self.flushCount += 1
+				self.docsIndexed += indexed
+				self.docsFailed += failed
+				self.docsSpooled += spooled
+				self.docsDuplicate += duplicate
+				self.landed.notify_all()
+		return indexed
+
+	# returns how many documents of batch were indexed, failed, spooled and already in the index
+	def sendBatch(self, batch):
+		try:
+			response = self.es.bulk(body="".join([item[4] for item in batch]))
+		except elasticsearch.exceptions.TransportError as e:
+			if self.spool != None and isRetryable(e):
+				self.spool.appendBody("".join([item[4] for item in batch]))
+				return 0, 0, len(batch), 0
+			# the whole request failed, hand every document back to the caller
+			for item in batch:
+				self.onFailure(item[0], item[1], item[2], item[3], str(e))
+			return 0, len(batch), 0, 0
+		if response.get("errors", False) == False:
+			return len(batch), 0, 0, 0
+		indexed = failed = spooled = duplicate = 0
+		# only the items that failed are reported, the rest of the batch was written
+		for item, result in zip(batch, response["items"]):
+			status = list(result.values())[0]
+			if status.get("status", 500) < 300:
+				indexed += 1
+			elif status.get("status") == CONFLICT_STATUS:
+				# a content id that is already in the index, written by an earlier attempt
+				duplicate += 1
+			elif self.spool != None and isRetryable(status.get("status")):
+				self.spool.appendBody(item[4])
+				spooled += 1
+			else:
+				failed += 1
+				self.onFailure(item[0], item[1], item[2], item[3], status.get("error"))
+		return indexed, failed, spooled, duplicate
+
+	def close(self):
+		return self.flush()
+
+	def logFailure(self, indexName, docType, docId, dto, error):
+		print("!! FATAL !!: BULK ENTRY " + str(docId) + " NOT ADDED TO " + indexName + "/" + docType + ": " + str(error))
+
+	def getStats(self):
+		with self.lock:
+			return { "indexed": self.docsIndexed, "failed": self.docsFailed, "spooled": self.docsSpooled, "duplicate": self.docsDuplicate, "pending": len(self.batch), "flushes": self.flushCount }
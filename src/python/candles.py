@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Builds OHLCV candles from the normalized trade stream of any exchange so we
+# do not depend on (or pay for) the exchange's own kline channels.  Each trade
+# updates one open candle per interval, which is O(1) per trade.  A candle is
+# handed to onCandle(currencyPair, intervalName, candle, closed) when the first
+# trade of the next bucket arrives or closeExpired() sees that its time is up.
+# If openCandleInterval is set, the open candles of a pair are also published
+# at most once every openCandleInterval seconds while they are still building.
+# Once a candle is published as closed its bucket stays closed, a late trade
+# for it (or for any earlier bucket) is dropped instead of opening it again.
+
+import time, datetime, pytz
+from records import CandleRecord, nextUuid
+
+TIMEZONE = pytz.timezone("UTC")
+
+# interval names follow the okcoin kline channel suffixes
+CANDLE_INTERVALS = [
+	("1min", 60), ("3min", 180), ("5min", 300), ("15min", 900), ("30min", 1800),
+	("1hour", 3600), ("2hour", 7200), ("4hour", 14400), ("6hour", 21600), ("12hour", 43200),
+	("day", 86400), ("3day", 259200), ("week", 604800)
+]
+# 1970-01-01 was a thursday, shift weekly buckets so they start on monday 00:00 UTC
+WEEK_OFFSET = 4 * 86400
+DEFAULT_OPEN_CANDLE_INTERVAL = None
+
+class Candle:
+	__slots__ = ["start", "seconds", "open", "high", "low", "close", "volume", "trades"]
+
+	def __init__(self, start, seconds, price, volume):
+		self.start = start
+		self.seconds = seconds
+		self.open = price
+		self.high = price
+		self.low = price
+		self.close = price
+		self.volume = volume
+		self.trades = 1
+
+	def add(self, price, volume):
+		if price > self.high:
+			self.high = price
+		elif price < self.low:
+			self.low = price
+		self.close = price
+		self.volume += volume
+		self.trades += 1
+
+class CandleAggregator:
+	def __init__(self, onCandle, intervals=CANDLE_INTERVALS, openCandleInterval=DEFAULT_OPEN_CANDLE_INTERVAL):
+		self.onCandle = onCandle
+		self.intervals = []
+		for name, seconds in intervals:
+			offset = WEEK_OFFSET if seconds == 604800 else 0
+			self.intervals.append((name, seconds, offset))
+		self.openCandleInterval = openCandleInterval
+		self.candles = {}
+		self.lastOpenPublish = {}
+		# (pair, interval name) -> start of the last candle published as closed
+		self.closedStarts = {}
+
+	# timestamp is in unix seconds, volume is the absolute traded amount
+	def addTrade(self, currencyPair, timestamp, price, volume):
+		timestamp = float(timestamp)
+		price = float(price)
+		volume = abs(float(volume))
+		for name, seconds, offset in self.intervals:
+			start = timestamp - (timestamp - offset) % seconds
+			key = (currencyPair, name)
+			if start <= self.closedStarts.get(key, -1):
+				continue
+			candle = self.candles.get(key)
+			if candle == None:
+				self.candles[key] = Candle(start, seconds, price, volume)
+			elif candle.start == start:
+				candle.add(price, volume)
+			elif start > candle.start:
+				self.closeCandle(key, candle)
+				self.candles[key] = Candle(start, seconds, price, volume)
+			# trades older than the open candle belong to a bar that is already published and are dropped
+		if self.openCandleInterval != None:
+			now = time.time()
+			if now - self.lastOpenPublish.get(currencyPair, 0) >= self.openCandleInterval:
+				self.lastOpenPublish[currencyPair] = now
+				for name, seconds, offset in self.intervals:
+					candle = self.candles.get((currencyPair, name))
+					if candle != None:
+						self.onCandle(currencyPair, name, candle, False)
+
+	# publishes and forgets candles whose interval has ended, for pairs that stopped trading
+	def closeExpired(self, now=None):
+		if now == None:
+			now = time.time()
+		closed = 0
+		for key in list(self.candles.keys()):
+			candle = self.candles[key]
+			if candle.start + candle.seconds <= now:
+				del self.candles[key]
+				self.closeCandle(key, candle)
+				closed += 1
+		return closed
+
+	def closeCandle(self, key, candle):
+		self.closedStarts[key] = candle.start
+		self.onCandle(key[0], key[1], candle, True)
+
+def getCandleDto(currencyPair, intervalName, candle, closed):
+	return CandleRecord(uuid=nextUuid(), date=datetime.datetime.fromtimestamp(candle.start, TIMEZONE), timestamp=str(int(candle.start * 1000)), open_price=candle.open, highest_price=candle.high, lowest_price=candle.low, close_price=candle.close, volume=candle.volume, trade_count=candle.trades, closed=closed, currency_symbol=str(currencyPair), contract_type=intervalName)
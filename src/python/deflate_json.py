@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# OKCoin sends every websocket message as a raw deflate stream holding a JSON
+# array of {"channel": ..., "data": ...} items.  DeflateJsonDecoder inflates
+# it with a single zlib call whose output buffer is sized from the largest
+# message seen so far, decodes the text once and then parses the array one
+# item at a time, so the first channel is routed before the rest of a large
+# push has been parsed.  The time spent inflating, decoding, parsing and in
+# the caller's handling of each item is added up and returned by getStats().
+
+import zlib, json, time
+
+DEFAULT_INFLATE_BUFFER_SIZE = 16 * 1024
+WHITESPACE = " \t\n\r"
+
+# perf_counter is python 3 only
+clock = getattr(time, "perf_counter", time.time)
+
+class DeflateJsonDecoder:
+	def __init__(self, bufferSize=DEFAULT_INFLATE_BUFFER_SIZE):
+		self.bufferSize = bufferSize
+		self.jsonDecoder = json.JSONDecoder()
+		self.messages = 0
+		self.items = 0
+		self.bytesIn = 0
+		self.bytesOut = 0
+		self.inflateSeconds = 0.0
+		self.decodeSeconds = 0.0
+		self.parseSeconds = 0.0
+		self.routeSeconds = 0.0
+
+	def inflate(self, data):
+		start = clock()
+		try:
+			inflated = zlib.decompress(data, -zlib.MAX_WBITS, self.bufferSize)
+		except zlib.error:
+			# a stream cut at a sync flush has no final block, only a decompressobj accepts it
+			decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+			inflated = decompressor.decompress(data) + decompressor.flush()
+		if len(inflated) > self.bufferSize:
+			self.bufferSize = len(inflated)
+		self.inflateSeconds += clock() - start
+		self.bytesIn += len(data)
+		self.bytesOut += len(inflated)
+		return inflated
+
+	def decode(self, data):
+		start = clock()
+		text = data.decode("utf-8")
+		self.decodeSeconds += clock() - start
+		return text
+
+	# yields the items of one message, binary messages are inflated first
+	def iterItems(self, data):
+		self.messages += 1
+		if isinstance(data, bytes):
+			data = self.inflate(data)
+			data = self.decode(data)
+		start = clock()
+		index = self.skipWhitespace(data, 0)
+		if index == len(data) or data[index] != "[":
+			# not an array, hand over whatever it is as a single item
+			item = json.loads(data)
+			self.parseSeconds += clock() - start
+			self.items += 1
+			routeStart = clock()
+			yield item
+			self.routeSeconds += clock() - routeStart
+			return
+		index = self.skipWhitespace(data, index + 1)
+		while index < len(data) and data[index] != "]":
+			item, index = self.jsonDecoder.raw_decode(data, index)
+			index = self.skipWhitespace(data, index)
+			if index < len(data) and data[index] == ",":
+				index = self.skipWhitespace(data, index + 1)
+			self.parseSeconds += clock() - start
+			self.items += 1
+			routeStart = clock()
+			yield item
+			start = clock()
+			self.routeSeconds += start - routeStart
+		self.parseSeconds += clock() - start
+
+	def skipWhitespace(self, data, index):
+		while index < len(data) and data[index] in WHITESPACE:
+			index += 1
+		return index
+
+	# cumulative seconds per stage plus the average microseconds per message
+	def getStats(self):
+		stats = { "messages": self.messages, "items": self.items, "bytes_in": self.bytesIn, "bytes_out": self.bytesOut, "inflate": self.inflateSeconds, "decode": self.decodeSeconds, "parse": self.parseSeconds, "route": self.routeSeconds }
+		for stage in ["inflate", "decode", "parse", "route"]:
+			stats[stage + "_us_per_message"] = stats[stage] * 1000000 / max(self.messages, 1)
+		return stats
+
+	def formatStats(self):
+		stats = self.getStats()
+		return "DECODED " + str(stats["messages"]) + " MESSAGES (" + str(stats["items"]) + " ITEMS, " + str(stats["bytes_in"]) + " -> " + str(stats["bytes_out"]) + " BYTES), US PER MESSAGE: " + ", ".join([stage + " " + "%.1f" % stats[stage + "_us_per_message"] for stage in ["inflate", "decode", "parse", "route"]])
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# How the elasticsearch _id of a document is chosen.
+#   content - a sha1 of the doc type and the fields that identify the document
+#             (ID_FIELDS of a record, or every field but uuid of a plain dict),
+#             so writing the same document twice is a 409 conflict instead of
+#             a duplicate and retries and spool replays are safe
+#   auto    - no _id is sent and elasticsearch generates one, which takes its
+#             cheaper append-only path but a retried request can duplicate
+#   random  - a new random id per document, the old behaviour
+# A 409 on create means the document is already in the index, so it is
+# treated as written rather than as a failure.
+
+import hashlib
+from records import Record, FrameStamp, nextUuid, encodeString
+
+ID_CONTENT = "content"
+ID_AUTO = "auto"
+ID_RANDOM = "random"
+ID_STRATEGIES = [ID_CONTENT, ID_AUTO, ID_RANDOM]
+DEFAULT_ID_STRATEGY = ID_CONTENT
+
+CONFLICT_STATUS = 409
+
+def getKeyString(value):
+	if type(value) is FrameStamp:
+		return value.json
+	if type(value) is float:
+		return repr(value)
+	return str(value)
+
+def getContentId(docType, dto, keyFields=None):
+	if isinstance(dto, Record):
+		values = [getattr(dto, field) for field in dto.ID_FIELDS]
+	else:
+		if keyFields == None:
+			keyFields = sorted([field for field in dto if field != "uuid"])
+		values = [dto.get(field) for field in keyFields]
+	key = "|".join([str(docType)] + [getKeyString(value) for value in values])
+	return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+# None means "let elasticsearch pick the id"
+def getDocumentId(strategy, docType, dto, keyFields=None):
+	if strategy == ID_CONTENT:
+		return getContentId(docType, dto, keyFields)
+	if strategy == ID_AUTO:
+		return None
+	if strategy == ID_RANDOM:
+		return nextUuid()
+	raise ValueError("id strategy must be one of " + ", ".join(ID_STRATEGIES))
+
+# everything of a create action line up to the _id value
+def getActionPrefix(indexName, docType):
+	return '{"create":{"_index":' + encodeString(indexName) + ',"_type":' + encodeString(docType) + ',"_id":'
+
+# a document without an id is sent as an index action so elasticsearch generates one
+def getBulkAction(indexName, docType, docId):
+	if docId == None:
+		return '{"index":{"_index":' + encodeString(indexName) + ',"_type":' + encodeString(docType) + '}}'
+	return getActionPrefix(indexName, docType) + encodeString(str(docId)) + "}}"
+
+def isWritten(response):
+	if response.get("status") == CONFLICT_STATUS:
+		return True
+	return response.get("created") == True or response.get("result") in ["created", "updated"]
+
+# single document write for the scripts that do not batch, TransportErrors are left to the caller
+def writeDocument(es, indexName, docType, docId, body):
+	if isinstance(body, Record):
+		body = body.toJson()
+	if docId == None:
+		response = es.index(index=indexName, doc_type=docType, ignore=[400], body=body)
+	else:
+		response = es.create(index=indexName, doc_type=docType, ignore=[400, CONFLICT_STATUS], id=docId, body=body)
+	return isWritten(response)
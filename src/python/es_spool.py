@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Append-only local spool for documents that could not be written because the
+# elasticsearch cluster was unreachable.  Documents are stored as ready-made
+# _bulk action/source line pairs in numbered segment files, so replaying them
+# is a straight read of the file into bulk requests with no re-serialization.
+#
+#   spoolDir/segment-0000000001.ndjson   oldest segment, replayed first
+#   spoolDir/segment-0000000002.ndjson   ...
+#   spoolDir/offset                      "<segment> <byte offset>" of the next record to replay
+#
+# The offset file is replaced atomically after every acknowledged bulk request
+# so a crash replays at most one batch.  Appends are flushed to the OS right
+# away but only fsynced when a segment is rotated or the spool is closed, so a
+# power loss can still take the records appended to the active segment since.
+# Items of a replayed batch that elasticsearch asks to retry are appended to
+# the active segment again, the rest of the batch is not resent.  Total disk
+# usage is capped at maxBytes by deleting the oldest segments.
+
+import os, time, threading, elasticsearch
+from elasticsearch.serializer import JSONSerializer
+from records import toSource
+from doc_ids import getBulkAction
+
+DEFAULT_SPOOL_DIR = "spool"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_SPOOL_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_REPLAY_BATCH_DOCS = 5000
+DEFAULT_REPLAY_INTERVAL = 5
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson"
+OFFSET_FILE_NAME = "offset"
+
+# bulk item statuses that mean "try again later" rather than "this document is bad"
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+def isRetryable(error):
+	if isinstance(error, elasticsearch.exceptions.ConnectionError):
+		return True
+	if isinstance(error, elasticsearch.exceptions.TransportError):
+		return error.status_code in RETRYABLE_STATUSES
+	return error in RETRYABLE_STATUSES
+
+class Spool:
+	def __init__(self, spoolDir=DEFAULT_SPOOL_DIR, segmentBytes=DEFAULT_SEGMENT_BYTES, maxBytes=DEFAULT_MAX_SPOOL_BYTES):
+		self.spoolDir = spoolDir
+		self.segmentBytes = segmentBytes
+		self.maxBytes = maxBytes
+		self.serializer = JSONSerializer()
+		self.lock = threading.RLock()
+		self.replayLock = threading.Lock()
+		self.replayThread = None
+		self.replayingSegment = None
+		if not os.path.isdir(spoolDir):
+			os.makedirs(spoolDir)
+		self.segments = self.findSegments()
+		self.totalBytes = 0
+		for segment in self.segments:
+			self.totalBytes += os.path.getsize(self.getSegmentPath(segment))
+		self.readSegment, self.readOffset = self.loadOffset()
+		if len(self.segments) == 0:
+			self.segments.append(1)
+		self.openActiveSegment(self.segments[-1])
+
+	def findSegments(self):
+		segments = []
+		for fileName in os.listdir(self.spoolDir):
+			if fileName.startswith(SEGMENT_PREFIX) and fileName.endswith(SEGMENT_SUFFIX):
+				segments.append(int(fileName[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+		return sorted(segments)
+
+	def getSegmentPath(self, segment):
+		return os.path.join(self.spoolDir, SEGMENT_PREFIX + "%010d" % segment + SEGMENT_SUFFIX)
+
+	def openActiveSegment(self, segment):
+		self.activeSegment = segment
+		self.activeFile = open(self.getSegmentPath(segment), "ab")
+		self.activeBytes = self.activeFile.tell()
+
+	def loadOffset(self):
+		offsetPath = os.path.join(self.spoolDir, OFFSET_FILE_NAME)
+		if os.path.exists(offsetPath):
+			with open(offsetPath) as offsetFile:
+				values = offsetFile.read().split()
+			if len(values) == 2 and int(values[0]) in self.segments:
+				return int(values[0]), int(values[1])
+		if len(self.segments) > 0:
+			return self.segments[0], 0
+		return 1, 0
+
+	def saveOffset(self, segment, offset):
+		self.readSegment = segment
+		self.readOffset = offset
+		offsetPath = os.path.join(self.spoolDir, OFFSET_FILE_NAME)
+		tempPath = offsetPath + ".tmp"
+		with open(tempPath, "w") as offsetFile:
+			offsetFile.write(str(segment) + " " + str(offset))
+			offsetFile.flush()
+			os.fsync(offsetFile.fileno())
+		os.rename(tempPath, offsetPath)
+
+	# a docId of None is replayed as an index action and elasticsearch picks the id
+	def append(self, indexName, docType, docId, dto):
+		self.appendBody(getBulkAction(indexName, docType, docId) + "\n" + toSource(dto, self.serializer) + "\n")
+
+	# body must hold complete action/source line pairs, exactly as sent to _bulk
+	def appendBody(self, body):
+		if not isinstance(body, bytes):
+			body = body.encode("utf-8")
+		with self.lock:
+			self.activeFile.write(body)
+			self.activeFile.flush()
+			self.activeBytes += len(body)
+			self.totalBytes += len(body)
+			if self.activeBytes >= self.segmentBytes:
+				self.rotate()
+			while self.totalBytes > self.maxBytes and self.dropOldestSegment():
+				pass
+
+	def syncActiveFile(self):
+		self.activeFile.flush()
+		os.fsync(self.activeFile.fileno())
+
+	def rotate(self):
+		with self.lock:
+			self.syncActiveFile()
+			self.activeFile.close()
+			nextSegment = self.activeSegment + 1
+			self.segments.append(nextSegment)
+			self.openActiveSegment(nextSegment)
+
+	def dropOldestSegment(self):
+		for segment in self.segments:
+			if segment == self.activeSegment:
+				return False
+			if segment != self.replayingSegment:
+				self.removeSegment(segment)
+				print("!! FATAL !!: SPOOL OVER " + str(self.maxBytes) + " BYTES, DROPPED SEGMENT " + str(segment))
+				return True
+		return False
+
+	def removeSegment(self, segment):
+		with self.lock:
+			segmentPath = self.getSegmentPath(segment)
+			self.totalBytes -= os.path.getsize(segmentPath)
+			os.remove(segmentPath)
+			self.segments.remove(segment)
+			if segment == self.readSegment:
+				self.saveOffset(self.segments[0], 0)
+
+	def getPendingBytes(self):
+		with self.lock:
+			return self.totalBytes - self.readOffset
+
+	def hasPending(self):
+		return self.getPendingBytes() > 0
+
+	def replay(self, es, batchDocs=DEFAULT_REPLAY_BATCH_DOCS):
+		with self.replayLock:
+			with self.lock:
+				# stop appending to the segment we are about to read
+				if self.activeBytes > 0:
+					self.rotate()
+				segments = [segment for segment in self.segments if segment != self.activeSegment]
+			replayed = 0
+			for segment in segments:
+				self.replayingSegment = segment
+				try:
+					segmentReplayed, finished = self.replaySegment(es, segment, batchDocs)
+				finally:
+					self.replayingSegment = None
+				replayed += segmentReplayed
+				if not finished:
+					break
+				if segment in self.segments:
+					self.removeSegment(segment)
+			return replayed
+
+	def replaySegment(self, es, segment, batchDocs):
+		replayed = 0
+		offset = self.readOffset if segment == self.readSegment else 0
+		with open(self.getSegmentPath(segment), "rb") as segmentFile:
+			segmentFile.seek(offset)
+			while True:
+				lines = []
+				for i in range(batchDocs * 2):
+					line = segmentFile.readline()
+					if not line.endswith(b"\n"):
+						# end of file or a record torn by a crash mid-write
+						break
+					lines.append(line)
+				if len(lines) % 2 == 1:
+					lines.pop()
+				if len(lines) == 0:
+					return replayed, True
+				try:
+					response = es.bulk(body=b"".join(lines).decode("utf-8"))
+				except elasticsearch.exceptions.TransportError as e:
+					print("SPOOL REPLAY PAUSED, ELASTICSEARCH UNAVAILABLE: " + str(e))
+					return replayed, False
+				retryLines = []
+				if response.get("errors", False) == True:
+					for i, result in enumerate(response["items"]):
+						status = list(result.values())[0]
+						if isRetryable(status.get("status")):
+							retryLines.extend(lines[2 * i:2 * i + 2])
+						elif status.get("status", 500) >= 300 and status.get("status") != 409:
+							print("!! FATAL !!: SPOOLED DOCUMENT " + str(status.get("_id")) + " REJECTED: " + str(status.get("error")))
+				if len(retryLines) > 0:
+					# only the pushed back items go around again, resending the whole batch would duplicate the accepted ones that have no _id
+					self.appendBody(b"".join(retryLines))
+				offset += sum([len(line) for line in lines])
+				self.saveOffset(segment, offset)
+				replayed += (len(lines) - len(retryLines)) // 2
+				if len(retryLines) > 0:
+					return replayed, False
+
+	def startReplayThread(self, es, interval=DEFAULT_REPLAY_INTERVAL, batchDocs=DEFAULT_REPLAY_BATCH_DOCS):
+		def replayForever():
+			while True:
+				try:
+					if self.hasPending() and es.ping():
+						replayed = self.replay(es, batchDocs)
+						if replayed > 0:
+							print("REPLAYED " + str(replayed) + " SPOOLED DOCUMENTS")
+				except Exception as e:
+					print("SPOOL REPLAY FAILED: " + str(e))
+				time.sleep(interval)
+		self.replayThread = threading.Thread(target=replayForever, name="es-spool-replay")
+		self.replayThread.daemon = True
+		self.replayThread.start()
+		return self.replayThread
+
+	def close(self):
+		with self.lock:
+			self.syncActiveFile()
+			self.activeFile.close()
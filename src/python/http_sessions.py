@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# One requests.Session per scheme and host, shared by every thread of the
+# process.  A session keeps its connections open between polls, so polling a
+# ticker costs one round trip instead of a TCP and TLS handshake followed by
+# the request.  Each session gets a pool of poolSize connections so threads
+# asking the same host at once do not wait for a single socket.  requests
+# already asks for gzip and inflates the answer.
+
+import threading, requests
+from requests.adapters import HTTPAdapter
+
+try:
+	from urllib.parse import urlparse
+except ImportError:
+	# Python 2
+	from urlparse import urlparse
+
+DEFAULT_POOL_SIZE = 10
+# seconds, a request that hangs would otherwise hold up every poll after it
+DEFAULT_REQUEST_TIMEOUT = 10
+
+sessions = {}
+sessionsLock = threading.Lock()
+
+def getSession(url, poolSize=DEFAULT_POOL_SIZE):
+	parsed = urlparse(url)
+	key = (parsed.scheme, parsed.netloc)
+	with sessionsLock:
+		session = sessions.get(key)
+		if session == None:
+			session = requests.Session()
+			session.mount(parsed.scheme + "://" + parsed.netloc, HTTPAdapter(pool_connections=1, pool_maxsize=poolSize))
+			sessions[key] = session
+	return session
+
+def get(url, **kwargs):
+	kwargs.setdefault("timeout", DEFAULT_REQUEST_TIMEOUT)
+	return getSession(url).get(url, **kwargs)
@@ -19,37 +19,81 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import requests, json, argparse, uuid, pytz, datetime, elasticsearch
-from time import sleep 
+import requests, json, os, argparse, uuid, pytz, datetime, elasticsearch, threading
+from multiprocessing.pool import ThreadPool
+from rate_scheduler import RateScheduler, FixedRateClock, DEFAULT_MAX_RETRIES
+from es_spool import Spool, DEFAULT_SPOOL_DIR
+from bulk_sink import BulkSink
+from doc_ids import getDocumentId, ID_STRATEGIES, DEFAULT_ID_STRATEGY
 TIMEZONE = pytz.timezone('UTC')
 KRAKEN_API_HOST = "https://api.kraken.com"
 ELASTICSEARCH_HOST = "https://search-bitcoins-2sfk7jzreyq3cfjwvia2mj7d4m.us-west-2.es.amazonaws.com"
 DEFAULT_INDEX = "eth_orderbooks_live"
 DEFAULT_DOC_TYPE = "kraken_ethereum"
-SLEEP_INTERVAL = 7.5
+# seconds between the starts of two rounds over every pair, the rate scheduler holds the
+# Depth calls of a round back when kraken's budget is used up.  At kraken's 1 call per
+# second a round over n pairs takes about n seconds, so with --currency all (a few hundred
+# pairs) every book is polled once every few minutes, not once per poll_interval
+POLL_INTERVAL = 1.0
+DEPTH_ENDPOINT = "/0/public/Depth"
+# Depth calls in flight at once, their rate is still capped by the scheduler
+DEFAULT_WORKERS = 4
+# Depth answers with at most 500 levels per side, a whole book fits in one bulk request
+BULK_MAX_DOCS = 1000
+# kraken answers some throttled calls with a 200 and one of these in its error list
+KRAKEN_THROTTLE_ERRORS = ["EAPI:Rate limit exceeded", "EService:Unavailable", "EService:Busy"]
+# a book level is identified by its pair, the poll it came from, its side and its price
+ORDERBOOK_ID_FIELDS = ["currency_pair", "date", "order_type", "price"]
+scheduler = RateScheduler()
+sink = None
+# held while one response is added and flushed, so every response is a _bulk request of its own
+sinkLock = threading.Lock()
 def getArgs(): 
 	parser = argparse.ArgumentParser(description='BTC elastic search data collector')
 	parser.add_argument('--host')
-	parser.add_argument('--currency', default="ETHUSD")
+	parser.add_argument('--currency', default="ETHUSD", help='comma separated kraken pairs, or "all" for every pair kraken lists')
+	parser.add_argument('--poll_interval', type=float, default=POLL_INTERVAL, help='seconds between rounds over every pair, a round takes at least one second per pair at kraken\'s public rate limit, so each pair is polled every max(poll_interval, number of pairs) seconds')
+	parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
 	parser.add_argument('--forever', action='store_true', default=False)
 	parser.add_argument('--max_records', action='store_true', default=3600)
+	parser.add_argument('--spool_dir', default=os.path.join(DEFAULT_SPOOL_DIR, "kraken"))
+	parser.add_argument('--id_strategy', choices=ID_STRATEGIES, default=DEFAULT_ID_STRATEGY)
 
 	# TODO: add more params here
 
 	args = parser.parse_args()
 	return args
 
+# /0/public/AssetPairs, the .d pairs are kraken's dark pool and have no public book
+def getAssetPairs(): 
+	endpoint = "/0/public/AssetPairs"
+	req = scheduler.get("kraken", endpoint, KRAKEN_API_HOST + endpoint)
+	return sorted([str(pair) for pair in req.json()['result'] if not pair.endswith(".d")])
+
+def getCurrencyPairs(currencyArg): 
+	if currencyArg.strip().lower() == "all": 
+		return getAssetPairs()
+	return [pair.strip() for pair in currencyArg.split(",") if pair.strip() != ""]
+
 # /0/public/Depth
 def getOrderbook(currencyPair): 
-	endpoint = "/0/public/Depth"
+	endpoint = DEPTH_ENDPOINT
 	params = {}
 	params["pair"] = currencyPair
 	reqUrl = KRAKEN_API_HOST + endpoint
-	req = requests.get(reqUrl, params=params)
+	# throttled answers are retried a few times, after that pollPair reports the pair and it waits for the next round
+	for attempt in range(DEFAULT_MAX_RETRIES + 1): 
+		req = scheduler.get("kraken", endpoint, reqUrl, params=params)
+		reqJson = req.json()
+		if not any(error in KRAKEN_THROTTLE_ERRORS for error in reqJson.get("error", [])): 
+			break
+		scheduler.report("kraken", 429)
+	else: 
+		raise IOError("Kraken still throttled after " + str(DEFAULT_MAX_RETRIES + 1) + " attempts: " + ", ".join(reqJson["error"]))
 	#  asks = ask side array of array entries(<price>, <volume>, <timestamp>)
 	#  bids = bid side array of array entries(<price>, <volume>, <timestamp>)
 	orderbook = {}
-	reqResult = req.json()['result']
+	reqResult = reqJson['result']
 	keyCount = 0
 	currencyKey = ""
 	for fullKey in reqResult: 
@@ -71,6 +115,7 @@ def getOrderbookMapping():
 					"uuid": { "type": "string", "index": "no"}, 
 					"date": {"type": "date"},
 					"timestamp": {"type": "string", "index": "no"}, 
+					"currency_pair": {"type": "string"},
 					"price": {"type": "float"},
 					"relative_volume": {"type":"string"}, 
 					"volume": {"type":"string"}, 
@@ -89,10 +134,14 @@ def getCurrentDate():
 	recordDate = datetime.datetime.now(TIMEZONE)
 	return recordDate
 
-def createOrderbookDto(orderbookData, orderType): 
+def createOrderbookDto(orderbookData, orderType, currencyPair=None, recordDate=None): 
 	orderbookEntry = {}
 	orderbookEntry["uuid"] = getUniqueId()
-	orderbookEntry["date"] = getCurrentDate()
+	if recordDate == None: 
+		recordDate = getCurrentDate()
+	orderbookEntry["date"] = recordDate
+	if currencyPair != None: 
+		orderbookEntry["currency_pair"] = currencyPair
 	if len(orderbookData) != 3: 
 		raise IOError("Invalid object passed to create orderbook dto") 
 	else: 
@@ -110,12 +159,14 @@ def createOrderbookDto(orderbookData, orderType):
 			raise IOError("order_type must be either bid or ask") 
 	return orderbookEntry
 
-def getEntryQueue(orderbook): 
+# every entry of one response shares the date of the poll
+def getEntryQueue(orderbook, currencyPair=None): 
 	entryList = []
+	recordDate = getCurrentDate()
 	for bidOrder in orderbook["bids"]: 
-		entryList.append(createOrderbookDto(bidOrder, "BID"))
+		entryList.append(createOrderbookDto(bidOrder, "BID", currencyPair, recordDate))
 	for askOrder in orderbook["asks"]: 
-		entryList.append(createOrderbookDto(askOrder, "ASK"))
+		entryList.append(createOrderbookDto(askOrder, "ASK", currencyPair, recordDate))
 	return entryList
 
 def initializeIndexConfiguration(es, mapping, indexName=DEFAULT_INDEX, docType=DEFAULT_DOC_TYPE): 
@@ -130,29 +181,46 @@ def initializeIndexConfiguration(es, mapping, indexName=DEFAULT_INDEX, docType=D
 		print "Initial Index Config looks valid... Continuing"
 		pass  
 
-def injectEntry(entryData, indexName=DEFAULT_INDEX, docType=DEFAULT_DOC_TYPE): 
-	putNewDocumentRequest = es.create(index=indexName, doc_type=docType, ignore=[400], id=uuid.uuid4(), body=entryData)
-	successful = putNewDocumentRequest["created"]
-	return successful
+# one _bulk request for the whole book of a pair, a cluster that is down gets it spooled by the sink
+def injectOrderbook(currencyPair, orderEntries, indexName=DEFAULT_INDEX, docType=DEFAULT_DOC_TYPE): 
+	with sinkLock: 
+		# a book over BULK_MAX_DOCS is partly flushed by add() itself, so the count comes from the sink's total
+		indexedBefore = sink.getStats()["indexed"]
+		for orderEntry in orderEntries: 
+			docId = getDocumentId(args.id_strategy, docType, orderEntry, ORDERBOOK_ID_FIELDS)
+			sink.add(orderEntry, indexName, docType, docId)
+		sink.flush()
+		return sink.getStats()["indexed"] - indexedBefore
+
+# runs on the worker pool, a pair that fails is reported and tried again next round
+def pollPair(currencyPair): 
+	try: 
+		orderEntries = getEntryQueue(getOrderbook(currencyPair), currencyPair)
+		indexed = injectOrderbook(currencyPair, orderEntries)
+	except Exception as e: 
+		print "FAILED TO POLL " + currencyPair + ": " + str(e)
+		return 0
+	print "Added " + str(indexed) + " of " + str(len(orderEntries)) + " orderbook entries for " + currencyPair + " to ES cluster"
+	return indexed
 
 if __name__ == "__main__": 
 	args = getArgs()
-	orderbook = getOrderbook(args.currency)
 	es = elasticsearch.Elasticsearch([ELASTICSEARCH_HOST])
+	spool = Spool(args.spool_dir)
+	spool.startReplayThread(es)
+	sink = BulkSink(es, maxDocs=BULK_MAX_DOCS, spool=spool, idStrategy=args.id_strategy)
 	mapping = getOrderbookMapping()
 	initializeIndexConfiguration(es, mapping)
+	currencyPairs = getCurrencyPairs(args.currency)
+	print "Polling the kraken orderbooks of " + str(len(currencyPairs)) + " pairs: " + ", ".join(currencyPairs)
+	roundSeconds = scheduler.getRoundSeconds("kraken", DEPTH_ENDPOINT, len(currencyPairs))
+	if roundSeconds > args.poll_interval: 
+		print "!! WARNING !!: kraken's rate limit allows " + str(int(args.poll_interval * scheduler.limits["kraken"][0] / scheduler.getCost("kraken", DEPTH_ENDPOINT))) + " Depth calls per " + str(args.poll_interval) + "s poll interval, each of the " + str(len(currencyPairs)) + " pairs will be polled about every " + "%.0f" % roundSeconds + " seconds"
 
-	count = 0 
+	pool = ThreadPool(args.workers)
+	clock = FixedRateClock(args.poll_interval)
 
 	while 1 == 1: 
-		orderbook = getOrderbook(args.currency) 
-		orderEntries = getEntryQueue(orderbook) 
-		for orderEntry in orderEntries: 
-			successful = injectEntry(orderEntry) 
-			if successful == True: 
-				theId = orderEntry["uuid"]
-				print "Successfully added orderbook entry with ID " + theId + " (order type: " + orderEntry["order_type"] + ") to ES cluster"
-			else: 
-				print "FAILED TO ADD " + theId + " to cluster..."  
-		print "sleeping for " + str(SLEEP_INTERVAL) + " before requesting updated ledger..."
-		sleep(SLEEP_INTERVAL)
+		clock.wait()
+		indexed = pool.map(pollPair, currencyPairs)
+		print "Round done, " + str(sum(indexed)) + " entries added (" + str(scheduler.getStats()["requests"]) + " kraken requests so far)"
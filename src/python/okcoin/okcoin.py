@@ -5,6 +5,15 @@ __license__ = "MIT"
 
 import os, websocket, time, datetime, sys, json, hashlib, zlib, base64, json, re, elasticsearch, argparse, uuid, pytz
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from writer_pool import WriterPool, DEFAULT_WRITER_THREADS, DEFAULT_QUEUE_SIZE, DEFAULT_QUEUE_POLICY
+from es_spool import Spool, DEFAULT_SPOOL_DIR, isRetryable
+from okcoin_depth import DepthDiffer, DEFAULT_DEPTH_SNAPSHOT_INTERVAL
+from candles import CandleAggregator, getCandleDto, DEFAULT_OPEN_CANDLE_INTERVAL
+from deflate_json import DeflateJsonDecoder
+from doc_ids import getDocumentId, writeDocument, DEFAULT_ID_STRATEGY
+from reconnect import ReconnectManager, OUTAGE_INDEX_NAME, DEFAULT_RECONNECT_BASE_DELAY, DEFAULT_RECONNECT_MAX_DELAY
+from records import Record, OrderRecord, TradeRecord, TickerRecord, CandleRecord, FutureRecord, FrameStamp, nextUuid
 
 DEFAULT_DOCTYPE_NAME = "okcoin"
 DEFAULT_INDEX_NAME = "live_crypto_orderbooks"
@@ -13,13 +22,47 @@ DEFAULT_WEBSOCKETS_URL = "wss://real.okcoin.com:10440/websocket/okcoinapi"
 #DEFAULT_ELASTICSEARCH_URL = "https://search-btc-staging-temp-r4fnlxi76bsx3mhonfyxrawr3y.us-west-2.es.amazonaws.com"
 DEFAULT_ELASTICSEARCH_URL = "https://es1.btcdream.ws:9200" 
 TIMEZONE = pytz.timezone("UTC")
-DEFAULT_INDECES = ["live_crypto_orderbooks", "live_crypto_tickers", "live_crypto_trades", "live_crypto_candlesticks", "live_crypto_futures_contracts"]
+DEFAULT_INDECES = ["live_crypto_orderbooks", "live_crypto_tickers", "live_crypto_trades", "live_crypto_candlesticks", "live_crypto_futures_contracts", OUTAGE_INDEX_NAME]
 TIMEZONE = pytz.timezone('UTC')
+SPOT_CURRENCIES = ["btc", "ltc"]
+KLINE_TYPES = ['1min', '3min', '5min', '15min', '30min', '1hour', '2hour', '4hour', '6hour', '12hour', 'day', '3day', 'week']
+FUTURE_TYPES = [ "this_week", "next_week", "quarter" ]
+
+# subscribed to, but nothing is indexed from them (yet)
+UNROUTED_CHANNELS = [
+	"ok_btcusd_future_ticker_this_week", "ok_btcusd_future_ticker_next_week", "ok_btcusd_future_ticker_quarter", "ok_btcusd_future_index",
+	"ok_sub_futureusd_btc_trade_this_week", "ok_sub_futureusd_btc_trade_next_week", "ok_sub_futureusd_btc_trade_quarter",
+	"ok_sub_futureusd_ltc_trade_this_week", "ok_sub_futureusd_ltc_trade_next_week", "ok_sub_futureusd_ltc_trade_quarter",
+	"ok_btcusd_trades_v1"
+]
+UNROUTED_KLINE_CHANNELS = ["ok_btcusd_kline_" + klineType for klineType in KLINE_TYPES]
+
+# candles are built from the trades channels by default, set to True to also index okcoin's own kline channels
+DEFAULT_SUBSCRIBE_KLINES = False
+# offer permessage-deflate, servers that do not support it just answer without it
+DEFAULT_PERMESSAGE_DEFLATE = True
+# seconds between the decode stage timing reports, None to never print them
+DEFAULT_DECODE_STATS_INTERVAL = 300
 
 class Okcoin(): 
-	def __init__(self, wsUrl=DEFAULT_WEBSOCKETS_URL, esUrl=DEFAULT_ELASTICSEARCH_URL):
+	def __init__(self, wsUrl=DEFAULT_WEBSOCKETS_URL, esUrl=DEFAULT_ELASTICSEARCH_URL, writerThreads=DEFAULT_WRITER_THREADS, queueSize=DEFAULT_QUEUE_SIZE, queuePolicy=DEFAULT_QUEUE_POLICY, spoolDir=os.path.join(DEFAULT_SPOOL_DIR, DEFAULT_DOCTYPE_NAME), depthSnapshotInterval=DEFAULT_DEPTH_SNAPSHOT_INTERVAL, subscribeKlines=DEFAULT_SUBSCRIBE_KLINES, openCandleInterval=DEFAULT_OPEN_CANDLE_INTERVAL, idStrategy=DEFAULT_ID_STRATEGY, reconnectBaseDelay=DEFAULT_RECONNECT_BASE_DELAY, reconnectMaxDelay=DEFAULT_RECONNECT_MAX_DELAY):
 		self.wsUrl = wsUrl
 		self.esUrl = esUrl
+		self.writerThreads = writerThreads
+		self.queueSize = queueSize
+		self.queuePolicy = queuePolicy
+		self.spoolDir = spoolDir
+		self.idStrategy = idStrategy
+		# depth_60 pushes are diffed against the previous one, a full snapshot is written every depthSnapshotInterval seconds (0 writes every push in full)
+		self.depthDiffer = DepthDiffer(depthSnapshotInterval)
+		self.subscribeKlines = subscribeKlines
+		self.candles = CandleAggregator(self.postCandle, openCandleInterval=openCandleInterval)
+		self.lastCandleSweep = time.time()
+		self.decoder = DeflateJsonDecoder()
+		self.lastDecodeStats = time.time()
+		self.lastMessageAt = None
+		self.lastError = None
+		self.reconnects = ReconnectManager(DEFAULT_DOCTYPE_NAME, self.postOutage, reconnectBaseDelay, reconnectMaxDelay)
 		self.connectElasticsearch()
 		self.createIndices()
 		self.getTickerMapping()
@@ -29,10 +72,27 @@ class Okcoin():
 		self.getFutureTickerMapping()
 		self.createMappings()
 		
+	# run_forever returns once the connection is gone, a new one is opened after the backoff delay
 	def run(self): 
 		websocket.enableTrace(False)
-		ws = websocket.WebSocketApp(self.wsUrl, on_message = self.websocketMessage, on_error = self.websocketError, on_close = self.websocketClose, on_open = self.subscribePublicChannels)
-		ws.run_forever()
+		try:
+			while True: 
+				self.lastError = None
+				ws = websocket.WebSocketApp(self.wsUrl, on_message = self.websocketMessage, on_error = self.websocketError, on_close = self.websocketClose, on_open = self.websocketOpen)
+				ws.run_forever(permessage_deflate=DEFAULT_PERMESSAGE_DEFLATE)
+				self.reconnects.disconnected(self.lastError or "connection closed", self.lastMessageAt)
+				self.reconnects.waitForRetry()
+		finally:
+			self.writerPool.close()
+
+	# the next depth_60 push of every pair is written in full, the levels we remember are from before the outage
+	def websocketOpen(self, connector): 
+		self.depthDiffer.reset()
+		self.subscribePublicChannels(connector)
+		self.reconnects.connected()
+
+	def postOutage(self, outage): 
+		self.postDto(outage, OUTAGE_INDEX_NAME)
 
 	def createIndices(self, indecesList=DEFAULT_INDECES):
 		for index in DEFAULT_INDECES:
@@ -56,138 +116,81 @@ class Okcoin():
 
 	def connectWebsocket(self):
 		try:
-			self.ws = create_connection(self.wsUrl)
+			self.ws = create_connection(self.wsUrl, permessage_deflate=DEFAULT_PERMESSAGE_DEFLATE)
 		except:
 			raise
 		return True
 
 	def connectElasticsearch(self):
 		try:
-<<<<<<< HEAD
 			self.es = elasticsearch.Elasticsearch([self.esUrl])
-=======
-			self.es = elasticsearch.Elasticsearch([self.esUrl], verify_ssl=True)
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
+			self.spool = Spool(self.spoolDir)
+			self.spool.startReplayThread(self.es)
+			self.writerPool = WriterPool(self.writeDto, self.writerThreads, self.queueSize, self.queuePolicy, self.spool)
 		except:
 			raise		
 
+	# Every channel is registered in self.channelRoutes as channel name -> (handler, currency pair, channel type)
+	# so websocketMessage routes a message with a single dict lookup
 	def subscribePublicChannels(self, connector):
-		connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_btc_ticker','binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_ltc_ticker','binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_btc_depth_60', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_ltc_depth_60', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_btc_trades'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_ltc_trades'}");
-<<<<<<< HEAD
-
-		ok_sub_spotusd_btc_kline_week
-=======
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
-		connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_btc_trades'}");
-
-		websocket.send("{'event':'addChannel','channel':'ok_sub_spotusd_X_kline_Y'}");
-		klineList = []
-		klineTypes = ['1min', '3min', '5min', '15min', '30min', '1hour', '2hour', '4hour', '6hour', '12hour', 'day', '3day', 'week']
-		for klineType in klineTypes: 
-			connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_btc_kline_'" + klineType + "', 'binary':'true'}");
-			klineList.append("ok_sub_spotusd_btc_kline_" + klineType)
-			connector.send("{'event':'addChannel','channel':'ok_sub_spotusd_ltc_kline_'" + klineType + "', 'binary':'true'}");
-			klineList.append("ok_sub_spotusd_ltc_kline_" + klineType)
-		self.klineList = klineList
-		print(klineList)
-		klineChannels = ['ok_sub_spotusd_btc_kline_1min', 'ok_sub_spotusd_ltc_kline_1min', 'ok_sub_spotusd_btc_kline_3min', 'ok_sub_spotusd_ltc_kline_3min', 'ok_sub_spotusd_btc_kline_5min', 'ok_sub_spotusd_ltc_kline_5min', 'ok_sub_spotusd_btc_kline_15min', 'ok_sub_spotusd_ltc_kline_15min', 'ok_sub_spotusd_btc_kline_30min', 'ok_sub_spotusd_ltc_kline_30min', 'ok_sub_spotusd_btc_kline_1hour', 'ok_sub_spotusd_ltc_kline_1hour', 'ok_sub_spotusd_btc_kline_2hour', 'ok_sub_spotusd_ltc_kline_2hour', 'ok_sub_spotusd_btc_kline_4hour', 'ok_sub_spotusd_ltc_kline_4hour', 'ok_sub_spotusd_btc_kline_6hour', 'ok_sub_spotusd_ltc_kline_6hour', 'ok_sub_spotusd_btc_kline_12hour', 'ok_sub_spotusd_ltc_kline_12hour', 'ok_sub_spotusd_btc_kline_day', 'ok_sub_spotusd_ltc_kline_day', 'ok_sub_spotusd_btc_kline_3day', 'ok_sub_spotusd_ltc_kline_3day', 'ok_sub_spotusd_btc_kline_week', 'ok_sub_spotusd_ltc_kline_week']
-		self.klineChannels = klineChannels
-		for channel in self.klineChannels: 
+		self.channelRoutes = {}
+		for currency in SPOT_CURRENCIES: 
+			currencyPair = currency.upper() + "USD"
+			self.addChannel(connector, "ok_sub_spotusd_" + currency + "_ticker", self.handleTicker, currencyPair, "ticker")
+			self.addChannel(connector, "ok_sub_spotusd_" + currency + "_depth_60", self.handleDepth, currencyPair, "depth_60")
+			self.addChannel(connector, "ok_sub_spotusd_" + currency + "_trades", self.handleTrades, currencyPair, "trades", binary=False)
+			if self.subscribeKlines: 
+				for klineType in KLINE_TYPES: 
+					self.addChannel(connector, "ok_sub_spotusd_" + currency + "_kline_" + klineType, self.handleKline, currencyPair, klineType)
+			for futureType in FUTURE_TYPES: 
+				self.addChannel(connector, "ok_sub_futureusd_" + currency + "_ticker_" + futureType, self.handleFutureTicker, currencyPair, futureType)
+		for channel in UNROUTED_CHANNELS: 
+			self.addChannel(connector, channel)
+		if self.subscribeKlines: 
+			for channel in UNROUTED_KLINE_CHANNELS: 
+				self.addChannel(connector, channel)
+
+	def addChannel(self, connector, channel, handler=None, currencyPair=None, channelType=None, binary=True): 
+		if binary: 
 			event = "{'event':'addChannel','channel':'" + channel + "', 'binary': 'true'}"
-			connector.send(str(event))
+		else: 
+			event = "{'event':'addChannel','channel':'" + channel + "'}"
+		connector.send(event)
+		if handler != None: 
+			self.channelRoutes[channel] = (handler, currencyPair, channelType)
 
-		self.futureTypes = [ "this_week", "next_week", "quarter" ]
-		
-		futureChannels = []
-		# fucking redudndant as mother fucking shit 
-<<<<<<< HEAD
-=======
-
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
-		for futureType in self.futureTypes: 
-			btcChannel = "ok_sub_futureusd_btc_ticker_" + futureType
-			btcEvent = "{'event':'addChannel','channel':'" + btcChannel + "', 'binary': 'true'}"
-			ltcChannel = "ok_sub_futureusd_ltc_ticker_" + futureType
-			ltcEvent = "{'event':'addChannel','channel':'" + ltcChannel + "', 'binary': 'true'}"
-			connector.send(str(btcEvent))
-			connector.send(str(ltcEvent))
-			futureChannels.append(ltcChannel)
-			futureChannels.append(btcChannel)
-			print('SUBSCRIBED TO THE FUTURE')
-<<<<<<< HEAD
-		self.futureChannels = futureChannels
-=======
-		
-		# futureChannels.append("ok_btcusd_future_ticker_this_week")
-		# futureChannels.append("ok_btcusd_future_ticker_next_week")
-		# futureChannels.append("ok_btcusd_future_ticker_quarter")
-		# futureChannels.append("ok_btcusd_future_index")
-		# futureChannels.append("ok_sub_futureusd_btc_trade_this_week")
-		# futureChannels.append("ok_sub_futureusd_btc_trade_next_week") 
-		# futureChannels.append("ok_sub_futureusd_btc_trade_quarter")
-		# futureChannels.append("ok_sub_futureusd_ltc_trade_this_week")
-		# futureChannels.append("ok_sub_futureusd_ltc_trade_next_week") 
-		# futureChannels.append("ok_sub_futureusd_ltc_trade_quarter")
-		self.futureChannels = futureChannels
-
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_ticker_this_week', 'binary' : 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_ticker_next_week', 'binary' : 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_ticker_quarter', 'binary' : 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_index', 'binary':'true', 'binary' : 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_btc_trade_this_week', 'binary' : 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_btc_trade_next_week', 'binary' : 'true'}") 
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_btc_trade_quarter', 'binary' : 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_ltc_trade_this_week', 'binary' : 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_ltc_trade_next_week', 'binary' : 'true'}") 
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_ltc_trade_quarter', 'binary' : 'true'}")
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_trades_v1', 'binary': 'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_1min', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_3min', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_5min', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_15min', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_30min', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_1hour', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_2hour', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_4hour', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_6hour', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_12hour', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_day', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_3day', 'binary':'true'}")
-		connector.send("{'event':'addChannel', 'channel': 'ok_btcusd_kline_week', 'binary':'true'}")
-<<<<<<< HEAD
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_ticker_this_week', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_ticker_next_week', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_ticker_quarter', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_btcusd_future_index', 'binary':'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_btc_trade_this_week', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_btc_trade_next_week', 'binary': 'true'}") 
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_btc_trade_quarter', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_ltc_trade_this_week', 'binary': 'true'}")
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_ltc_trade_next_week', 'binary': 'true'}") 
-		connector.send("{'event':'addChannel','channel':'ok_sub_futureusd_ltc_trade_quarter', 'binary': 'true'}")
-=======
-
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
+	# stamp is the FrameStamp of the message the data came in, shared by every record built from it
+	def handleTicker(self, data, currencyPair, channelType, stamp): 
+		self.postDto(self.getTickerDto(data, currencyPair, stamp), "live_crypto_tickers")
+
+	def handleDepth(self, data, currencyPair, channelType, stamp): 
+		for dto in self.getDepthDtoList(data, currencyPair, stamp): 
+			self.postDto(dto, "live_crypto_orderbooks")
+
+	def handleTrades(self, data, currencyPair, channelType, stamp): 
+		# trades only carry a time of day, so candles are bucketed by receive time
+		for dto in self.getCompletedTradeDtoList(data, currencyPair, stamp): 
+			self.postDto(dto, "live_crypto_trades")
+			self.candles.addTrade(currencyPair, stamp.seconds, dto.price, dto.absolute_volume)
+
+	def postCandle(self, currencyPair, intervalName, candle, closed): 
+		self.postDto(getCandleDto(currencyPair, intervalName, candle, closed), "live_crypto_candlesticks")
+
+	def handleKline(self, data, currencyPair, klineType, stamp): 
+		klineDto = self.getKline(data, currencyPair, klineType, stamp)
+		if klineDto != None: 
+			self.postDto(klineDto, "live_crypto_candlesticks")
+
+	def handleFutureTicker(self, data, currencyPair, contractType, stamp): 
+		self.postDto(self.getFutureTickerMappingDto(data, currencyPair, contractType, stamp), "live_crypto_futures_contracts")
 
 	def inflate(self, okcoinData):
-	    decompressedData = zlib.decompressobj(-zlib.MAX_WBITS)
-	    inflatedData = decompressedData.decompress(okcoinData)
-	    inflatedData += decompressedData.flush()
-	    return inflatedData
-
-<<<<<<< HEAD
-	def websocketError(self, event):
-=======
+		return self.decoder.inflate(okcoinData)
+
 	def websocketError(self, event, data):
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
 		print('ERROR IS: ') 
 		print (event)
+		self.lastError = data.__class__.__name__ + " " + str(data)
 
 	def websocketClose(self, event):
 	    print (event)
@@ -203,7 +206,8 @@ class Okcoin():
 					"count": {"type": "float"},
 					"volume": {"type" : "float"},
 					"absolute_volume": { "type": "float"},
-					"order_type": { "type": "string"}
+					"order_type": { "type": "string"},
+					"change_type": { "type": "string"}
 				}
 			}
 		}
@@ -267,6 +271,8 @@ class Okcoin():
 					"lowest_price": {"type": "float"},
 					"close_price": {"type": "float"},
 					"volume": {"type": "float"},
+					"trade_count": {"type": "integer"},
+					"closed": {"type": "boolean"},
 					"currency_symbol": {"type": "string"}, 
 					"contract_type": {"type": "string"}
 				}
@@ -290,299 +296,110 @@ class Okcoin():
 					"volume": {"type": "float"},
 					"contract_type": {"type": "string"},	
 					"contract_id": {"type": "string", "index": "no"}, 
-<<<<<<< HEAD
-					"currency_pair": {"type": "string"}				}
-=======
 					"currency_pair": {"type": "string"}				
 				}
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
 			}
 		} 
 		return self.futureMapping
 
-	def getKline(self, dataSet, channelName): 
-		futureDto = {}
-		uniqueId = uuid.uuid4()
-		futureDto["uuid"] = str(uniqueId) 
-		recordDate = datetime.datetime.now(TIMEZONE)
-		futureDto["date"] = recordDate
-
-		if type(dataSet) is list: 
-<<<<<<< HEAD
-			# [time, open_price, highest_price, lowest_price, close_price, volume]
-			futureRegex = re.search("ok_sub_spotusd_(b|l)tc_kline_(.+)", channelName)
-			futureType = futureRegex.group(2)
-			currencySymbol = futureRegex.group(1)
-			futureDto["timestamp"] = str(dataSet[0])
-			futureDto["open_price"] = float(dataSet[1])
-			futureDto["highest_price"] = float(dataSet[2])
-			futureDto["lowest_price"] = float(dataSet[3])
-			futureDto["close_price"] = float(dataSet[4])
-
-			theVol = str(dataSet[5])
-			theVol = theVol.replace(",", "")
-			theVolFloat = float(theVol)
-
-			futureDto["volume"] = float(theVolFloat)
-			pair = currencySymbol.upper() + "TCUSD"
-			futureDto["currency_symbol"] = str(pair)
-			futureDto["contract_type"] = str(futureType)
-		else: 
+	def getKline(self, dataSet, currencyPair, klineType, stamp=None): 
+		if type(dataSet) is not list: 
 			print (dataSet)
-			# print (dataSet)
-			# for jsonData in dataSet: 
-			# 	futureData = jsonData["data"] 
-
-			# 	# {'vol': '696068.00', 'high': 471.64, 'contractId': '20160325012', 'low': 461.74, 'buy': 464.68, 'last': '464.68', 'hold_amount': 235764, 'unitAmount': 100, 'sell': 464.76}
-
-			# 	futureDto["volume"] = float(futureData["vol"])
-			# 	futureDto["high"] = float(futureData["high"]) 
-			# 	futureDto["contract_id"] = str(futureData["contractId"]) 
-			# 	futureDto["low"] = float(futureData["low"]) 
-			# 	futureDto["buy"] = float(futureData["buy"]) 
-			# 	futureDto["last"] = float(futureData["last"]) 
-			# 	futureDto["hold_amount"] = float(futureData["hold_amount"]) 
-			# 	futureDto["unit_amount"] = float(futureData["unitAmount"]) 
-			# 	futureDto["sell"] = float(futureData["sell"]) 
-			# 	futureDto["currency_symbol"] = str(currencySymbol)
-=======
-			try: 
-				# [time, open_price, highest_price, lowest_price, close_price, volume]
-				futureRegex = re.search("ok_sub_spotusd_(b|l)tc_kline_(.+)", channelName)
-				futureType = futureRegex.group(2)
-				currencySymbol = futureRegex.group(1)
-				futureDto["timestamp"] = str(dataSet[0])
-				futureDto["open_price"] = float(dataSet[1])
-				futureDto["highest_price"] = float(dataSet[2])
-				futureDto["lowest_price"] = float(dataSet[3])
-				futureDto["close_price"] = float(dataSet[4])
-
-				theVol = str(dataSet[5])
-				theVol = theVol.replace(",", "")
-				theVolFloat = float(theVol)
-
-				futureDto["volume"] = float(theVolFloat)
-				pair = currencySymbol.upper() + "TCUSD"
-				futureDto["currency_symbol"] = str(pair)
-				futureDto["contract_type"] = str(futureType)
-			except: 
-				pass
-		else: 
-			print (dataSet)
-			try: 
-				for jsonData in dataSet: 
-					futureData = jsonData["data"] 
-
-					# {'vol': '696068.00', 'high': 471.64, 'contractId': '20160325012', 'low': 461.74, 'buy': 464.68, 'last': '464.68', 'hold_amount': 235764, 'unitAmount': 100, 'sell': 464.76}
-
-					futureDto["volume"] = float(futureData["vol"])
-					futureDto["high"] = float(futureData["high"]) 
-					futureDto["contract_id"] = str(futureData["contractId"]) 
-					futureDto["low"] = float(futureData["low"]) 
-					futureDto["buy"] = float(futureData["buy"]) 
-					futureDto["last"] = float(futureData["last"]) 
-					futureDto["hold_amount"] = float(futureData["hold_amount"]) 
-					futureDto["unit_amount"] = float(futureData["unitAmount"]) 
-					futureDto["sell"] = float(futureData["sell"]) 
-					futureDto["currency_symbol"] = str(currencySymbol)
-			except: 
-				pass 
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
-		return futureDto 
-
-	def getTickerDto(self, dataSet, currencyPair): 
-		dto = {}
-		dto["uuid"] = str(uuid.uuid4())
-		dto["date"] = datetime.datetime.now(TIMEZONE)
-		dto["volume"] = float(str(dataSet["vol"].replace(",","")))
-		dto["timestamp"] = str(dataSet["timestamp"])
-		dto["last_price"] = float(dataSet["last"])
-		dto["low_price"] = float(dataSet["low"])
-		dto["ask"] = float(dataSet["sell"])
-		dto["bid"] = float(dataSet["buy"])
-		dto["high"] = float(dataSet["high"])
-		dto["currency_pair"] = str(currencyPair)
-		return dto
+			return None
+		if stamp == None: 
+			stamp = FrameStamp()
+		try: 
+			# [time, open_price, highest_price, lowest_price, close_price, volume]
+			return CandleRecord(uuid=nextUuid(), date=stamp, timestamp=str(dataSet[0]), open_price=float(dataSet[1]), highest_price=float(dataSet[2]), lowest_price=float(dataSet[3]), close_price=float(dataSet[4]), volume=float(str(dataSet[5]).replace(",", "")), currency_symbol=str(currencyPair), contract_type=str(klineType))
+		except (IndexError, TypeError, ValueError): 
+			return None
+
+	def getTickerDto(self, dataSet, currencyPair, stamp=None): 
+		if stamp == None: 
+			stamp = FrameStamp()
+		return TickerRecord(uuid=nextUuid(), date=stamp, volume=float(str(dataSet["vol"].replace(",",""))), timestamp=str(dataSet["timestamp"]), last_price=float(dataSet["last"]), low_price=float(dataSet["low"]), ask=float(dataSet["sell"]), bid=float(dataSet["buy"]), high=float(dataSet["high"]), currency_pair=str(currencyPair))
 
+	# hands the document to the writer threads so a slow cluster never blocks the websocket reader
 	def postDto(self, dto, indexName=DEFAULT_INDEX_NAME, docType=DEFAULT_DOCTYPE_NAME):
-		newDocUploadRequest = self.es.create(index=indexName, doc_type=docType, ignore=[400], id=uuid.uuid4(), body=dto)
-		return newDocUploadRequest["created"]
+		# the id is chosen while the record is still a record, see doc_ids.py
+		docId = getDocumentId(self.idStrategy, docType, dto)
+		# records are queued as their json source, which es.create and the spool (spilled documents included) take as is
+		if isinstance(dto, Record): 
+			dto = dto.toJson()
+		self.writerPool.put(dto, indexName, docType, docId)
+		return True
 
-	def getDepthDtoList(self, dataSet, currencyPair): 
+	def getQueueDepth(self):
+		return self.writerPool.getQueueDepth()
+
+	# a docId of None leaves the id to elasticsearch
+	def writeDto(self, dto, indexName=DEFAULT_INDEX_NAME, docType=DEFAULT_DOCTYPE_NAME, docId=None):
+		try:
+			return writeDocument(self.es, indexName, docType, docId, dto)
+		except elasticsearch.exceptions.TransportError as e:
+			if not isRetryable(e):
+				raise
+			# cluster is down, keep the document on disk until it comes back
+			self.spool.append(indexName, docType, docId, dto)
+			return False
+
+	# only levels that changed since the previous push of this pair are returned, see okcoin_depth.DepthDiffer
+	def getDepthDtoList(self, dataSet, currencyPair, stamp=None): 
+		if stamp == None: 
+			stamp = FrameStamp()
 		dtoList = []
-	
-		print ("------")
-		for bid in dataSet["bids"]: 
-			dto = {}
-			if len(bid) == 2: 
-				dto["uuid"] = str(uuid.uuid4())
-				dto["date"] = datetime.datetime.now(TIMEZONE)
-				dto["currency_pair"] = str(currencyPair)
-				dto["timestamp"] = str(dataSet["timestamp"])
-				dto["price"] = float(bid[0])
-				volumeVal = float(bid[1]) 
-				dto["volume"] = float(volumeVal)
-				dto["absolute_volume"] = float(volumeVal)
-				dto["order_type"] = "BID"
-				dto["count"] = float(1)
-				dtoList.append(dto)
-		for ask in dataSet["asks"]: 
-			dto = {}
-			if len(ask) == 2: 
-				dto["uuid"] = str(uuid.uuid4())
-				dto["date"] = datetime.datetime.now(TIMEZONE)
-				dto["currency_pair"] = str(currencyPair)
-				dto["timestamp"] = str(dataSet["timestamp"])
-				dto["price"] = float(ask[0])
-				volumeVal = float(ask[1])
-				volumeVal = volumeVal * -1
-				dto["volume"] = float() 
-				dto["absolute_volume"] = float(volumeVal)
-				dto["order_type"] = "ASK"
-				dto["count"] = float(1)
-				dtoList.append(dto)
-		print ("------")
+		currencyPair = str(currencyPair)
+		timestamp = str(dataSet["timestamp"])
+		for orderType, price, absVol, changeType in self.depthDiffer.diff(currencyPair, dataSet, stamp.seconds): 
+			if orderType == "ASK": 
+				volume = absVol * -1
+			else: 
+				volume = absVol
+			dtoList.append(OrderRecord(uuid=nextUuid(), date=stamp, currency_pair=currencyPair, timestamp=timestamp, price=price, count=1.0, volume=volume, absolute_volume=absVol, order_type=orderType, change_type=changeType))
 		return dtoList
 
-	def getCompletedTradeDtoList(self, dataSet, currencyPair): 
+	def getCompletedTradeDtoList(self, dataSet, currencyPair, stamp=None): 
+		if stamp == None: 
+			stamp = FrameStamp()
 		dtoList = []
+		currencyPair = str(currencyPair)
 		for completedTrade in dataSet: 
-			dto = {}
-			dto["order_id"] = str(completedTrade[0])
-			dto["price"] = float(completedTrade[1])
-			dto["uuid"] = str(uuid.uuid4())
-			dto["date"] = datetime.datetime.now(TIMEZONE)
-			dto["currency_pair"] = str(currencyPair)
 			absVol = float(completedTrade[2])
-			dto["absolute_volume"] = float(absVol)
-			timestamp = str(completedTrade[3])
-			orderType = str(completedTrade[4])
-			orderType = orderType.upper()
-			dto["order_type"] = orderType
+			orderType = str(completedTrade[4]).upper()
 			if orderType == "BID": 
 				volumeVal = absVol * -1
-				dto["volume"] = float(volumeVal)
 			elif orderType == "ASK": 
 				volumeVal = absVol
-				dto["volume"] = float(volumeVal)
 			else: 
 				raise IOError("WTF order type is not ask or bid for completed trade")
-			dto["timestamp"] = str(timestamp)
-			dtoList.append(dto)
+			dtoList.append(TradeRecord(uuid=nextUuid(), date=stamp, currency_pair=currencyPair, order_id=str(completedTrade[0]), timestamp=str(completedTrade[3]), price=float(completedTrade[1]), volume=volumeVal, absolute_volume=absVol, order_type=orderType))
 		return dtoList
 
 	def websocketMessage(self, connection, event):
-		okcoinData = self.inflate(event) #data decompress
-		jsonData = self.getJsonData(okcoinData)
-		for dataSet in jsonData: 
-		 	curChannel = dataSet["channel"]
-		 	print (curChannel)
-		 	if curChannel ==  "ok_sub_spotusd_btc_ticker": 
-		 		dto = self.getTickerDto(dataSet["data"], "BTCUSD") 
-		 		self.postDto(dto, "live_crypto_tickers")
-	 		elif curChannel == "ok_sub_spotusd_ltc_ticker": 
-		 		dto = self.getTickerDto(dataSet["data"],  "LTCUSD")
-		 		self.postDto(dto, "live_crypto_tickers")
-	 		elif curChannel == "ok_sub_spotusd_btc_depth_60": 
-	 			dtoList = self.getDepthDtoList(dataSet["data"], "BTCUSD")
-	 			for dto in dtoList: 
-			 		self.postDto(dto, "live_crypto_orderbooks")
- 			elif curChannel == "ok_sub_spotusd_ltc_depth_60": 
-	 			dtoList = self.getDepthDtoList(dataSet["data"], "LTCUSD")
-	 			for dto in dtoList: 
-			 		self.postDto(dto, "live_crypto_orderbooks")
-	 		elif curChannel == "ok_sub_spotusd_btc_trades": 
-	 			print ('A TRADE')
-	 			completedTradeDtoList = self.getCompletedTradeDtoList(dataSet["data"], "BTCUSD")
-	 			for dto in completedTradeDtoList: 
-			 		self.postDto(dto, "live_crypto_trades")
- 			elif curChannel == "ok_sub_spotusd_ltc_trades": 
-	 			completedTradeDtoList = self.getCompletedTradeDtoList(dataSet["data"], "LTCUSD")
-	 			print (completedTradeDtoList)
-	 			for dto in completedTradeDtoList: 
-			 		self.postDto(dto, "live_crypto_trades")
-	 		elif curChannel in self.klineChannels: 
-	 			print ("WE IN DA KLINE LIST!")
-	 			theData = dataSet["data"]
-	 			dto = self.getKline(theData, curChannel)
-	 			self.postDto(dto, "live_crypto_candlesticks")
- 			elif curChannel in self.futureChannels: 
- 				theData = dataSet["data"]
- 				dto = self.getFutureTickerMappingDto(theData, curChannel) 
- 				print ("CRYPTO FUTURES!!!!")
- 				print(dto)
- 				self.postDto(dto, "live_crypto_futures_contracts")
-=======
+		# one clock read per message, shared by every record built from it
+		stamp = FrameStamp()
+		self.lastMessageAt = stamp.seconds
+		if stamp.seconds - self.lastCandleSweep >= 1: 
+			self.lastCandleSweep = stamp.seconds
+			self.candles.closeExpired(stamp.seconds)
+		if DEFAULT_DECODE_STATS_INTERVAL != None and stamp.seconds - self.lastDecodeStats >= DEFAULT_DECODE_STATS_INTERVAL: 
+			self.lastDecodeStats = stamp.seconds
+			print(self.decoder.formatStats())
+		# items are parsed one at a time as the loop asks for them
+		for dataSet in self.decoder.iterItems(event): 
 			try: 
-				curChannel = dataSet["channel"]
-				print (curChannel)
-				if curChannel ==  "ok_sub_spotusd_btc_ticker": 
-					dto = self.getTickerDto(dataSet["data"], "BTCUSD") 
-					self.postDto(dto, "live_crypto_tickers")
-				elif curChannel == "ok_sub_spotusd_ltc_ticker": 
-					dto = self.getTickerDto(dataSet["data"],  "LTCUSD")
-					self.postDto(dto, "live_crypto_tickers")
-				elif curChannel == "ok_sub_spotusd_btc_depth_60": 
-					dtoList = self.getDepthDtoList(dataSet["data"], "BTCUSD")
-					for dto in dtoList: 
-						self.postDto(dto, "live_crypto_orderbooks")
-				elif curChannel == "ok_sub_spotusd_ltc_depth_60": 
-					dtoList = self.getDepthDtoList(dataSet["data"], "LTCUSD")
-					for dto in dtoList: 
-						self.postDto(dto, "live_crypto_orderbooks")
-				elif curChannel == "ok_sub_spotusd_btc_trades": 
-					print ('A TRADE')
-					completedTradeDtoList = self.getCompletedTradeDtoList(dataSet["data"], "BTCUSD")
-					for dto in completedTradeDtoList: 
-						self.postDto(dto, "live_crypto_trades")
-				elif curChannel == "ok_sub_spotusd_ltc_trades": 
-					completedTradeDtoList = self.getCompletedTradeDtoList(dataSet["data"], "LTCUSD")
-					print (completedTradeDtoList)
-					for dto in completedTradeDtoList: 
-						self.postDto(dto, "live_crypto_trades")
-				elif curChannel in self.klineChannels: 
-					print ("WE IN DA KLINE LIST!")
-					theData = dataSet["data"]
-					dto = self.getKline(theData, curChannel)
-					self.postDto(dto, "live_crypto_candlesticks")
-				elif curChannel in self.futureChannels: 
-					print ("WE ARE IN A FUTURE CHANNEL!")
-					theData = dataSet["data"]
-					dto = self.getFutureTickerMappingDto(theData, curChannel) 
-					print ("CRYPTO FUTURES!!!!")
-					print(dto)
-					self.postDto(dto, "live_crypto_futures_contracts")
-
+				route = self.channelRoutes.get(dataSet["channel"])
+				if route == None: 
+					continue
+				handler, currencyPair, channelType = route
+				handler(dataSet["data"], currencyPair, channelType, stamp)
 			except:
 				pass
->>>>>>> 02425f328ebc1169080e1a01acf6ac27527cb478
-		pass
-
-	def getFutureTickerMappingDto(self, data, channelName): 
-		print("\n\n\n\n\nOOOOOO\n\n---\n\n")
-		futureDto = {}
-		uniqueId = uuid.uuid4()
-		futureDto["uuid"] = str(uniqueId) 
-		recordDate = datetime.datetime.now(TIMEZONE)
-		futureRegex = re.search("ok_sub_futureusd_(b|l)tc_ticker_(.+)", channelName)
-		futureType = futureRegex.group(2)
-		currencySymbol = futureRegex.group(1)
-		futureDto["date"] = recordDate
-		futureDto["buy_price"] = float(data["buy"])
-		futureDto["contract_id"] = str(data["contractId"])
-		futureDto["high_price"] = float(data["high"])
-		futureDto["last_price"] = float(data["last"])
-		futureDto["low_price"] = float(data["low"])
-		futureDto["sell_price"] = float(data["sell"])
-		futureDto["unit_amount"] = float(data["unitAmount"])
-		futureDto["volume"] = float(data["vol"])
-
-		# HACKY AS FUCK but im tired so fuck off
-		currencyPairType = currencySymbol.upper() + "TCUSD"
-		futureDto["currency_pair"] = str(currencyPairType)
-		futureDto["contract_type"] = str(futureType)
-		return futureDto
-		
+
+	def getFutureTickerMappingDto(self, data, currencyPair, contractType, stamp=None): 
+		if stamp == None: 
+			stamp = FrameStamp()
+		return FutureRecord(uuid=nextUuid(), date=stamp, buy_price=float(data["buy"]), contract_id=str(data["contractId"]), high_price=float(data["high"]), last_price=float(data["last"]), low_price=float(data["low"]), sell_price=float(data["sell"]), unit_amount=float(data["unitAmount"]), volume=float(data["vol"]), currency_pair=str(currencyPair), contract_type=str(contractType))
 
 	def getJsonData(self, okcoinData): 
 		tempData = okcoinData
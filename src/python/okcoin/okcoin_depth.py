@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Every ok_sub_spotusd_*_depth_60 push is a full 60 level snapshot.  DepthDiffer
+# remembers the previous snapshot of each pair and only returns the levels that
+# were inserted, changed or removed since then.  Every snapshotInterval seconds
+# the whole snapshot is returned again so the book can be rebuilt from the index.
+
+import time
+
+CHANGE_SNAPSHOT = "snapshot"
+CHANGE_INSERT = "insert"
+CHANGE_UPDATE = "update"
+CHANGE_DELETE = "delete"
+
+DEFAULT_DEPTH_SNAPSHOT_INTERVAL = 60
+
+class DepthDiffer:
+	def __init__(self, snapshotInterval=DEFAULT_DEPTH_SNAPSHOT_INTERVAL):
+		self.snapshotInterval = snapshotInterval
+		self.previous = {}
+		self.lastSnapshot = {}
+
+	# forgets every pair, so the next push of each one is returned as a full snapshot
+	def reset(self):
+		self.previous = {}
+		self.lastSnapshot = {}
+
+	def getLevels(self, dataSet):
+		levels = {}
+		for bid in dataSet["bids"]:
+			if len(bid) == 2:
+				levels[("BID", float(bid[0]))] = float(bid[1])
+		for ask in dataSet["asks"]:
+			if len(ask) == 2:
+				levels[("ASK", float(ask[0]))] = float(ask[1])
+		return levels
+
+	# returns [(order_type, price, volume, change_type), ...], removed levels have a volume of 0
+	def diff(self, currencyPair, dataSet, now=None):
+		levels = self.getLevels(dataSet)
+		previous = self.previous.get(currencyPair)
+		self.previous[currencyPair] = levels
+		if now == None:
+			now = time.time()
+		if previous == None or now - self.lastSnapshot.get(currencyPair, 0) >= self.snapshotInterval:
+			self.lastSnapshot[currencyPair] = now
+			return [(key[0], key[1], volume, CHANGE_SNAPSHOT) for key, volume in levels.items()]
+		changes = []
+		for key, volume in levels.items():
+			previousVolume = previous.get(key)
+			if previousVolume == None:
+				changes.append((key[0], key[1], volume, CHANGE_INSERT))
+			elif previousVolume != volume:
+				changes.append((key[0], key[1], volume, CHANGE_UPDATE))
+		for key in previous:
+			if key not in levels:
+				changes.append((key[0], key[1], 0.0, CHANGE_DELETE))
+		return changes
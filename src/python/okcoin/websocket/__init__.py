@@ -21,5 +21,9 @@ Copyright (C) 2010 Hiroki Ohtani(liris)
 """
 from ._core import *
 from ._app import WebSocketApp
+from ._loop import WebSocketLoop
+import sys
+if sys.version_info >= (3, 5):
+    from ._asyncio import AsyncWebSocket, create_async_connection
 
 __version__ = "0.32.0"
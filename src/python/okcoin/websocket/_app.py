@@ -123,7 +123,7 @@ class WebSocketApp(object):
                     http_proxy_host=None, http_proxy_port=None,
                     http_no_proxy=None, http_proxy_auth=None,
                     skip_utf8_validation=False,
-                    host=None, origin=None):
+                    host=None, origin=None, permessage_deflate=False):
         """
         run event loop for WebSocket framework.
         This loop is infinite loop and is alive during websocket is available.
@@ -141,6 +141,7 @@ class WebSocketApp(object):
         skip_utf8_validation: skip utf8 validation.
         host: update host header.
         origin: update origin header.
+        permessage_deflate: offer the permessage-deflate extension.
         """
 
         if not ping_timeout or ping_timeout <= 0:
@@ -165,7 +166,7 @@ class WebSocketApp(object):
                 http_proxy_port=http_proxy_port,
                 http_no_proxy=http_no_proxy, http_proxy_auth=http_proxy_auth,
                 subprotocols=self.subprotocols,
-                host=host, origin=origin)
+                host=host, origin=origin, permessage_deflate=permessage_deflate)
             self._callback(self.on_open)
 
             if ping_interval:
@@ -175,7 +176,16 @@ class WebSocketApp(object):
                 thread.start()
 
             while self.sock.connected:
-                r, w, e = select.select((self.sock.sock, ), (), (), ping_timeout)
+                # frames that came with the handshake response or in the same
+                # read as an earlier frame are already buffered and select()
+                # cannot see them, so they are handed out before waiting
+                close_frame = self._dispatch_buffered()
+                if close_frame or not self.keep_running or not self.sock.connected:
+                    break
+                if self._has_pending():
+                    r = True
+                else:
+                    r, w, e = select.select((self.sock.sock, ), (), (), ping_timeout)
                 if not self.keep_running:
                     break
                 if ping_timeout and self.last_ping_tm and time.time() - self.last_ping_tm > ping_timeout:
@@ -187,17 +197,7 @@ class WebSocketApp(object):
                     if op_code == ABNF.OPCODE_CLOSE:
                         close_frame = frame
                         break
-                    elif op_code == ABNF.OPCODE_PING:
-                        self._callback(self.on_ping, frame.data)
-                    elif op_code == ABNF.OPCODE_PONG:
-                        self._callback(self.on_pong, frame.data)
-                    elif op_code == ABNF.OPCODE_CONT and self.on_cont_message:
-                        self._callback(self.on_cont_message, frame.data, frame.fin)
-                    else:
-                        data = frame.data
-                        if six.PY3 and frame.opcode == ABNF.OPCODE_TEXT:
-                            data = data.decode("utf-8")
-                        self._callback(self.on_message, data)
+                    self._dispatch(op_code, frame)
         except Exception as e:
             self._callback(self.on_error, e)
         finally:
@@ -210,12 +210,54 @@ class WebSocketApp(object):
                 *self._get_close_args(close_frame.data if close_frame else None))
             self.sock = None
 
+    def _dispatch_buffered(self):
+        """
+        Dispatch every whole frame in the receive buffer without reading
+        from the socket, returns the close frame if one was among them.
+        """
+        while self.keep_running and self.sock.connected and self.sock.frame_buffer.has_frame():
+            result = self.sock.handle_frame(self.sock.recv_frame(), True)
+            if not result:
+                continue
+            op_code, frame = result
+            if op_code == ABNF.OPCODE_CLOSE:
+                return frame
+            self._dispatch(op_code, frame)
+        return None
+
+    def _has_pending(self):
+        """
+        ssl may hold decrypted bytes that select() cannot see.
+        """
+        pending = getattr(self.sock.sock, "pending", None)
+        return bool(pending and pending())
+
+    def _dispatch(self, op_code, frame):
+        """
+        Hand a received message or control frame to its callback.
+        """
+        if op_code == ABNF.OPCODE_PING:
+            self._callback(self.on_ping, frame.data)
+        elif op_code == ABNF.OPCODE_PONG:
+            self._callback(self.on_pong, frame.data)
+        elif op_code == ABNF.OPCODE_CONT and self.on_cont_message:
+            self._callback(self.on_cont_message, frame.data, frame.fin)
+        else:
+            data = frame.data
+            if six.PY3 and frame.opcode == ABNF.OPCODE_TEXT:
+                if frame.text is not None:
+                    data = frame.text
+                else:
+                    data = data.decode("utf-8")
+            self._callback(self.on_message, data)
+
     def _get_close_args(self, data):
         """ this functions extracts the code, reason from the close body
         if they exists, and if the self.on_close except three arguments """
         import inspect
         # if the on_close callback is "old", just return empty list
-        if not self.on_close or len(inspect.getargspec(self.on_close).args) != 3:
+        getargspec = getattr(inspect, "getfullargspec", None) or inspect.getargspec
+        if not self.on_close or len(getargspec(self.on_close).args) != 3:
             return []
 
         if data and len(data) >= 2:
@@ -0,0 +1,303 @@
+"""
+websocket - WebSocket client library for Python
+
+Copyright (C) 2010 Hiroki Ohtani(liris)
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin Street, Fifth Floor,
+    Boston, MA  02110-1335  USA
+
+"""
+
+"""
+asyncio client, for running several feeds in one event loop.
+Needs python 3.5 or later.
+"""
+import asyncio
+import os
+import ssl
+import struct
+
+import six
+
+from ._abnf import *
+from ._exceptions import *
+from ._handshake import handshake_response, _get_handshake_headers, _validate, _get_deflate
+from ._http import parse_headers
+from ._logging import *
+from ._url import parse_url
+
+__all__ = ["AsyncWebSocket", "create_async_connection"]
+
+# bytes asked from the stream per read.
+READ_SIZE = 65536
+
+
+def _ssl_context(sslopt):
+    sslopt = dict(sslopt or {})
+    context = ssl.create_default_context()
+    cert_path = os.path.join(os.path.dirname(__file__), "cacert.pem")
+    if "ca_certs" in sslopt:
+        context.load_verify_locations(sslopt["ca_certs"])
+    elif os.path.isfile(cert_path):
+        context.load_verify_locations(cert_path)
+    if sslopt.get("cert_reqs", ssl.CERT_REQUIRED) == ssl.CERT_NONE:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    else:
+        context.check_hostname = sslopt.get("check_hostname", True)
+    if "certfile" in sslopt:
+        context.load_cert_chain(sslopt["certfile"], sslopt.get("keyfile"))
+    return context
+
+
+class AsyncWebSocket(object):
+    """
+    WebSocket client on asyncio streams. Frames are parsed by the same
+    frame_buffer as the blocking WebSocket, bytes from the stream are fed
+    into it as they arrive.
+
+    >>> ws = await create_async_connection("wss://api2.bitfinex.com:3000/ws")
+    >>> await ws.send('{"event": "subscribe", "channel": "ticker", "pair": "BTCUSD"}')
+    >>> async for message in ws:
+    ...     print(message)
+
+    Pings from the server are answered, a close frame from the server ends
+    the iteration.
+    """
+
+    def __init__(self, reader, writer, handshake_response=None, skip_utf8_validation=False,
+                 fire_cont_frame=False, get_mask_key=None):
+        self.reader = reader
+        self.writer = writer
+        self.handshake_response = handshake_response
+        self.get_mask_key = get_mask_key
+        self.connected = True
+        self.close_frame = None
+        self.ping_task = None
+        self.chunk = six.b("")
+        self.frame_buffer = frame_buffer(None, skip_utf8_validation, self._recv_into)
+        self.cont_frame = continuous_frame(fire_cont_frame, skip_utf8_validation)
+        self.deflate = None
+        if handshake_response is not None:
+            self.frame_buffer.reset(handshake_response.unread)
+            self.deflate = handshake_response.deflate
+            self.frame_buffer.allow_rsv1 = self.deflate is not None
+            self.cont_frame.deflate = self.deflate
+
+    @classmethod
+    async def connect(cls, url, sslopt=None, skip_utf8_validation=False,
+                      fire_cont_frame=False, get_mask_key=None, ping_interval=0,
+                      timeout=None, **options):
+        """
+        Connect to url and do the websocket handshake.
+
+        sslopt: ssl options like the blocking client's, e.g.
+            {"cert_reqs": ssl.CERT_NONE}.
+        ping_interval: send a ping every ping_interval seconds, 0 to not.
+        timeout: seconds allowed for connecting and the handshake.
+        options: "header", "cookie", "origin", "host", "subprotocols" and
+            "permessage_deflate" as for WebSocket.connect. Proxies are not
+            supported.
+        """
+        hostname, port, resource, is_secure = parse_url(url)
+        context = _ssl_context(sslopt) if is_secure else None
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(
+            hostname, port, ssl=context, server_hostname=hostname if is_secure else None), timeout)
+        try:
+            response = await asyncio.wait_for(
+                cls._handshake(reader, writer, hostname, port, resource, options), timeout)
+        except:
+            writer.close()
+            raise
+        ws = cls(reader, writer, response, skip_utf8_validation, fire_cont_frame, get_mask_key)
+        if ping_interval:
+            ws.ping_task = asyncio.ensure_future(ws._send_ping(ping_interval))
+        return ws
+
+    @staticmethod
+    async def _handshake(reader, writer, hostname, port, resource, options):
+        headers, key = _get_handshake_headers(resource, hostname, port, options)
+        header_str = "\r\n".join(headers)
+        writer.write(header_str.encode("utf-8"))
+        dump("request header", header_str)
+
+        # the stream keeps whatever follows the headers for the frame reads
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise WebSocketConnectionClosedException("Connection is already closed.")
+            lines.append(line)
+            if not line.strip():
+                break
+        status, resp = parse_headers(lines)
+        if status != 101:
+            raise WebSocketException("Handshake status %d" % status)
+        success, subproto = _validate(resp, key, options.get("subprotocols"))
+        if not success:
+            raise WebSocketException("Invalid WebSocket Header")
+        return handshake_response(status, resp, subproto, deflate=_get_deflate(resp, options))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        opcode, frame = await self.recv_data_frame()
+        if opcode == ABNF.OPCODE_CLOSE:
+            raise StopAsyncIteration
+        return self._get_message(opcode, frame)
+
+    async def send(self, payload, opcode=ABNF.OPCODE_TEXT):
+        """
+        Send the data and wait until it can be written again.
+
+        payload: Payload must be utf-8 string or unicode,
+                  if the opcode is OPCODE_TEXT.
+                  Otherwise, it must be string(byte array)
+        """
+        frame = ABNF.create_frame(payload, opcode)
+        if self.deflate and self.deflate.compress_enabled and opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+            frame.data = self.deflate.compress(frame.data)
+            frame.rsv1 = 1
+        self.write_frame(frame)
+        await self.writer.drain()
+
+    async def send_binary(self, payload):
+        await self.send(payload, ABNF.OPCODE_BINARY)
+
+    async def ping(self, payload=""):
+        if isinstance(payload, six.text_type):
+            payload = payload.encode("utf-8")
+        await self.send(payload, ABNF.OPCODE_PING)
+
+    def write_frame(self, frame):
+        """
+        Queue a frame on the stream without waiting for it to be sent.
+        """
+        if not self.connected:
+            raise WebSocketConnectionClosedException("socket is already closed.")
+        if self.get_mask_key:
+            frame.get_mask_key = self.get_mask_key
+        self.writer.write(frame.format())
+
+    async def recv(self):
+        """
+        Receive a message, a str for text and bytes for binary ones.
+        """
+        opcode, frame = await self.recv_data_frame()
+        if opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY, ABNF.OPCODE_CONT):
+            return self._get_message(opcode, frame)
+        return ''
+
+    async def recv_data_frame(self, control_frame=False):
+        """
+        Receive the next message, or the next control frame if
+        control_frame is set.
+
+        return value: tuple of operation code and frame.
+        """
+        while True:
+            while not self.frame_buffer.has_frame():
+                await self._read()
+            result = self.handle_frame(self.frame_buffer.recv_frame(), control_frame)
+            if result:
+                return result
+
+    def handle_frame(self, frame, control_frame=False):
+        """
+        Same as WebSocket.handle_frame, replies are queued on the stream.
+        """
+        if frame.opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY, ABNF.OPCODE_CONT):
+            self.cont_frame.validate(frame)
+            self.cont_frame.add(frame)
+
+            if self.cont_frame.is_fire(frame):
+                return self.cont_frame.extract(frame)
+
+        elif frame.opcode == ABNF.OPCODE_CLOSE:
+            self.close_frame = frame
+            if self.connected:
+                self.write_frame(ABNF.create_frame(struct.pack("!H", STATUS_NORMAL), ABNF.OPCODE_CLOSE))
+                self.connected = False
+            return (frame.opcode, frame)
+        elif frame.opcode == ABNF.OPCODE_PING:
+            if len(frame.data) < 126:
+                self.write_frame(ABNF.create_frame(frame.data, ABNF.OPCODE_PONG))
+            else:
+                raise WebSocketProtocolException("Ping message is too long")
+            if control_frame:
+                return (frame.opcode, frame)
+        elif frame.opcode == ABNF.OPCODE_PONG:
+            if control_frame:
+                return (frame.opcode, frame)
+        return None
+
+    async def close(self, status=STATUS_NORMAL, reason=six.b(""), timeout=3):
+        """
+        Send a close frame, wait up to timeout seconds for the server's
+        and close the stream.
+        """
+        if self.ping_task:
+            self.ping_task.cancel()
+            self.ping_task = None
+        try:
+            if self.connected:
+                self.write_frame(ABNF.create_frame(struct.pack("!H", status) + reason, ABNF.OPCODE_CLOSE))
+                self.connected = False
+                await asyncio.wait_for(self._wait_close_frame(), timeout)
+        except Exception:
+            pass
+        self.writer.close()
+
+    async def _wait_close_frame(self):
+        await self.writer.drain()
+        while self.close_frame is None:
+            await self.recv_data_frame(True)
+
+    async def _read(self):
+        data = await self.reader.read(READ_SIZE)
+        if not data:
+            self.connected = False
+            raise WebSocketConnectionClosedException("Connection is already closed.")
+        self.chunk = data
+        while self.chunk:
+            self.frame_buffer.recv_once()
+
+    def _recv_into(self, buffer, nbytes):
+        n = min(nbytes, len(self.chunk))
+        buffer[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+    async def _send_ping(self, interval):
+        while self.connected:
+            await asyncio.sleep(interval)
+            if self.connected:
+                await self.ping()
+
+    def _get_message(self, opcode, frame):
+        if opcode == ABNF.OPCODE_TEXT:
+            if frame.text is not None:
+                return frame.text
+            return frame.data.decode("utf-8")
+        return frame.data
+
+
+async def create_async_connection(url, **options):
+    """
+    Connect to url and return an AsyncWebSocket, see AsyncWebSocket.connect
+    for the options.
+    """
+    return await AsyncWebSocket.connect(url, **options)
@@ -90,6 +90,7 @@ def create_connection(url, timeout=None, **options):
              "subprotocols" - array of available sub protocols.
                               default is None.
              "skip_utf8_validation" - skip utf8 validation.
+             "permessage_deflate" - offer the permessage-deflate extension.
     """
     sockopt = options.get("sockopt", [])
     sslopt = options.get("sslopt", {})
@@ -145,8 +146,10 @@ class WebSocket(object):
 
         self.connected = False
         self.get_mask_key = get_mask_key
+        self.deflate = None
         # These buffer over the build-up of a single frame.
-        self.frame_buffer = frame_buffer(self._recv, skip_utf8_validation)
+        self.frame_buffer = frame_buffer(self._recv, skip_utf8_validation,
+                                         self._recv_into)
         self.cont_frame = continuous_frame(fire_cont_frame, skip_utf8_validation)
 
         if enable_multithread:
@@ -261,12 +264,15 @@ class WebSocket(object):
                                      defualt is None
                  "subprotocols" - array of available sub protocols.
                                   default is None.
+                 "permessage_deflate" - offer the permessage-deflate extension.
 
         """
         self.sock, addrs = connect(url, self.sock_opt, proxy_info(**options))
 
         try:
             self.handshake_response = handshake(self.sock, *addrs, **options)
+            self.frame_buffer.reset(self.handshake_response.unread)
+            self.set_deflate(self.handshake_response.deflate)
             self.connected = True
         except:
             if self.sock:
@@ -286,8 +292,20 @@ class WebSocket(object):
         """
 
         frame = ABNF.create_frame(payload, opcode)
+        if self.deflate and self.deflate.compress_enabled and opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+            frame.data = self.deflate.compress(frame.data)
+            frame.rsv1 = 1
         return self.send_frame(frame)
 
+    def set_deflate(self, deflate):
+        """
+        Use the permessage_deflate contexts for the messages of this
+        connection, None to turn compression off.
+        """
+        self.deflate = deflate
+        self.frame_buffer.allow_rsv1 = deflate is not None
+        self.cont_frame.deflate = deflate
+
     def send_frame(self, frame):
         """
         Send the data frame.
@@ -345,8 +363,11 @@ class WebSocket(object):
 
         return value: string(byte array) value.
         """
-        opcode, data = self.recv_data()
+        opcode, frame = self.recv_data_frame()
+        data = frame.data
         if six.PY3 and opcode == ABNF.OPCODE_TEXT:
+            if frame.text is not None:
+                return frame.text
             return data.decode("utf-8")
         elif opcode == ABNF.OPCODE_TEXT or opcode == ABNF.OPCODE_BINARY:
             return data
@@ -376,30 +397,46 @@ class WebSocket(object):
         """
         while True:
             frame = self.recv_frame()
-            if not frame:
-                # handle error:
-                # 'NoneType' object has no attribute 'opcode'
-                raise WebSocketProtocolException("Not a valid frame %s" % frame)
-            elif frame.opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY, ABNF.OPCODE_CONT):
-                self.cont_frame.validate(frame)
-                self.cont_frame.add(frame)
-
-                if self.cont_frame.is_fire(frame):
-                    return self.cont_frame.extract(frame)
-
-            elif frame.opcode == ABNF.OPCODE_CLOSE:
-                self.send_close()
+            result = self.handle_frame(frame, control_frame)
+            if result:
+                return result
+
+    def handle_frame(self, frame, control_frame=False):
+        """
+        Process one received frame: answer pings and closes and collect
+        fragmented messages.
+
+        control_frame: a boolean flag indicating whether to return control frame
+        data, defaults to False
+
+        return value: tuple of operation code and frame, or None while a
+         message is still incomplete or for a skipped control frame.
+        """
+        if not frame:
+            # handle error:
+            # 'NoneType' object has no attribute 'opcode'
+            raise WebSocketProtocolException("Not a valid frame %s" % frame)
+        elif frame.opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY, ABNF.OPCODE_CONT):
+            self.cont_frame.validate(frame)
+            self.cont_frame.add(frame)
+
+            if self.cont_frame.is_fire(frame):
+                return self.cont_frame.extract(frame)
+
+        elif frame.opcode == ABNF.OPCODE_CLOSE:
+            self.send_close()
+            return (frame.opcode, frame)
+        elif frame.opcode == ABNF.OPCODE_PING:
+            if len(frame.data) < 126:
+                self.pong(frame.data)
+            else:
+                raise WebSocketProtocolException("Ping message is too long")
+            if control_frame:
                 return (frame.opcode, frame)
-            elif frame.opcode == ABNF.OPCODE_PING:
-                if len(frame.data) < 126:
-                    self.pong(frame.data)
-                else:
-                    raise WebSocketProtocolException("Ping message is too long")
-                if control_frame:
-                    return (frame.opcode, frame)
-            elif frame.opcode == ABNF.OPCODE_PONG:
-                if control_frame:
-                    return (frame.opcode, frame)
+        elif frame.opcode == ABNF.OPCODE_PONG:
+            if control_frame:
+                return (frame.opcode, frame)
+        return None
 
     def recv_frame(self):
         """
@@ -480,3 +517,13 @@ class WebSocket(object):
             self.sock = None
             self.connected = False
             raise
+
+    def _recv_into(self, buffer, nbytes):
+        try:
+            return recv_into(self.sock, buffer, nbytes)
+        except WebSocketConnectionClosedException:
+            if self.sock:
+                self.sock.close()
+            self.sock = None
+            self.connected = False
+            raise
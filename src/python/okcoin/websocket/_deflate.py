@@ -0,0 +1,125 @@
+"""
+websocket - WebSocket client library for Python
+
+Copyright (C) 2010 Hiroki Ohtani(liris)
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin Street, Fifth Floor,
+    Boston, MA  02110-1335  USA
+
+"""
+
+"""
+permessage-deflate extension (RFC 7692).
+"""
+import zlib
+
+import six
+
+from ._exceptions import *
+
+__all__ = ["permessage_deflate"]
+
+EXTENSION_NAME = "permessage-deflate"
+# every compressed message ends in an empty stored block, which is left out on the wire.
+_TAIL = six.b("\x00\x00\xff\xff")
+_PARAMS = ("server_no_context_takeover", "client_no_context_takeover",
+           "server_max_window_bits", "client_max_window_bits")
+
+
+class permessage_deflate(object):
+    """
+    Inflate and deflate contexts of one connection. Unless the server
+    asked for no_context_takeover, the contexts live as long as the
+    connection and each message is compressed against the previous ones.
+    """
+
+    # offered in the handshake request.
+    OFFER = EXTENSION_NAME + "; client_max_window_bits"
+
+    def __init__(self, server_no_context_takeover=False, client_no_context_takeover=False,
+                 server_max_window_bits=15, client_max_window_bits=15,
+                 level=zlib.Z_DEFAULT_COMPRESSION):
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        self.server_max_window_bits = server_max_window_bits
+        self.client_max_window_bits = client_max_window_bits
+        self.level = level
+        # zlib cannot make raw deflate streams with a 256 byte window, so we
+        # send uncompressed messages if the server limits us to that.
+        self.compress_enabled = client_max_window_bits > 8
+        self.decompressor = self._decompressor()
+        self.compressor = self._compressor() if self.compress_enabled else None
+
+    @classmethod
+    def accept(cls, value):
+        """
+        Build the contexts from the server's Sec-WebSocket-Extensions
+        response header, raising WebSocketException if it did not accept
+        the extension the way it was offered.
+        """
+        extensions = [e.strip() for e in value.split(",") if e.strip()]
+        if len(extensions) != 1:
+            raise WebSocketException("Unsupported extensions: " + value)
+        params = [p.strip() for p in extensions[0].split(";")]
+        if params[0] != EXTENSION_NAME:
+            raise WebSocketException("Unsupported extensions: " + value)
+
+        options = {}
+        for param in params[1:]:
+            name, _, bits = param.partition("=")
+            name = name.strip()
+            if name not in _PARAMS or name in options:
+                raise WebSocketException("Invalid permessage-deflate parameter: " + param)
+            if name.endswith("_max_window_bits"):
+                try:
+                    bits = int(bits.strip().strip('"'))
+                except ValueError:
+                    bits = 0
+                if not 8 <= bits <= 15:
+                    raise WebSocketException("Invalid permessage-deflate parameter: " + param)
+                options[name] = bits
+            else:
+                options[name] = True
+        return cls(**options)
+
+    def decompress(self, data, fin):
+        """
+        Inflate one fragment of a compressed message, fin tells whether it
+        is the last one.
+        """
+        data = self.decompressor.decompress(data)
+        if fin:
+            data += self.decompressor.decompress(_TAIL)
+            if self.server_no_context_takeover:
+                self.decompressor = self._decompressor()
+        return data
+
+    def compress(self, data):
+        """
+        Deflate a whole message.
+        """
+        data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data.endswith(_TAIL):
+            data = data[:-len(_TAIL)]
+        if self.client_no_context_takeover:
+            self.compressor = self._compressor()
+        return data
+
+    def _decompressor(self):
+        # a window of 8 bits is read fine with zlib's smallest, 9
+        return zlib.decompressobj(-max(self.server_max_window_bits, 9))
+
+    def _compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, -self.client_max_window_bits)
@@ -34,6 +34,7 @@ from ._url import *
 from ._socket import*
 from ._http import *
 from ._exceptions import *
+from ._deflate import permessage_deflate
 
 __all__ = ["handshake_response", "handshake"]
 
@@ -42,10 +43,14 @@ VERSION = 13
 
 
 class handshake_response(object):
-    def __init__(self, status, headers, subprotocol):
+    def __init__(self, status, headers, subprotocol, unread=six.b(""), deflate=None):
         self.status = status
         self.headers = headers
         self.subprotocol = subprotocol
+        # bytes the server sent right after the headers, the start of the first frames.
+        self.unread = unread
+        # permessage_deflate contexts if the server accepted compression.
+        self.deflate = deflate
 
 
 def handshake(sock, hostname, port, resource, **options):
@@ -55,12 +60,13 @@ def handshake(sock, hostname, port, resource, **options):
     send(sock, header_str)
     dump("request header", header_str)
 
-    status, resp = _get_resp_headers(sock)
+    status, resp, unread = _get_resp_headers(sock)
     success, subproto = _validate(resp, key, options.get("subprotocols"))
     if not success:
         raise WebSocketException("Invalid WebSocket Header")
 
-    return handshake_response(status, resp, subproto)
+    return handshake_response(status, resp, subproto, unread,
+                              _get_deflate(resp, options))
 
 
 def _get_handshake_headers(resource, host, port, options):
@@ -91,6 +97,9 @@ def _get_handshake_headers(resource, host, port, options):
     if subprotocols:
         headers.append("Sec-WebSocket-Protocol: %s" % ",".join(subprotocols))
 
+    if options.get("permessage_deflate"):
+        headers.append("Sec-WebSocket-Extensions: %s" % permessage_deflate.OFFER)
+
     if "header" in options:
         headers.extend(options["header"])
 
@@ -106,10 +115,11 @@ def _get_handshake_headers(resource, host, port, options):
 
 
 def _get_resp_headers(sock, success_status=101):
-    status, resp_headers = read_headers(sock)
+    lines, unread = recv_headers(sock)
+    status, resp_headers = parse_headers(lines)
     if status != success_status:
         raise WebSocketException("Handshake status %d" % status)
-    return status, resp_headers
+    return status, resp_headers, unread
 
 _HEADERS_TO_CHECK = {
     "upgrade": "websocket",
@@ -150,6 +160,15 @@ def _validate(headers, key, subprotocols):
         return False, None
 
 
+def _get_deflate(headers, options):
+    extensions = headers.get("sec-websocket-extensions")
+    if not extensions:
+        return None
+    if not options.get("permessage_deflate"):
+        raise WebSocketException("Unrequested extensions: " + extensions)
+    return permessage_deflate.accept(extensions)
+
+
 def _create_sec_websocket_key():
     uid = uuid.uuid4()
     return base64encode(uid.bytes).decode('utf-8').strip()
@@ -37,7 +37,7 @@ from ._socket import*
 from ._exceptions import *
 from ._ssl_compat import *
 
-__all__ = ["proxy_info", "connect", "read_headers"]
+__all__ = ["proxy_info", "connect", "read_headers", "parse_headers"]
 
 class proxy_info(object):
     def __init__(self, **options):
@@ -188,12 +188,15 @@ def _tunnel(sock, host, port, auth):
     return sock
 
 def read_headers(sock):
+    lines, _ = recv_headers(sock)
+    return parse_headers(lines)
+
+def parse_headers(lines):
     status = None
     headers = {}
     trace("--- response header ---")
 
-    while True:
-        line = recv_line(sock)
+    for line in lines:
         line = line.decode('utf-8').strip()
         if not line:
             break
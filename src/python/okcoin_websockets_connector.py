@@ -25,6 +25,9 @@ import os, websocket, time, datetime, sys, json, hashlib, zlib, base64, json, re
 from create_mappings import createMappings
 from pytz import timezone
 from datetime import timedelta
+from es_spool import Spool, DEFAULT_SPOOL_DIR, isRetryable
+from deflate_json import DeflateJsonDecoder
+from doc_ids import getDocumentId, writeDocument, ID_STRATEGIES, DEFAULT_ID_STRATEGY
 OKCOIN_WEBSOCKET_URL = "wss://real.okcoin.com:10440/websocket/okcoinapi"
 
 # UTC ALL THE TIME, FOREVER AND EVER. 
@@ -41,12 +44,20 @@ CANDLE_LIST = [ "ok_btcusd_kline_1min", "ok_btcusd_kline_3min", "ok_btcusd_kline
 FUTURES_CONTRACT_TYPES = ["ok_btcusd_future_ticker_this_week", "ok_btcusd_future_ticker_next_week", "ok_btcusd_future_ticker_quarter"]
 
 es = None
+spool = None
+idStrategy = DEFAULT_ID_STRATEGY
+decoder = DeflateJsonDecoder()
+# seconds between the decode stage timing reports
+DECODE_STATS_INTERVAL = 300
+lastDecodeStats = time.time()
 
 def getArgs(): 
 	parser = argparse.ArgumentParser(description='BTC elastic search data collector')
 	parser.add_argument('--host')
 	parser.add_argument('--forever', action='store_true', default=False)
 	parser.add_argument('--max_records', action='store_true', default=3600)
+	parser.add_argument('--spool_dir', default=os.path.join(DEFAULT_SPOOL_DIR, "okcoin_websockets"))
+	parser.add_argument('--id_strategy', choices=ID_STRATEGIES, default=DEFAULT_ID_STRATEGY)
 
 	# TODO: add more params here
 
@@ -62,17 +73,16 @@ def getJsonData(okcoinData):
 
 
 def on_message(self, event):
-	okcoinData = inflate(event) #data decompress
-	jsonData = getJsonData(okcoinData)
-	print (jsonData)
-	for item in jsonData: 
+	global lastDecodeStats
+	for item in decoder.iterItems(event): 
+		print (item)
 		curChannel = item["channel"]
 		if curChannel == "ok_btcusd_ticker": 
 			injectTickerData(self, event, item)
 		elif curChannel == "ok_btcusd_depth": 
 			processOrderbook(self, event, item) 
 		elif curChannel == "ok_btcusd_trades_v1": 
-			processCompletedTrades(jsonData)
+			processCompletedTrades([item])
 		elif curChannel in CANDLE_LIST: 
 			processCandleStick(curChannel, item)
 		elif curChannel in FUTURES_CONTRACT_TYPES: 
@@ -81,7 +91,9 @@ def on_message(self, event):
 			indexTheFuture(curChannel, item)
 		else: 
 			print("WTF")
-	print("-----") 
+	if time.time() - lastDecodeStats >= DECODE_STATS_INTERVAL: 
+		lastDecodeStats = time.time()
+		print(decoder.formatStats())
 	pass
 
 def indexTheFuture(futureChannel, futureData):
@@ -122,12 +134,23 @@ def processTheFuture(futureType, jsonData):
 	futureDto["contract_type"] = str(futureType)
 	createTheFuture("btc_futures", "ok_btcusd_future_ticker", futureDto)
 
+# Creates the document, or spools it to disk while the cluster is unreachable (returns None in that case)
+def createDocument(index, doctype, body): 
+	docId = getDocumentId(idStrategy, doctype, body)
+	try: 
+		return writeDocument(es, index, doctype, docId, body)
+	except elasticsearch.exceptions.TransportError as e: 
+		if not isRetryable(e): 
+			raise
+		spool.append(index, doctype, docId, body)
+		print("ELASTICSEARCH UNAVAILABLE, " + doctype + " ENTRY SPOOLED TO DISK")
+		return None
+
 def createTheFuture(index, doctype, data): 
-	putNewDocumentRequest = es.create(index=index, doc_type=doctype, ignore=[400], id=uuid.uuid4(), body=data)
-	successful = putNewDocumentRequest["created"]
+	successful = createDocument(index, doctype, data)
 	if successful == True: 
 		print("WEBSOCKET ENTRY FOR " + doctype + " ADDED TO ES CLUSTER")
-	else: 
+	elif successful == False: 
 		print("!! FATAL !!: WEBSOCKET ENTRY NOT ADDED TO ES CLUSTER")
 
 def processCandleStick(candleType, jsonData): 
@@ -149,11 +172,10 @@ def processCandleStick(candleType, jsonData):
 		volVal = str(dataPoint[5])
 		volVal = volVal.replace(",", "")
 		candleDto["volume"] = float(volVal)
-		putNewDocumentRequest = es.create(index="btc_candlesticks", doc_type='ok_coin_candlestick', ignore=[400], id=str(uuid.uuid4()), body=candleDto)	
-		successful = putNewDocumentRequest["created"]
+		successful = createDocument("btc_candlesticks", 'ok_coin_candlestick', candleDto)
 		if successful == True: 
 			print("OKCOIN CANDLESTICK DATA STORED.")
-		else: 
+		elif successful == False: 
 			print("!! FATAL !!: WEBSOCKET ENTRY NOT ADDED TO ES CLUSTER")
 		pass
 
@@ -183,11 +205,10 @@ def processCompletedTrades(jsonData):
 					completedTradeDto["timestamp"] = str(curOrder[3])
 					completedTradeDto["amount"] = theAmount
 					completedTradeDto["order_type"] = theType				
-					putNewDocumentRequest = es.create(index="btc_completed_trades", doc_type='ok_coin_completed_trade', ignore=[400], id=uuid.uuid4(), body=completedTradeDto)	
-					successful = putNewDocumentRequest["created"]
+					successful = createDocument("btc_completed_trades", 'ok_coin_completed_trade', completedTradeDto)
 					if successful == True: 
 						print("OKCOIN COMPLETED ORDER DATA STORED.")
-					else: 
+					elif successful == False: 
 						print("!! FATAL !!: WEBSOCKET ENTRY NOT ADDED TO ES CLUSTER")
 					pass
 
@@ -221,11 +242,10 @@ def processOrderbook(self, event, okcoinData):
 
 
 def addOrderBookItem(self, event, dto, doctype): 
-	putNewDocumentRequest = es.create(index="btc_orderbooks_live", doc_type=doctype, ignore=[400], id=uuid.uuid4(), body=dto)
-	successful = putNewDocumentRequest["created"]
+	successful = createDocument("btc_orderbooks_live", doctype, dto)
 	if successful == True: 
 		print("WEBSOCKET ENTRY FOR " + doctype + " ADDED TO ES CLUSTER")
-	else: 
+	elif successful == False: 
 		print("!! FATAL !!: WEBSOCKET ENTRY NOT ADDED TO ES CLUSTER")
 
 def injectTickerData(self, event, data): 
@@ -255,21 +275,15 @@ def processTickerData(self, event, item):
 	okCoinDto["ask"] = float(askPrice)
 	okCoinDto["low"] = float(lowPrice)
 	okCoinDto["bid"] = float(bidPrice)
-	putNewDocumentRequest = es.create(index="btc_tickers", doc_type='okcoin_ticker', ignore=[400], id=uniqueId, body=okCoinDto)	
-	successful = putNewDocumentRequest["created"]
+	successful = createDocument("btc_tickers", 'okcoin_ticker', okCoinDto)
 	if successful == True: 
 		print("WEBSOCKET ENTRY FOR DOCTYPE: okcoin_ticker ADDED TO ES CLUSTER")
-	else: 
+	elif successful == False: 
 		print("!! FATAL !!: WEBSOCKET ENTRY NOT ADDED TO ES CLUSTER")
 	pass
 
 def inflate(okcoinData):
-    decompressedData = zlib.decompressobj(
-            -zlib.MAX_WBITS 
-    )
-    inflatedData = decompressedData.decompress(okcoinData)
-    inflatedData += decompressedData.flush()
-    return inflatedData
+	return decoder.inflate(okcoinData)
 
 def on_error(self, event):
 	print('ERROR IS: ') 
@@ -285,6 +299,9 @@ if __name__ == "__main__":
 		hostStrip = hostStrip.strip()
 		ELASTICSEARCH_HOST = hostStrip
 	es = elasticsearch.Elasticsearch([ELASTICSEARCH_HOST])
+	idStrategy = args.id_strategy
+	spool = Spool(args.spool_dir)
+	spool.startReplayThread(es)
 	createMappings(es, DEFAULT_INDEX_NAME)
 	websocket.enableTrace(False)
 	ws = websocket.WebSocketApp(OKCOIN_WEBSOCKET_URL, on_message = on_message, on_error = on_error, on_close = on_close)
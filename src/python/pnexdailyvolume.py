@@ -20,15 +20,23 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-import argparse, hmac, hashlib, time, json, urllib, urllib2, requests, pytz, elasticsearch, poloinex, uuid, datetime
-from time import sleep
+import argparse, hmac, hashlib, time, json, urllib, urllib2, requests, pytz, elasticsearch, poloinex, uuid, datetime, os
+from es_spool import Spool, DEFAULT_SPOOL_DIR, isRetryable
+from doc_ids import getDocumentId, writeDocument, ID_STRATEGIES, DEFAULT_ID_STRATEGY
+from rate_scheduler import RateScheduler, FixedRateClock
 ELASTICSEARCH_HOST = "https://search-bitcoins-2sfk7jzreyq3cfjwvia2mj7d4m.us-west-2.es.amazonaws.com/" 
+# seconds between the starts of two polls, poloniex calls also wait for its rate budget
+POLL_INTERVAL = 0.5
+scheduler = RateScheduler()
 
 def getArgs(): 
 	parser = argparse.ArgumentParser(description='BTC elastic search data collector')
 	parser.add_argument('--host', default=ELASTICSEARCH_HOST) 
 	parser.add_argument('--forever', action='store_true', default=False)
 	parser.add_argument('--max_records', action='store_true', default=3600)
+	parser.add_argument('--poll_interval', type=float, default=POLL_INTERVAL)
+	parser.add_argument('--spool_dir', default=os.path.join(DEFAULT_SPOOL_DIR, "poloinex_daily_volume"))
+	parser.add_argument('--id_strategy', choices=ID_STRATEGIES, default=DEFAULT_ID_STRATEGY)
 	args = parser.parse_args()
 	return args
 
@@ -37,7 +45,7 @@ def getIndeces(elasticHost):
 
 def getDtoList(connector): 
 	dtoList = []
-	tickerData = connector.return24Volume()
+	tickerData = scheduler.call("poloniex", "return24Volume", connector.return24Volume)
 	for item in tickerData: 
 		dto = {}
 		uniqueId = uuid.uuid4()
@@ -80,8 +88,16 @@ def putMapping(es, indexName, docType):
 		raise 
 
 def injectData(es, indexName, docType, docBody, conDocs): 	
-	putNewDocumentRequest = es.create(index=indexName, doc_type=docType, ignore=[400], id=uuid.uuid4(), body=docBody)
-	successful = putNewDocumentRequest["created"]
+	docId = getDocumentId(args.id_strategy, docType, docBody)
+	try: 
+		successful = writeDocument(es, indexName, docType, docId, docBody)
+	except elasticsearch.exceptions.TransportError as e: 
+		if not isRetryable(e): 
+			raise
+		# cluster is down, the document is replayed from disk once it is back
+		spool.append(indexName, docType, docId, docBody)
+		print "ES cluster unavailable, spooled data for " + docType + " to disk"
+		return
 	if successful == True: 
 		print "Added data for " + docType + " (docs consecutively added this run: " + str(conDocs) + ")"
 	else: 
@@ -94,12 +110,15 @@ if __name__ == "__main__":
 	#print args.host
 	conDocs = 0
 	es = elasticsearch.Elasticsearch(args.host, verify_certs=True) 
+	spool = Spool(args.spool_dir)
+	spool.startReplayThread(es)
 	createIndex(es, indexName) 
 	putMapping(es, indexName, docType) 
 	connector = poloinex.poloniex("", "")
+	clock = FixedRateClock(args.poll_interval)
 	while 1 == 1: 
+		clock.wait()
 		tickerData = getDtoList(connector)
-		sleep(0.5)
 		for dataPoint in tickerData: 
 			conDocs = conDocs + 1
 			injectData(es, indexName, docType, dataPoint, conDocs)
\ No newline at end of file
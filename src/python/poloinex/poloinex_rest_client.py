@@ -21,19 +21,51 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import urllib
-import urllib2
+import os
+import sys
 import json
 import time
 import hmac,hashlib
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib import urlencode
+except ImportError:
+    # Python 3
+    from urllib.parse import urlencode
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_sessions import getSession, DEFAULT_REQUEST_TIMEOUT
+from rate_scheduler import RateScheduler, THROTTLE_STATUSES, DEFAULT_MAX_RETRIES
+
+PUBLIC_API_URL = "https://poloniex.com/public"
+TRADING_API_URL = "https://poloniex.com/tradingApi"
+# requests in flight at once for returnOrderBooks / returnMarketTradeHistories, the scheduler still caps the rate
+DEFAULT_PARALLEL_REQUESTS = 6
+
+class PoloinexApiError(IOError):
+    pass
 
 def createTimeStamp(datestr, format="%Y-%m-%d %H:%M:%S"):
     return time.mktime(time.strptime(datestr, format))
 
+# Every call goes through the kept-alive HTTPS session of poloniex.com (see
+# http_sessions.py) with gzip on, so the TLS handshake is paid once per
+# session and the books come over the wire compressed.  json.load reads the
+# inflated body whole and then parses it, it is not a streaming parser.
+# Calls wait for the poloniex budget of the rate scheduler, so the parallel
+# sweeps below stay under the exchange's limit however many pairs they cover.
 class PoloinexRestClient:
-    def __init__(self, APIKey, Secret):
+    def __init__(self, APIKey, Secret, scheduler=None, parallelRequests=DEFAULT_PARALLEL_REQUESTS, publicUrl=PUBLIC_API_URL, tradingUrl=TRADING_API_URL):
         self.APIKey = APIKey
         self.Secret = Secret
+        if scheduler == None:
+            scheduler = RateScheduler()
+        self.scheduler = scheduler
+        self.parallelRequests = parallelRequests
+        self.publicUrl = publicUrl
+        self.tradingUrl = tradingUrl
+        self.pool = None
 
     def post_process(self, before):
         after = before
@@ -48,32 +80,63 @@ class PoloinexRestClient:
                             
         return after
 
+    # sends the request, retrying throttled answers, and parses the gzip inflated body
+    def send(self, command, method, url, **kwargs):
+        session = getSession(url)
+        for attempt in range(DEFAULT_MAX_RETRIES + 1):
+            self.scheduler.acquire("poloniex", command)
+            response = session.request(method, url, stream=True, timeout=DEFAULT_REQUEST_TIMEOUT, **kwargs)
+            self.scheduler.report("poloniex", response.status_code, response.headers.get("Retry-After"))
+            if response.status_code not in THROTTLE_STATUSES or attempt == DEFAULT_MAX_RETRIES:
+                break
+            response.close()
+        if response.status_code >= 400:
+            response.close()
+            raise PoloinexApiError("poloniex " + command + " failed with status " + str(response.status_code))
+        # the raw stream inflates gzip itself, json reads it to the end so the connection goes back to the pool
+        response.raw.decode_content = True
+        try:
+            result = json.load(response.raw)
+        except ValueError:
+            # a body that is not json leaves the stream half read, the connection cannot be reused
+            response.close()
+            raise
+        response.raw.release_conn()
+        return result
+
     def api_query(self, command, req={}):
 
         if(command == "returnTicker" or command == "return24Volume"):
-            ret = urllib2.urlopen(urllib2.Request('https://poloniex.com/public?command=' + command))
-            return json.loads(ret.read())
+            return self.send(command, "GET", self.publicUrl, params={'command': command})
         elif(command == "returnOrderBook"):
-            ret = urllib2.urlopen(urllib2.Request('http://poloniex.com/public?command=' + command + '&currencyPair=' + str(req['currencyPair'])))
-            return json.loads(ret.read())
+            params = {'command': command, 'currencyPair': str(req['currencyPair'])}
+            if req.get('depth') != None:
+                params['depth'] = str(req['depth'])
+            return self.send(command, "GET", self.publicUrl, params=params)
         elif(command == "returnMarketTradeHistory"):
-            ret = urllib2.urlopen(urllib2.Request('http://poloniex.com/public?command=' + "returnTradeHistory" + '&currencyPair=' + str(req['currencyPair'])))
-            return json.loads(ret.read())
+            return self.send(command, "GET", self.publicUrl, params={'command': "returnTradeHistory", 'currencyPair': str(req['currencyPair'])})
         else:
             req['command'] = command
             req['nonce'] = int(time.time()*1000)
-            post_data = urllib.urlencode(req)
+            post_data = urlencode(req)
 
             sign = hmac.new(self.Secret, post_data, hashlib.sha512).hexdigest()
             headers = {
                 'Sign': sign,
-                'Key': self.APIKey
+                'Key': self.APIKey,
+                'Content-Type': 'application/x-www-form-urlencoded'
             }
 
-            ret = urllib2.urlopen(urllib2.Request('https://poloniex.com/tradingApi', post_data, headers))
-            jsonRet = json.loads(ret.read())
+            jsonRet = self.send(command, "POST", self.tradingUrl, data=post_data, headers=headers)
             return self.post_process(jsonRet)
 
+    # runs fn for every pair on the request pool, returns {pair: result}
+    def map_pairs(self, fn, currencyPairs):
+        if self.pool == None:
+            self.pool = ThreadPool(self.parallelRequests)
+        currencyPairs = list(currencyPairs)
+        return dict(zip(currencyPairs, self.pool.map(fn, currencyPairs)))
+
 
     def returnTicker(self):
         return self.api_query("returnTicker")
@@ -81,12 +144,21 @@ class PoloinexRestClient:
     def return24Volume(self):
         return self.api_query("return24Volume")
 
-    def returnOrderBook (self, currencyPair):
-        return self.api_query("returnOrderBook", {'currencyPair': currencyPair})
+    # currencyPair "all" returns the books of every market in one call, depth limits the levels per side
+    def returnOrderBook (self, currencyPair, depth=None):
+        return self.api_query("returnOrderBook", {'currencyPair': currencyPair, 'depth': depth})
 
     def returnMarketTradeHistory (self, currencyPair):
         return self.api_query("returnMarketTradeHistory", {'currencyPair': currencyPair})
 
+    # the books of the given pairs fetched in parallel, {pair: book}
+    def returnOrderBooks (self, currencyPairs, depth=None):
+        return self.map_pairs(lambda currencyPair: self.returnOrderBook(currencyPair, depth), currencyPairs)
+
+    # the recent trades of the given pairs fetched in parallel, {pair: trades}
+    def returnMarketTradeHistories (self, currencyPairs):
+        return self.map_pairs(self.returnMarketTradeHistory, currencyPairs)
+
 
     # Returns all of your balances.
     # Outputs: 
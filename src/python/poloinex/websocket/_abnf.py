@@ -24,7 +24,21 @@ import array
 import struct
 import os
 from ._exceptions import *
-from ._utils import validate_utf8
+from ._utils import validate_utf8, decode_utf8
+
+try:
+    # optional C accelerator, see https://github.com/methane/wsaccel
+    from wsaccel.xormask import XorMaskerSimple
+except ImportError:
+    XorMaskerSimple = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# below this payload size numpy's per-call overhead costs more than it saves.
+NUMPY_MASK_THRESHOLD = 4096
 
 # closing frame status codes.
 STATUS_NORMAL = 1000
@@ -101,14 +115,20 @@ class ABNF(object):
         if data == None:
             data = ""
         self.data = data
+        # decoded payload of a validated text message, so it is decoded once.
+        self.text = None
         self.get_mask_key = os.urandom
 
-    def validate(self, skip_utf8_validation=False):
+    def validate(self, skip_utf8_validation=False, allow_rsv1=False):
         """
         validate the ABNF frame.
         skip_utf8_validation: skip utf8 validation.
+        allow_rsv1: permessage-deflate is on, the first frame of a message
+         may have rsv1 set.
         """
-        if self.rsv1 or self.rsv2 or self.rsv3:
+        if self.rsv2 or self.rsv3:
+            raise WebSocketProtocolException("rsv is not implemented, yet")
+        if self.rsv1 and not (allow_rsv1 and self.opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY)):
             raise WebSocketProtocolException("rsv is not implemented, yet")
 
         if self.opcode not in ABNF.OPCODES:
@@ -214,27 +234,67 @@ class ABNF(object):
         if isinstance(data, six.text_type):
             data = six.b(data)
 
+        if XorMaskerSimple:
+            return XorMaskerSimple(mask_key).process(data)
+        if numpy and len(data) >= NUMPY_MASK_THRESHOLD:
+            return _mask_numpy(mask_key, data)
+        if six.PY3:
+            return _mask_int(mask_key, data)
+
         _m = array.array("B", mask_key)
         _d = array.array("B", data)
         for i in range(len(_d)):
             _d[i] ^= _m[i % 4]
+        return _d.tostring()
 
-        if six.PY3:
-            return _d.tobytes()
-        else:
-            return _d.tostring()
+
+def _mask_int(mask_key, data):
+    """
+    xor the whole payload at once as one big integer against the mask key
+    repeated to the payload length.
+    """
+    length = len(data)
+    if not length:
+        return b""
+    key = (mask_key * (length // 4 + 1))[:length]
+    masked = int.from_bytes(data, "little") ^ int.from_bytes(key, "little")
+    return masked.to_bytes(length, "little")
+
+
+def _mask_numpy(mask_key, data):
+    """
+    xor the payload 4 bytes at a time, padding it to a multiple of 4 first.
+    """
+    length = len(data)
+    padding = -length % 4
+    words = numpy.frombuffer(bytes(data) + b"\x00" * padding, dtype=numpy.uint32)
+    key = numpy.frombuffer(bytes(mask_key), dtype=numpy.uint32)
+    return numpy.bitwise_xor(words, key).tobytes()[:length]
 
 
 class frame_buffer(object):
     _HEADER_MASK_INDEX = 5
     _HEADER_LENGHT_INDEX = 6
+    # initial size of the receive buffer, it grows to fit the largest frame seen.
+    _RECV_BUFFER_SIZE = 65536
 
-    def __init__(self, recv_fn, skip_utf8_validation):
+    def __init__(self, recv_fn, skip_utf8_validation, recv_into_fn=None):
         self.recv = recv_fn
+        if recv_into_fn is None:
+            recv_into_fn = self._recv_into_from_recv
+        self.recv_into = recv_into_fn
         self.skip_utf8_validation = skip_utf8_validation
         # Buffers over the packets from the layer beneath until desired amount
-        # bytes of bytes are received.
-        self.recv_buffer = []
+        # bytes of bytes are received. Unread bytes live in
+        # recv_buffer[recv_start:recv_end], sockets read straight into the
+        # free space behind them so nothing is copied until a payload is
+        # handed out.
+        self.recv_buffer = bytearray(frame_buffer._RECV_BUFFER_SIZE)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.recv_start = 0
+        self.recv_end = 0
+        # set once permessage-deflate is negotiated
+        self.allow_rsv1 = False
         self.clear()
 
     def clear(self):
@@ -242,25 +302,33 @@ class frame_buffer(object):
         self.length = None
         self.mask = None
 
+    def reset(self, data=six.b("")):
+        """
+        Drop whatever is buffered and start over with data, the bytes
+        already read from a new connection.
+        """
+        self.clear()
+        if len(data) > len(self.recv_buffer):
+            self.recv_buffer = bytearray(len(data))
+            self.recv_view = memoryview(self.recv_buffer)
+        self.recv_buffer[:len(data)] = data
+        self.recv_start = 0
+        self.recv_end = len(data)
+
     def has_received_header(self):
         return  self.header is None
 
     def recv_header(self):
-        header = self.recv_strict(2)
-        b1 = header[0]
-
-        if six.PY2:
-            b1 = ord(b1)
+        self._fill(2)
+        b1 = self.recv_buffer[self.recv_start]
+        b2 = self.recv_buffer[self.recv_start + 1]
+        self.recv_start += 2
 
         fin = b1 >> 7 & 1
         rsv1 = b1 >> 6 & 1
         rsv2 = b1 >> 5 & 1
         rsv3 = b1 >> 4 & 1
         opcode = b1 & 0xf
-        b2 = header[1]
-
-        if six.PY2:
-            b2 = ord(b2)
 
         has_mask = b2 >> 7 & 1
         length_bits = b2 & 0x7f
@@ -280,11 +348,13 @@ class frame_buffer(object):
         bits = self.header[frame_buffer._HEADER_LENGHT_INDEX]
         length_bits = bits & 0x7f
         if length_bits == 0x7e:
-            v = self.recv_strict(2)
-            self.length = struct.unpack("!H", v)[0]
+            self._fill(2)
+            self.length = struct.unpack_from("!H", self.recv_buffer, self.recv_start)[0]
+            self.recv_start += 2
         elif length_bits == 0x7f:
-            v = self.recv_strict(8)
-            self.length = struct.unpack("!Q", v)[0]
+            self._fill(8)
+            self.length = struct.unpack_from("!Q", self.recv_buffer, self.recv_start)[0]
+            self.recv_start += 8
         else:
             self.length = length_bits
 
@@ -319,30 +389,104 @@ class frame_buffer(object):
         self.clear()
 
         frame = ABNF(fin, rsv1, rsv2, rsv3, opcode, has_mask, payload)
-        frame.validate(self.skip_utf8_validation)
+        frame.validate(self.skip_utf8_validation, self.allow_rsv1)
 
         return frame
 
     def recv_strict(self, bufsize):
-        shortage = bufsize - sum(len(x) for x in self.recv_buffer)
-        while shortage > 0:
-            # Limit buffer size that we pass to socket.recv() to avoid
-            # fragmenting the heap -- the number of bytes recv() actually
-            # reads is limited by socket buffer and is relatively small,
-            # yet passing large numbers repeatedly causes lots of large
-            # buffers allocated and then shrunk, which results in fragmentation.
-            bytes = self.recv(min(16384, shortage))
-            self.recv_buffer.append(bytes)
-            shortage -= len(bytes)
-
-        unified = six.b("").join(self.recv_buffer)
-
-        if shortage == 0:
-            self.recv_buffer = []
-            return unified
+        self._fill(bufsize)
+        start = self.recv_start
+        self.recv_start += bufsize
+        data = self.recv_view[start:self.recv_start].tobytes()
+        if self.recv_start == self.recv_end:
+            self.recv_start = self.recv_end = 0
+        return data
+
+    def recv_once(self):
+        """
+        Do a single read into the buffer, for callers that only read once
+        select() reports the socket readable.
+
+        return value: the number of bytes read.
+        """
+        if self.recv_end == len(self.recv_buffer):
+            available = self.recv_end - self.recv_start
+            # compact, or grow if the buffer is full of one unfinished frame
+            size = len(self.recv_buffer) * 2 if self.recv_start == 0 else len(self.recv_buffer)
+            unread = self.recv_view[self.recv_start:self.recv_end].tobytes()
+            if size > len(self.recv_buffer):
+                self.recv_buffer = bytearray(size)
+                self.recv_view = memoryview(self.recv_buffer)
+            self.recv_buffer[:available] = unread
+            self.recv_start = 0
+            self.recv_end = available
+        n = self.recv_into(self.recv_view[self.recv_end:], len(self.recv_buffer) - self.recv_end)
+        self.recv_end += n
+        return n
+
+    def has_frame(self):
+        """
+        Tell whether a whole frame is buffered, so that recv_frame can
+        return it without reading from the socket.
+        """
+        buf = self.recv_buffer
+        pos = self.recv_start
+        available = self.recv_end - pos
+        if self.header is None:
+            if available < 2:
+                return False
+            has_mask = buf[pos + 1] >> 7 & 1
+            length_bits = buf[pos + 1] & 0x7f
+            pos += 2
         else:
-            self.recv_buffer = [unified[bufsize:]]
-            return unified[:bufsize]
+            has_mask = self.header[frame_buffer._HEADER_MASK_INDEX]
+            length_bits = self.header[frame_buffer._HEADER_LENGHT_INDEX]
+        length = self.length
+        if length is None:
+            if length_bits == 0x7e:
+                if self.recv_end - pos < 2:
+                    return False
+                length = struct.unpack_from("!H", buf, pos)[0]
+                pos += 2
+            elif length_bits == 0x7f:
+                if self.recv_end - pos < 8:
+                    return False
+                length = struct.unpack_from("!Q", buf, pos)[0]
+                pos += 8
+            else:
+                length = length_bits
+        if self.mask is None and has_mask:
+            pos += 4
+        return self.recv_end - pos >= length
+
+    def _fill(self, bufsize):
+        """
+        Make sure at least bufsize unread bytes are in the receive buffer.
+        """
+        available = self.recv_end - self.recv_start
+        if available >= bufsize:
+            return
+        if self.recv_start + bufsize > len(self.recv_buffer):
+            # not enough room behind the unread bytes, move them to the front
+            # and grow the buffer if the frame is bigger than it.
+            size = max(len(self.recv_buffer), bufsize)
+            unread = self.recv_view[self.recv_start:self.recv_end].tobytes()
+            if size > len(self.recv_buffer):
+                self.recv_buffer = bytearray(size)
+                self.recv_view = memoryview(self.recv_buffer)
+            self.recv_buffer[:available] = unread
+            self.recv_start = 0
+            self.recv_end = available
+
+        while self.recv_end - self.recv_start < bufsize:
+            free = len(self.recv_buffer) - self.recv_end
+            # read straight into the buffer, several frames may arrive at once.
+            self.recv_end += self.recv_into(self.recv_view[self.recv_end:], free)
+
+    def _recv_into_from_recv(self, buffer, nbytes):
+        data = self.recv(nbytes)
+        buffer[:len(data)] = data
+        return len(data)
 
 
 class continuous_frame(object):
@@ -351,6 +495,9 @@ class continuous_frame(object):
         self.skip_utf8_validation = skip_utf8_validation
         self.cont_data = None
         self.recving_frames = None
+        # permessage_deflate contexts, and whether the current message is compressed
+        self.deflate = None
+        self.compressed = False
 
     def validate(self, frame):
         if not self.recving_frames and frame.opcode == ABNF.OPCODE_CONT:
@@ -359,6 +506,13 @@ class continuous_frame(object):
             raise WebSocketProtocolException("Illegal frame")
 
     def add(self, frame):
+        if frame.opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+            self.compressed = bool(frame.rsv1 and self.deflate)
+        if self.compressed:
+            # inflated fragment by fragment, so fire_cont_frame gets plain data too
+            frame.data = self.deflate.decompress(frame.data, frame.fin)
+            frame.rsv1 = 0
+
         if self.cont_data:
             self.cont_data[1] += frame.data
         else:
@@ -376,7 +530,11 @@ class continuous_frame(object):
         data = self.cont_data
         self.cont_data = None
         frame.data = data[1]
-        if not self.fire_cont_frame and data[0] == ABNF.OPCODE_TEXT and not self.skip_utf8_validation and not validate_utf8(frame.data):
-            raise WebSocketPayloadException("cannot decode: " + repr(frame.data))
+        if not self.fire_cont_frame and data[0] == ABNF.OPCODE_TEXT and not self.skip_utf8_validation:
+            # validated on the joined message, so sequences split between
+            # fragments are fine.
+            valid, frame.text = decode_utf8(frame.data)
+            if not valid:
+                raise WebSocketPayloadException("cannot decode: " + repr(frame.data))
 
         return [data[0], frame]
@@ -0,0 +1,268 @@
+"""
+websocket - WebSocket client library for Python
+
+Copyright (C) 2010 Hiroki Ohtani(liris)
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin Street, Fifth Floor,
+    Boston, MA  02110-1335  USA
+
+"""
+
+"""
+WebSocketLoop runs many WebSocketApp connections from one thread.
+"""
+import heapq
+import socket
+import threading
+import time
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+from ._core import WebSocket, getdefaulttimeout
+from ._abnf import ABNF
+from ._exceptions import *
+from ._logging import *
+
+__all__ = ["WebSocketLoop"]
+
+_PING = 0
+_PING_TIMEOUT = 1
+
+
+class _connection(object):
+    def __init__(self, app, ping_interval, ping_timeout, options):
+        self.app = app
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.options = options
+        self.fd = None
+        self.last_ping_tm = 0
+        self.last_pong_tm = 0
+        self.close_frame = None
+
+
+class WebSocketLoop(object):
+    """
+    Event loop for any number of WebSocketApp objects in one thread.
+    The sockets are watched with the selectors module (epoll on Linux),
+    each readable socket gets a single read into its frame_buffer and the
+    frames that are complete are handed to the app's callbacks, the same
+    ones WebSocketApp.run_forever calls.
+
+    loop = WebSocketLoop()
+    loop.add(WebSocketApp(url1, on_message=on_message), ping_interval=30)
+    loop.add(WebSocketApp(url2, on_message=on_message), ping_interval=30)
+    loop.run_forever()
+    """
+    def __init__(self, selector=None):
+        """
+        selector: a selectors.BaseSelector, defaults to selectors.DefaultSelector.
+        """
+        if selectors is None:
+            raise WebSocketException("WebSocketLoop needs the selectors module")
+        self.selector = selector or selectors.DefaultSelector()
+        self.keep_running = True
+        self.connections = {}
+        self.pending = []
+        self.timers = []
+        self.timer_count = 0
+        self.lock = threading.Lock()
+        # written to by add() and stop() to wake up a select() from other threads
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ, None)
+
+    def add(self, app, ping_interval=0, ping_timeout=None,
+            sockopt=None, sslopt=None, skip_utf8_validation=False, **options):
+        """
+        Add a WebSocketApp to the loop. It is connected from the loop
+        thread, where all its callbacks are called as well.
+        ping_interval: automatically send "ping" command
+            every specified period(second)
+            if set to 0, not send automatically.
+        ping_timeout: timeout(second) if the pong message is not recieved.
+        the other arguments are the same as WebSocketApp.run_forever's.
+        """
+        if app.sock:
+            raise WebSocketException("socket is already opened")
+        if not ping_timeout or ping_timeout <= 0:
+            ping_timeout = None
+        options["sockopt"] = sockopt
+        options["sslopt"] = sslopt
+        options["skip_utf8_validation"] = skip_utf8_validation
+        with self.lock:
+            self.pending.append(_connection(app, ping_interval, ping_timeout, options))
+        self._wakeup()
+
+    def remove(self, app):
+        """
+        Close the connection of app. Safe to call from any thread.
+        """
+        app.keep_running = False
+        self._wakeup()
+
+    def stop(self):
+        """
+        Make run_forever return after closing all connections.
+        """
+        self.keep_running = False
+        self._wakeup()
+
+    def run_forever(self):
+        """
+        Run the loop until stop() is called.
+        """
+        try:
+            while self.keep_running:
+                self._connect_pending()
+                for key, mask in self.selector.select(self._run_timers()):
+                    if key.data is None:
+                        self._drain_wakeup()
+                    elif key.data.fd in self.connections:
+                        self._read(key.data)
+                for conn in list(self.connections.values()):
+                    sock = conn.app.sock
+                    if not conn.app.keep_running or not sock or not sock.connected:
+                        self._close(conn)
+        finally:
+            for conn in list(self.connections.values()):
+                self._close(conn)
+            self.selector.close()
+            self.wakeup_recv.close()
+            self.wakeup_send.close()
+
+    def _wakeup(self):
+        try:
+            self.wakeup_send.send(b"\0")
+        except socket.error:
+            pass
+
+    def _drain_wakeup(self):
+        try:
+            while self.wakeup_recv.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def _connect_pending(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+        for conn in pending:
+            app = conn.app
+            options = dict(conn.options)
+            try:
+                app.sock = WebSocket(app.get_mask_key,
+                    sockopt=options.pop("sockopt"), sslopt=options.pop("sslopt"),
+                    fire_cont_frame=app.on_cont_message and True or False,
+                    skip_utf8_validation=options.pop("skip_utf8_validation"))
+                app.sock.settimeout(getdefaulttimeout())
+                app.sock.connect(app.url, header=app.header, cookie=app.cookie,
+                    subprotocols=app.subprotocols, **options)
+            except Exception as e:
+                app._callback(app.on_error, e)
+                self._close(conn)
+                continue
+
+            conn.fd = app.sock.fileno()
+            self.connections[conn.fd] = conn
+            self.selector.register(conn.fd, selectors.EVENT_READ, conn)
+            app._callback(app.on_open)
+            if conn.ping_interval:
+                self._schedule(time.time() + conn.ping_interval, conn, _PING)
+            # frames sent together with the handshake response are already buffered
+            self._process(conn)
+
+    def _read(self, conn):
+        sock = conn.app.sock
+        try:
+            sock.frame_buffer.recv_once()
+            # ssl may hold decrypted bytes that select() cannot see
+            while sock.sock and getattr(sock.sock, "pending", None) and sock.sock.pending():
+                sock.frame_buffer.recv_once()
+            self._process(conn)
+        except Exception as e:
+            conn.app._callback(conn.app.on_error, e)
+            self._close(conn)
+
+    def _process(self, conn):
+        app = conn.app
+        sock = app.sock
+        while app.keep_running and sock.connected and sock.frame_buffer.has_frame():
+            result = sock.handle_frame(sock.recv_frame(), True)
+            if not result:
+                continue
+            op_code, frame = result
+            if op_code == ABNF.OPCODE_CLOSE:
+                conn.close_frame = frame
+                self._close(conn)
+                return
+            if op_code == ABNF.OPCODE_PONG:
+                conn.last_pong_tm = time.time()
+            app._dispatch(op_code, frame)
+
+    def _close(self, conn):
+        app = conn.app
+        if self.connections.get(conn.fd) is conn:
+            del self.connections[conn.fd]
+            try:
+                self.selector.unregister(conn.fd)
+            except (KeyError, ValueError):
+                pass
+        if app.sock:
+            if not conn.close_frame and not (app.keep_running and self.keep_running):
+                # we are the ones closing, say so to the server
+                app.sock.close()
+            else:
+                app.sock.shutdown()
+        app._callback(app.on_close,
+            *app._get_close_args(conn.close_frame.data if conn.close_frame else None))
+        app.sock = None
+
+    def _schedule(self, when, conn, action):
+        self.timer_count += 1
+        heapq.heappush(self.timers, (when, self.timer_count, conn, action))
+
+    def _run_timers(self):
+        """
+        Send the pings that are due and return the seconds until the next one.
+        """
+        now = time.time()
+        while self.timers and self.timers[0][0] <= now:
+            when, _, conn, action = heapq.heappop(self.timers)
+            if self.connections.get(conn.fd) is not conn:
+                continue
+            if action == _PING:
+                try:
+                    conn.last_ping_tm = now
+                    conn.app.sock.ping()
+                except Exception as e:
+                    conn.app._callback(conn.app.on_error, e)
+                    self._close(conn)
+                    continue
+                self._schedule(now + conn.ping_interval, conn, _PING)
+                if conn.ping_timeout:
+                    self._schedule(now + conn.ping_timeout, conn, _PING_TIMEOUT)
+            elif conn.last_pong_tm < when - conn.ping_timeout:
+                # no pong since the ping this timer was set for
+                conn.app._callback(conn.app.on_error, WebSocketTimeoutException("ping timed out"))
+                self._close(conn)
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - now)
@@ -22,7 +22,7 @@ Copyright (C) 2010 Hiroki Ohtani(liris)
 
 import six
 
-__all__ = ["NoLock", "validate_utf8", "extract_err_message"]
+__all__ = ["NoLock", "validate_utf8", "decode_utf8", "extract_err_message"]
 
 class NoLock(object):
     def __enter__(self):
@@ -66,12 +66,7 @@ def _decode(state, codep, ch):
 
     return state, codep;
 
-def validate_utf8(utfbytes):
-    """
-    validate utf8 byte string.
-    utfbytes: utf byte string to check.
-    return value: if valid utf8 string, return true. Otherwise, return false.
-    """
+def _validate_utf8_dfa(utfbytes):
     state = UTF8_ACCEPT
     codep = 0
     for i in utfbytes:
@@ -84,5 +79,35 @@ def validate_utf8(utfbytes):
     return True
 
 
+def decode_utf8(utfbytes):
+    """
+    validate and decode utf8 byte string in one pass.
+    utfbytes: utf byte string to check.
+    return value: tuple of (valid, text). text is the decoded unicode
+     string, or None when the bytes could not be decoded. As with the DFA,
+     bytes that end in the middle of a multi byte sequence are valid, the
+     rest of it may be in the next fragment, but they have no text.
+    """
+    if six.PY2:
+        # python 2's codec accepts encoded surrogates, keep the DFA there.
+        return _validate_utf8_dfa(utfbytes), None
+
+    try:
+        return True, utfbytes.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # the codec reports the first bad sequence, if that is an incomplete
+        # one at the very end everything before it was valid.
+        return e.end == len(utfbytes) and e.reason == "unexpected end of data", None
+
+
+def validate_utf8(utfbytes):
+    """
+    validate utf8 byte string.
+    utfbytes: utf byte string to check.
+    return value: if valid utf8 string, return true. Otherwise, return false.
+    """
+    return decode_utf8(utfbytes)[0]
+
+
 def extract_err_message(exception):
     return getattr(exception, 'strerror', str(exception))
@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Paces the REST pollers against the request budget of each exchange instead
+# of sleeping a fixed time after every poll.
+#
+# Every exchange has a token bucket that refills at rate tokens per second up
+# to burst tokens, and every endpoint costs a number of tokens (1 unless it is
+# listed in ENDPOINT_COSTS).  acquire() blocks until the exchange can afford
+# the call, so any number of threads polling the same exchange share one
+# budget.  A 429 or 503 answer halves the refill rate of that exchange and
+# pauses it for Retry-After (or cooldown) seconds, every successful call after
+# that wins back recoveryStep of the configured rate until it is reached again.
+#
+# FixedRateClock fires polls at start + n * interval, so the time a poll takes
+# is not added to the period and the schedule does not drift.  A poll that
+# overruns skips the ticks it missed rather than firing them in a burst.
+
+import time, threading
+from http_sessions import getSession, DEFAULT_REQUEST_TIMEOUT
+
+# (tokens per second, burst) per exchange
+EXCHANGE_LIMITS = {
+	"bitfinex": (1.0, 10),
+	"okcoin": (3.0, 6),
+	"kraken": (1.0, 2),
+	"poloniex": (6.0, 6)
+}
+# tokens per call of the endpoints that cost more than one
+ENDPOINT_COSTS = {
+	"kraken": { "/0/public/Trades": 2, "/0/public/OHLC": 2 },
+	"poloniex": { "returnOrderBook": 2, "returnMarketTradeHistory": 2 }
+}
+DEFAULT_EXCHANGE_LIMIT = (1.0, 1)
+THROTTLE_STATUSES = (429, 503)
+DEFAULT_COOLDOWN = 10
+DEFAULT_RECOVERY_STEP = 0.05
+DEFAULT_MAX_RETRIES = 3
+# never throttle below this fraction of the configured rate
+MIN_RATE_FRACTION = 1.0 / 16
+
+class TokenBucket:
+	def __init__(self, rate, burst):
+		self.configuredRate = float(rate)
+		self.rate = float(rate)
+		self.burst = float(burst)
+		self.tokens = float(burst)
+		self.updatedAt = time.time()
+		self.pausedUntil = 0
+		self.throttleCount = 0
+
+	def refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.updatedAt) * self.rate)
+		self.updatedAt = now
+
+	# takes cost tokens and returns how long the caller has to wait before it may use them
+	def reserve(self, cost, now):
+		self.refill(now)
+		self.tokens -= cost
+		wait = max(0.0, self.pausedUntil - now)
+		if self.tokens < 0:
+			wait = max(wait, -self.tokens / self.rate)
+		return wait
+
+	def throttle(self, pause, now):
+		self.refill(now)
+		self.rate = max(self.configuredRate * MIN_RATE_FRACTION, self.rate / 2)
+		self.tokens = min(self.tokens, 0.0)
+		self.pausedUntil = max(self.pausedUntil, now + pause)
+		self.throttleCount += 1
+
+	def recover(self, step):
+		self.rate = min(self.configuredRate, self.rate + self.configuredRate * step)
+
+class RateScheduler:
+	def __init__(self, limits=EXCHANGE_LIMITS, costs=ENDPOINT_COSTS, cooldown=DEFAULT_COOLDOWN, recoveryStep=DEFAULT_RECOVERY_STEP):
+		self.limits = limits
+		self.costs = costs
+		self.cooldown = cooldown
+		self.recoveryStep = recoveryStep
+		self.buckets = {}
+		self.lock = threading.Lock()
+		self.requestCount = 0
+		self.waitSeconds = 0.0
+
+	def getBucket(self, exchange):
+		bucket = self.buckets.get(exchange)
+		if bucket == None:
+			rate, burst = self.limits.get(exchange, DEFAULT_EXCHANGE_LIMIT)
+			bucket = TokenBucket(rate, burst)
+			self.buckets[exchange] = bucket
+		return bucket
+
+	def getCost(self, exchange, endpoint):
+		return self.costs.get(exchange, {}).get(endpoint, 1)
+
+	# blocks until the exchange has room for one call of endpoint, returns the seconds waited
+	def acquire(self, exchange, endpoint=None):
+		with self.lock:
+			wait = self.getBucket(exchange).reserve(self.getCost(exchange, endpoint), time.time())
+			self.requestCount += 1
+			self.waitSeconds += wait
+		if wait > 0:
+			time.sleep(wait)
+		return wait
+
+	# feeds the status of a finished call back into the bucket of its exchange
+	def report(self, exchange, status, retryAfter=None):
+		with self.lock:
+			bucket = self.getBucket(exchange)
+			if status in THROTTLE_STATUSES:
+				pause = self.cooldown
+				try:
+					pause = float(retryAfter)
+				except (TypeError, ValueError):
+					pass
+				bucket.throttle(pause, time.time())
+				print ("!! " + exchange.upper() + " ANSWERED " + str(status) + ", PAUSING " + "%.1f" % pause + " SECONDS AND SLOWING TO " + "%.2f" % bucket.rate + " REQUESTS/S")
+			elif status != None and status < 400:
+				bucket.recover(self.recoveryStep)
+
+	# a scheduled requests GET over the kept-alive session of the host, throttled answers are retried
+	def get(self, exchange, endpoint, url, maxRetries=DEFAULT_MAX_RETRIES, **kwargs):
+		kwargs.setdefault("timeout", DEFAULT_REQUEST_TIMEOUT)
+		for attempt in range(maxRetries + 1):
+			self.acquire(exchange, endpoint)
+			response = getSession(url).get(url, **kwargs)
+			self.report(exchange, response.status_code, response.headers.get("Retry-After"))
+			if response.status_code not in THROTTLE_STATUSES:
+				break
+		return response
+
+	# for client libraries that raise on http errors, the status is read off the exception
+	def call(self, exchange, endpoint, fn, *args, **kwargs):
+		maxRetries = kwargs.pop("maxRetries", DEFAULT_MAX_RETRIES)
+		for attempt in range(maxRetries + 1):
+			self.acquire(exchange, endpoint)
+			try:
+				result = fn(*args, **kwargs)
+			except Exception as e:
+				status = getErrorStatus(e)
+				self.report(exchange, status)
+				if status not in THROTTLE_STATUSES or attempt == maxRetries:
+					raise
+				continue
+			self.report(exchange, 200)
+			return result
+
+	# the least seconds a round of that many calls of endpoint takes once the burst is spent,
+	# a poller whose round is longer than its interval polls every item this often instead
+	def getRoundSeconds(self, exchange, endpoint, calls):
+		rate, burst = self.limits.get(exchange, DEFAULT_EXCHANGE_LIMIT)
+		return calls * self.getCost(exchange, endpoint) / float(rate)
+
+	def getStats(self):
+		with self.lock:
+			stats = { "requests": self.requestCount, "wait_seconds": self.waitSeconds }
+			for exchange, bucket in self.buckets.items():
+				stats[exchange + "_rate"] = bucket.rate
+				stats[exchange + "_throttled"] = bucket.throttleCount
+		return stats
+
+# urllib2.HTTPError has a code, a requests HTTPError a response
+def getErrorStatus(error):
+	status = getattr(error, "code", None)
+	if status == None and getattr(error, "response", None) != None:
+		status = getattr(error.response, "status_code", None)
+	return status
+
+class FixedRateClock:
+	def __init__(self, interval):
+		self.interval = interval
+		self.nextTick = time.time()
+		self.missedTicks = 0
+
+	# sleeps until the next tick, the first call returns right away
+	def wait(self):
+		now = time.time()
+		if self.nextTick > now:
+			time.sleep(self.nextTick - now)
+		elif self.interval > 0 and now - self.nextTick >= self.interval:
+			missed = int((now - self.nextTick) / self.interval)
+			self.missedTicks += missed
+			self.nextTick += missed * self.interval
+		self.nextTick += self.interval
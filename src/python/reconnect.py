@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Keeps a websocket connector connected.  When the connection drops the
+# connector calls disconnected(), which opens an outage starting at the last
+# message it received, and then reconnect() with a function that opens a new
+# connection and sends the subscriptions again.  The first attempt goes out
+# right away since most drops are gone by the next try, after that the delay
+# doubles from baseDelay up to maxDelay with full jitter, so a fleet of
+# collectors does not hit the exchange at the same moment after it restarts.
+# The backoff only starts over once a connection has stayed up for
+# stableSeconds, a connection that is dropped right after it opened keeps
+# backing off instead of reconnecting in a tight loop.
+# Once connected() is called the outage is closed and handed to postOutage as
+# an OutageRecord, so whoever reads the indices knows which interval of an
+# exchange is missing.
+
+import time, random
+from records import OutageRecord, FrameStamp, nextUuid
+
+DEFAULT_RECONNECT_BASE_DELAY = 0.5
+DEFAULT_RECONNECT_MAX_DELAY = 60
+DEFAULT_RECONNECT_STABLE_SECONDS = 60
+OUTAGE_INDEX_NAME = "live_crypto_outages"
+
+class ReconnectManager:
+	def __init__(self, exchange, postOutage=None, baseDelay=DEFAULT_RECONNECT_BASE_DELAY, maxDelay=DEFAULT_RECONNECT_MAX_DELAY, stableSeconds=DEFAULT_RECONNECT_STABLE_SECONDS):
+		self.exchange = exchange
+		self.postOutage = postOutage
+		self.baseDelay = baseDelay
+		self.maxDelay = maxDelay
+		self.stableSeconds = stableSeconds
+		self.attempts = 0
+		self.connectedAt = None
+		self.outageStart = None
+		self.outageReason = None
+		self.outageAttempts = 0
+		self.outageCount = 0
+		self.outageSeconds = 0.0
+
+	def getDelay(self):
+		if self.attempts <= 1:
+			return 0
+		return random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** (self.attempts - 2)))
+
+	# lastSeenAt is when the last message came in, the data after it is what is missing
+	def disconnected(self, reason, lastSeenAt=None):
+		if self.outageStart != None:
+			return
+		now = time.time()
+		if self.connectedAt != None and now - self.connectedAt >= self.stableSeconds:
+			self.attempts = 0
+		if lastSeenAt == None:
+			lastSeenAt = now
+		self.outageStart = lastSeenAt
+		self.outageReason = str(reason)
+		self.outageAttempts = self.attempts
+		print ("!! " + self.exchange.upper() + " WEBSOCKET DISCONNECTED: " + self.outageReason)
+
+	# waits out the backoff delay of the next attempt, returns the number of the attempt
+	def waitForRetry(self):
+		self.attempts += 1
+		delay = self.getDelay()
+		if delay > 0:
+			print ("RECONNECTING TO " + self.exchange.upper() + " IN " + "%.1f" % delay + " SECONDS (ATTEMPT " + str(self.attempts) + ")")
+			time.sleep(delay)
+		return self.attempts
+
+	# calls connect until it stops raising, then closes the outage
+	def reconnect(self, connect):
+		while True:
+			self.waitForRetry()
+			try:
+				connect()
+			except Exception as e:
+				print ("!! RECONNECT TO " + self.exchange.upper() + " FAILED: " + str(e))
+				continue
+			return self.connected()
+
+	def connected(self):
+		stamp = FrameStamp()
+		self.connectedAt = stamp.seconds
+		if self.outageStart == None:
+			return None
+		outage = OutageRecord(uuid=nextUuid(), date=stamp, exchange=self.exchange, started_at=FrameStamp(self.outageStart), ended_at=stamp, duration=stamp.seconds - self.outageStart, attempts=self.attempts - self.outageAttempts, reason=self.outageReason)
+		self.outageCount += 1
+		self.outageSeconds += outage.duration
+		print ("RECONNECTED TO " + self.exchange.upper() + " AFTER " + "%.3f" % outage.duration + " SECONDS (" + str(outage.attempts) + " ATTEMPTS)")
+		self.outageStart = None
+		self.outageReason = None
+		if self.postOutage != None:
+			self.postOutage(outage)
+		return outage
+
+	def getStats(self):
+		return { "outages": self.outageCount, "outage_seconds": self.outageSeconds, "disconnected": self.outageStart != None }
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Fixed-layout records for the documents the connectors index, used instead of
+# building a fresh dict per order, trade, ticker, candle or futures update.
+# Every type is a namedtuple (no per-instance __dict__) whose fields are listed
+# in the order they are written, and toJson() builds the _bulk source line in a
+# single pass over that order using precomputed '"field":' prefixes.  Fields
+# left as None are not written, so one type covers exchanges that fill in
+# different fields.
+#
+# A FrameStamp is taken once per websocket frame and shared by every record
+# built from that frame, so the clock is read and the date formatted once.
+# nextUuid() hands out uuid shaped ids from a random per-process prefix and a
+# counter, which is much cheaper than uuid.uuid4() for every record.
+
+import os, json, uuid, time, datetime, itertools, pytz
+from collections import namedtuple
+
+TIMEZONE = pytz.timezone("UTC")
+INFINITY = float("inf")
+
+encodeString = json.encoder.encode_basestring_ascii
+
+class FrameStamp(object):
+	__slots__ = ["seconds", "wholeSeconds", "microseconds", "json", "date"]
+
+	def __init__(self, seconds=None):
+		if seconds == None:
+			seconds = time.time()
+		self.seconds = seconds
+		self.wholeSeconds = int(seconds)
+		self.microseconds = int((seconds - self.wholeSeconds) * 1000000)
+		# strftime is several times cheaper than building an aware datetime and calling isoformat
+		self.json = '"' + time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.wholeSeconds)) + ".%06d+00:00" % self.microseconds + '"'
+		self.date = None
+
+	# the datetime is only built for callers that ask for one, toJson uses the preformatted string
+	def getDate(self):
+		if self.date == None:
+			self.date = datetime.datetime.fromtimestamp(self.wholeSeconds, TIMEZONE).replace(microsecond=self.microseconds)
+		return self.date
+
+def encodeFloat(value):
+	if value != value or value == INFINITY or value == -INFINITY:
+		return json.dumps(value)
+	return repr(value)
+
+def encodeBool(value):
+	return "true" if value else "false"
+
+def encodeDefault(value):
+	if isinstance(value, (datetime.date, datetime.datetime)):
+		return '"' + value.isoformat() + '"'
+	return json.dumps(value)
+
+ENCODERS = { float: encodeFloat, str: encodeString, bool: encodeBool, int: str, FrameStamp: lambda stamp: stamp.json }
+
+class Record(object):
+	__slots__ = ()
+
+	def toJson(self):
+		encoders = ENCODERS
+		return "{" + ",".join([prefix + encoders.get(type(value), encodeDefault)(value) for prefix, value in zip(self.PREFIXES, self) if value is not None]) + "}"
+
+	def toDict(self):
+		dto = {}
+		for name, value in zip(self._fields, self):
+			if value is not None:
+				dto[name] = value.getDate() if type(value) is FrameStamp else value
+		return dto
+
+# every field defaults to None so records can be built with keyword arguments only,
+# idFields are the fields that identify a document for doc_ids.getContentId
+def defineRecord(typeName, fieldNames, idFields):
+	fields = namedtuple(typeName + "Fields", fieldNames)
+	fields.__new__.__defaults__ = (None,) * len(fieldNames)
+	return type(typeName, (Record, fields), { "__slots__": (), "PREFIXES": tuple(['"' + name + '":' for name in fieldNames]), "ID_FIELDS": tuple(idFields) })
+
+# book levels and tickers carry the frame date, so only a retry of the same document maps to the same id
+OrderRecord = defineRecord("OrderRecord", ["uuid", "date", "currency_pair", "timestamp", "price", "count", "volume", "absolute_volume", "order_type", "change_type"], ["currency_pair", "timestamp", "date", "order_type", "price", "change_type"])
+# trades are identified by the exchange's own ids, a trade the exchange sends again is not written twice
+TradeRecord = defineRecord("TradeRecord", ["uuid", "date", "currency_pair", "sequence_id", "order_id", "timestamp", "price", "volume", "absolute_volume", "order_type"], ["currency_pair", "sequence_id", "order_id"])
+# okcoin has always written the day's low as low_price, bitfinex as low
+TickerRecord = defineRecord("TickerRecord", ["uuid", "date", "currency_pair", "timestamp", "last_price", "volume", "high", "low", "low_price", "ask", "bid", "daily_change", "daily_delta", "ask_volume", "bid_volume"], ["currency_pair", "timestamp", "date"])
+# an open candle that has not changed since it was last published gets the same id
+CandleRecord = defineRecord("CandleRecord", ["uuid", "date", "timestamp", "open_price", "highest_price", "lowest_price", "close_price", "volume", "trade_count", "closed", "currency_symbol", "contract_type"], ["currency_symbol", "contract_type", "timestamp", "closed", "trade_count", "close_price", "volume"])
+FutureRecord = defineRecord("FutureRecord", ["uuid", "date", "buy_price", "contract_id", "high_price", "last_price", "low_price", "sell_price", "unit_amount", "volume", "currency_pair", "contract_type"], ["currency_pair", "contract_type", "contract_id", "date"])
+# the interval a connector was not receiving data, started_at is the last message before the connection dropped
+OutageRecord = defineRecord("OutageRecord", ["uuid", "date", "exchange", "started_at", "ended_at", "duration", "attempts", "reason"], ["exchange", "started_at"])
+
+idPid = None
+idPrefix = None
+idCounter = None
+
+def nextUuid():
+	global idPid, idPrefix, idCounter
+	# a forked worker gets its own prefix so it never repeats its parent's ids
+	if os.getpid() != idPid:
+		idPid = os.getpid()
+		idPrefix = str(uuid.uuid4())[:24]
+		idCounter = itertools.count()
+	return idPrefix + "%012x" % next(idCounter)
+
+# source line for the _bulk API, records are serialized by toJson and anything else by the fallback serializer
+def toSource(dto, serializer):
+	if isinstance(dto, Record):
+		return dto.toJson()
+	return serializer.dumps(dto)
@@ -23,12 +23,16 @@ __license__ = "MIT"
 # SOFTWARE.
 import requests, json, re, uuid, datetime, argparse, warnings, pytz
 from elasticsearch import Elasticsearch
-from time import sleep 
+from multiprocessing.pool import ThreadPool
+from doc_ids import getDocumentId, ID_STRATEGIES, DEFAULT_ID_STRATEGY
+from bulk_sink import BulkSink
+from rate_scheduler import RateScheduler, FixedRateClock
 
 # ***** CHANGE THIS TO BE THE URL OF YOUR ELASTICSEARCH SERVER *****
 ELASTICSEARCH_HOST = "http://localhost:9200"
 
-# Bitfinex API time limit in seconds 
+# Seconds from the start of one poll to the start of the next, the rate scheduler
+# stretches it when the exchanges' request budgets cannot keep up
 API_TIME_LIMIT = 1
 
 # Default index name in elasticsearch to use for the btc_usd market data aggregation
@@ -55,20 +59,29 @@ OKCOIN_REST_API_URL = "https://www.okcoin.com/api/v1"
 # REST API URL for OkCoin Public Bitcoin (BTCUSD) Ticker
 OKCOIN_BTCUSD_TICKER_REST_URL = OKCOIN_REST_API_URL + "/ticker.do?symbol=btc_usd"
 
+# every ticker carries the exchange's own timestamp, polling the same one twice writes it once
+TICKER_ID_FIELDS = ["currency_pair", "timestamp"]
+
+idStrategy = DEFAULT_ID_STRATEGY
+sink = None
+scheduler = RateScheduler()
+
 def getArgs(): 
 	parser = argparse.ArgumentParser(description='BTC elastic search data collector')
 	parser.add_argument('--host', action='store_true', default=False)
 	parser.add_argument('--forever', action='store_true', default=False)
 	parser.add_argument('--max_records', action='store_true', default=3600)
+	parser.add_argument('--id_strategy', choices=ID_STRATEGIES, default=DEFAULT_ID_STRATEGY)
 
 	# TODO: add more params here
 
 	args = parser.parse_args()
 	return args
 
-def getTickerData(tickerUrl): 
+# requests go through a kept-alive session per host and wait for the exchange's rate budget, see rate_scheduler.py
+def getTickerData(tickerUrl, exchange): 
 	tickerDict = None	
-	req = requests.get(tickerUrl)
+	req = scheduler.get(exchange, "ticker", tickerUrl)
 	if req.status_code < 400: 
 		tickerDict = req.json()
 	else: 
@@ -83,6 +96,7 @@ def createMappings(es):
 				"properties": {
 					"uuid": { "type": "string", "index": "no"}, 
 					"date": {"type": "date"},
+					"currency_pair": {"type": "string"},
 					"last_price": {"type": "float"},
 					"timestamp": {"type": "string", "index": "no"},
 					"volume": {"type": "float"},
@@ -102,6 +116,7 @@ def createMappings(es):
 				"properties": {
 					"uuid": { "type": "string", "index": "no"}, 
 					"date": {"type":"date"}, 
+					"currency_pair": {"type": "string"},
 					"last_price": {"type": "float"}, 
 					"timestamp": {"type": "string", "index": "no"},
 					"volume": {"type": "float"},
@@ -120,81 +135,98 @@ def createMappings(es):
 		pass
 	return mappingCreated
 
-# Adds ticker item to elasticsearch 
-# Uses a random UUID as the ID, can be analyzed via the timestamp in kibana
-def addBitfinexItem(es): 
-	successful = False
-	try: 
-		tickerData = getTickerData(BITFINEX_BTCUSD_TICKER_REST_URL) 
-		dateQueried = datetime.datetime.fromtimestamp(float(tickerData["timestamp"]), TIMEZONE)
-		uniqueIdentifier = uuid.uuid4()
-		tickerData["uuid"] = str(uniqueIdentifier)
-		tickerData["date"] = dateQueried
+# The document id is chosen by idStrategy (see doc_ids.py), the uuid field stays random
+def getBitfinexDto(tickerData, currencyPair): 
+	dateQueried = datetime.datetime.fromtimestamp(float(tickerData["timestamp"]), TIMEZONE)
+	uniqueIdentifier = uuid.uuid4()
+	tickerData["uuid"] = str(uniqueIdentifier)
+	tickerData["date"] = dateQueried
+	tickerData["currency_pair"] = currencyPair
 
-		# TODO: compound order book info here 
+	# TODO: compound order book info here 
 
-		putNewDocumentRequest = es.create(index=DEFAULT_INDEX_NAME, doc_type='bitfinex', ignore=[400], id=uniqueIdentifier, body=tickerData)
-		successful = putNewDocumentRequest["created"]
-	except: 
-		pass
-	return successful
+	return tickerData
 
-def addOkCoinItem(es): 
-	
-	successful = False
-	try: 
-		tickerData = getTickerData(OKCOIN_BTCUSD_TICKER_REST_URL)
-		okCoinTimestamp = tickerData["date"]
-		okCoinTickerData = tickerData["ticker"]
+def getOkCoinDto(tickerData, currencyPair): 
+	okCoinTimestamp = tickerData["date"]
+	okCoinTickerData = tickerData["ticker"]
 
-		dateQueried = datetime.datetime.fromtimestamp(float(okCoinTimestamp), TIMEZONE)
+	dateQueried = datetime.datetime.fromtimestamp(float(okCoinTimestamp), TIMEZONE)
 
 
-		uniqueIdentifier = uuid.uuid4()
-		okCoinDto = {}
+	uniqueIdentifier = uuid.uuid4()
+	okCoinDto = {}
 
 
-		okCoinDto["uuid"] = str(uniqueIdentifier)
-		okCoinDto["date"] = dateQueried
-		okCoinDto["timestamp"] = str(okCoinTimestamp)
-		okCoinDto["last_price"] = float(okCoinTickerData["last"])
-		okCoinDto["volume"] = float(okCoinTickerData["vol"]) 
-		okCoinDto["high"] = float(okCoinTickerData["high"])
-		okCoinDto["ask"] = float(okCoinTickerData["sell"]) 
-		okCoinDto["low"] = float(okCoinTickerData["low"]) 
-		okCoinDto["bid"] = float(okCoinTickerData["buy"])
+	okCoinDto["uuid"] = str(uniqueIdentifier)
+	okCoinDto["date"] = dateQueried
+	okCoinDto["currency_pair"] = currencyPair
+	okCoinDto["timestamp"] = str(okCoinTimestamp)
+	okCoinDto["last_price"] = float(okCoinTickerData["last"])
+	okCoinDto["volume"] = float(okCoinTickerData["vol"]) 
+	okCoinDto["high"] = float(okCoinTickerData["high"])
+	okCoinDto["ask"] = float(okCoinTickerData["sell"]) 
+	okCoinDto["low"] = float(okCoinTickerData["low"]) 
+	okCoinDto["bid"] = float(okCoinTickerData["buy"])
 
 
-		# TODO: compound order book info here 
+	# TODO: compound order book info here 
 
+	return okCoinDto
 
-		putNewDocumentRequest = es.create(index=DEFAULT_INDEX_NAME, doc_type='okcoin', ignore=[400], id=uniqueIdentifier, body=okCoinDto) 
-		successful = putNewDocumentRequest["created"]
-	except: 
-		pass
-	return successful
+# every ticker polled by updateIndex as (doc type, currency pair, url, dto builder)
+TICKERS = [
+	("bitfinex", "BTCUSD", BITFINEX_BTCUSD_TICKER_REST_URL, getBitfinexDto), 
+	("bitfinex", "LTCUSD", BITFINEX_LTCUSD_TICKER_REST_URL, getBitfinexDto), 
+	("bitfinex", "LTCBTC", BITFINEX_LTCBTC_TICKER_REST_URL, getBitfinexDto), 
+	("okcoin", "BTCUSD", OKCOIN_BTCUSD_TICKER_REST_URL, getOkCoinDto)
+]
+
+fetchPool = ThreadPool(len(TICKERS))
+
+# runs on the fetch pool, a ticker that could not be fetched or read is None
+def fetchTicker(ticker): 
+	docType, currencyPair, tickerUrl, getDto = ticker
+	try: 
+		return getDto(getTickerData(tickerUrl, docType), currencyPair)
+	except Exception as e: 
+		print("REQUEST TO A TICKER API FAILED (" + tickerUrl + "): " + str(e))
+		return None
 
+# all tickers are fetched at once and written with a single _bulk request,
+# so a poll takes as long as the slowest exchange instead of all of them in a row
 def updateIndex(es): 
-	bitfinexUpdateRequestResult = addBitfinexItem(es)
-	okcoinUpdateRequestResult = addOkCoinItem(es)
-	logResult(bitfinexUpdateRequestResult)
-	logResult(okcoinUpdateRequestResult)
-	sleep(API_TIME_LIMIT)
+	dtoList = fetchPool.map(fetchTicker, TICKERS)
+	# the latency timer can flush part of the poll before the flush below, so the counters are compared instead
+	before = sink.getStats()
+	for ticker, dto in zip(TICKERS, dtoList): 
+		if dto == None: 
+			continue
+		docId = getDocumentId(idStrategy, ticker[0], dto, TICKER_ID_FIELDS)
+		sink.add(dto, DEFAULT_INDEX_NAME, ticker[0], docId)
+	sink.flush()
+	after = sink.getStats()
+	logResult(after["indexed"] - before["indexed"], after["duplicate"] - before["duplicate"], len(TICKERS))
 	pass 
 
 
-def logResult(successful): 
+# duplicates are tickers whose exchange timestamp has not moved since the last poll, their content id is already in the index
+def logResult(added, duplicate, polled): 
 	logTime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-	if successful == True: 
-		print("[" + logTime + "]: 1 document successfully added to the " + DEFAULT_INDEX_NAME + " index.") 
+	failed = polled - added - duplicate
+	if failed == 0: 
+		print("[" + logTime + "]: " + str(added) + " documents successfully added to the " + DEFAULT_INDEX_NAME + " index, " + str(duplicate) + " unchanged.") 
 	else: 
-		print("[" + logTime + "]: document failed to be successfully added to the " + DEFAULT_INDEX_NAME + " index (API calls too frequent?)")
+		print("[" + logTime + "]: " + str(failed) + " of " + str(polled) + " documents failed to be successfully added to the " + DEFAULT_INDEX_NAME + " index (API calls too frequent?), " + str(added) + " added, " + str(duplicate) + " unchanged.")
 	pass 
 
 if __name__ == "__main__": 
 	args = getArgs()
+	idStrategy = args.id_strategy
 	warnings.filterwarnings("ignore")
 	es = Elasticsearch([ELASTICSEARCH_HOST])
+	# updateIndex flushes it after every poll
+	sink = BulkSink(es, idStrategy=idStrategy)
 	mappingCreated = createMappings(es)
 	logTime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 	if mappingCreated == True:
@@ -202,8 +234,10 @@ if __name__ == "__main__":
 	else: 
 		print("[" + logTime + "]: Elasticsearch mapping already existed.  \nContinuing data collection...")
 
+	clock = FixedRateClock(API_TIME_LIMIT)
 	if args.forever == True: 
 		while 1 == 1: 
+			clock.wait()
 			updateIndex(es)
 	else: 
 		try: 
@@ -214,6 +248,7 @@ if __name__ == "__main__":
 			raise IOError("--max_records must be a positive integer value")
 		counter = 0
 		while counter != maxRecords: 
+			clock.wait()
 			updateIndex(es)
 			counter = counter + 1
 
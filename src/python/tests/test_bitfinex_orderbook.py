@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bitfinex"))
+from bitfinex_orderbook import PriceLadder, OrderBook
+
+class PriceLadderTest(unittest.TestCase):
+	def testAscendingLadder(self):
+		ladder = PriceLadder()
+		for price in [3.0, 1.0, 2.0]:
+			ladder.set(price, 1, 5.0)
+		self.assertEqual(ladder.best(), 1.0)
+		self.assertEqual([level[0] for level in ladder.getLevels()], [1.0, 2.0, 3.0])
+		self.assertEqual([level[0] for level in ladder.getLevels(2)], [1.0, 2.0])
+
+	def testDescendingLadder(self):
+		ladder = PriceLadder(descending=True)
+		for price in [3.0, 1.0, 2.0]:
+			ladder.set(price, 1, 5.0)
+		self.assertEqual(ladder.best(), 3.0)
+		self.assertEqual([level[0] for level in ladder.getLevels()], [3.0, 2.0, 1.0])
+		self.assertEqual([level[0] for level in ladder.getLevels(2)], [3.0, 2.0])
+
+	def testSetReplacesALevel(self):
+		ladder = PriceLadder()
+		ladder.set(1.0, 1, 5.0)
+		ladder.set(1.0, 2, 7.0)
+		self.assertEqual(len(ladder), 1)
+		self.assertEqual(ladder.getLevels(), [[1.0, 2, 7.0]])
+
+	def testRemove(self):
+		ladder = PriceLadder()
+		ladder.set(1.0, 1, 5.0)
+		ladder.set(2.0, 1, 5.0)
+		ladder.remove(1.0)
+		ladder.remove(9.0)
+		self.assertEqual(ladder.getLevels(), [[2.0, 1, 5.0]])
+		ladder.remove(2.0)
+		self.assertEqual(ladder.best(), None)
+
+class OrderBookTest(unittest.TestCase):
+	def setUp(self):
+		self.book = OrderBook("BTCUSD")
+		self.book.applySnapshot([[100.0, 2, 1.5], [99.0, 1, 0.5], [101.0, 3, -2.0], [102.0, 1, -1.0]])
+
+	def testSnapshot(self):
+		self.assertEqual(self.book.getBestBid(), 100.0)
+		self.assertEqual(self.book.getBestAsk(), 101.0)
+		self.assertEqual(self.book.getSpread(), 1.0)
+		self.assertEqual(self.book.getLevels(1), [[100.0, 2.0, 1.5], [101.0, 3.0, -2.0]])
+
+	def testSnapshotReplacesTheBook(self):
+		self.book.applySnapshot([[50.0, 1, 1.0]])
+		self.assertEqual(self.book.getLevels(), [[50.0, 1.0, 1.0]])
+		self.assertEqual(self.book.getSpread(), None)
+
+	def testUpdateAndRemoveLevels(self):
+		self.book.applyUpdate("100.5", "1", "0.25")
+		self.assertEqual(self.book.getBestBid(), 100.5)
+		# a count of 0 removes the level, the sign of the amount says from which side
+		self.book.applyUpdate(101.0, 0, -1)
+		self.assertEqual(self.book.getBestAsk(), 102.0)
+		self.book.applyUpdate(100.5, 0, 1)
+		self.assertEqual(self.book.getBestBid(), 100.0)
+
+	def testLevelThatCrossedMovesSides(self):
+		self.book.applyUpdate(101.0, 1, 0.5)
+		self.assertEqual(self.book.getBestBid(), 101.0)
+		self.assertEqual(self.book.getBestAsk(), 102.0)
+		self.assertEqual(len(self.book.asks), 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, time, shutil, tempfile, unittest
+
+try:
+	from unittest import mock
+except ImportError:
+	# Python 2
+	import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bitfinex"))
+import bitfinex_supervisor
+from bitfinex_supervisor import BitfinexSupervisor, getSpoolDir
+
+# stands in for multiprocessing.Process, nothing is forked
+class FakeProcess:
+	nextPid = 1000
+
+	def __init__(self, target=None, name=None, args=()):
+		self.name = name
+		self.args = args
+		self.alive = False
+		self.exitcode = None
+		FakeProcess.nextPid += 1
+		self.pid = FakeProcess.nextPid
+
+	def start(self):
+		self.alive = True
+
+	def is_alive(self):
+		return self.alive
+
+	def terminate(self):
+		self.alive = False
+		self.exitcode = 0
+
+	def join(self, timeout=None):
+		pass
+
+	def getAdoptSlots(self):
+		return self.args[6]
+
+class SupervisorTest(unittest.TestCase):
+	def setUp(self):
+		self.spoolRoot = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.spoolRoot)
+		patcher = mock.patch.object(bitfinex_supervisor.multiprocessing, "Process", FakeProcess)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def getSupervisor(self, workerCount, symbols, **kwargs):
+		supervisor = BitfinexSupervisor(workerCount, spoolRoot=self.spoolRoot, restartDelay=0, **kwargs)
+		supervisor.rebalance(symbols)
+		for slot in supervisor.slots:
+			supervisor.startWorker(slot)
+		return supervisor
+
+	def makeSpool(self, slot):
+		os.makedirs(getSpoolDir(self.spoolRoot, slot))
+
+	def testRebalanceSpreadsSymbolsEvenly(self):
+		supervisor = BitfinexSupervisor(3, spoolRoot=self.spoolRoot)
+		changed = supervisor.rebalance(["A", "B", "C", "D", "E", "F", "G"])
+		self.assertEqual(changed, [0, 1, 2])
+		self.assertEqual(sorted([len(symbols) for symbols in supervisor.assignment.values()]), [2, 2, 3])
+		self.assertEqual(sorted(sum(supervisor.assignment.values(), [])), ["A", "B", "C", "D", "E", "F", "G"])
+
+	def testRebalanceOnlyMovesWhatChanged(self):
+		supervisor = BitfinexSupervisor(3, spoolRoot=self.spoolRoot)
+		supervisor.rebalance(["A", "B", "C", "D", "E", "F"])
+		before = dict(supervisor.assignment)
+		changed = supervisor.rebalance(["A", "B", "C", "D", "E", "F", "G"])
+		self.assertEqual(len(changed), 1)
+		for slot in supervisor.slots:
+			if slot not in changed:
+				self.assertEqual(supervisor.assignment[slot], before[slot])
+		self.assertEqual(supervisor.rebalance(["A", "B", "C", "D", "E", "F", "G"]), [])
+
+	def testRebalanceEvensOutRemovedSymbols(self):
+		supervisor = BitfinexSupervisor(2, spoolRoot=self.spoolRoot)
+		supervisor.rebalance(["A", "B", "C", "D"])
+		removed = supervisor.assignment[0]
+		supervisor.rebalance([symbol for symbol in ["A", "B", "C", "D"] if symbol not in removed])
+		self.assertEqual(sorted([len(symbols) for symbols in supervisor.assignment.values()]), [1, 1])
+
+	def testMoreWorkersThanSymbols(self):
+		supervisor = self.getSupervisor(3, ["A"])
+		self.assertEqual(list(supervisor.processes.keys()), [supervisor.getAdopter()])
+
+	def testDeadWorkerIsRestarted(self):
+		supervisor = self.getSupervisor(2, ["A", "B"])
+		process = supervisor.processes[1]
+		process.alive = False
+		process.exitcode = 1
+		supervisor.checkWorkers()
+		self.assertTrue(supervisor.processes[1] is not process)
+		self.assertTrue(supervisor.processes[1].is_alive())
+		self.assertEqual(len(supervisor.restarts[1]), 1)
+
+	def testSilentWorkerIsRestarted(self):
+		supervisor = self.getSupervisor(2, ["A", "B"], statsInterval=10)
+		process = supervisor.processes[1]
+		supervisor.startedAt[1] = time.time() - 31
+		supervisor.checkWorkers()
+		self.assertFalse(process.is_alive())
+		self.assertTrue(supervisor.processes[1] is not process)
+
+	def testWorkerThatKeepsDyingIsRetired(self):
+		supervisor = self.getSupervisor(3, ["A", "B", "C", "D", "E", "F"], maxRestarts=2)
+		for attempt in range(3):
+			supervisor.processes[2].alive = False
+			supervisor.checkWorkers()
+		self.assertEqual(supervisor.slots, [0, 1])
+		self.assertEqual(supervisor.retired, [2])
+		self.assertEqual(sorted(supervisor.assignment[0] + supervisor.assignment[1]), ["A", "B", "C", "D", "E", "F"])
+		self.assertFalse(2 in supervisor.processes)
+
+	def testLastWorkerIsNeverRetired(self):
+		supervisor = self.getSupervisor(1, ["A"], maxRestarts=1)
+		for attempt in range(3):
+			supervisor.processes[0].alive = False
+			supervisor.checkWorkers()
+		self.assertEqual(supervisor.slots, [0])
+		self.assertTrue(supervisor.processes[0].is_alive())
+
+	def testAdopterReplaysTheSpoolOfARetiredWorker(self):
+		supervisor = self.getSupervisor(3, ["A", "B", "C"], maxRestarts=0)
+		adopter = supervisor.processes[0]
+		self.assertEqual(adopter.getAdoptSlots(), [])
+		self.makeSpool(2)
+		supervisor.processes[2].alive = False
+		supervisor.checkWorkers()
+		self.assertEqual(supervisor.retired, [2])
+		self.assertFalse(adopter.is_alive())
+		self.assertEqual(supervisor.processes[0].getAdoptSlots(), [2])
+
+	def testSpoolsOfSlotsBeyondTheWorkerCountAreAdopted(self):
+		self.makeSpool(5)
+		supervisor = self.getSupervisor(2, ["A", "B"])
+		self.assertEqual(supervisor.processes[0].getAdoptSlots(), [5])
+		self.assertEqual(supervisor.processes[1].getAdoptSlots(), [])
+
+	def testLiveSlotWithoutSymbolsIsNotAdopted(self):
+		# worker 2 had symbols in an earlier run and left its spool behind
+		self.makeSpool(2)
+		supervisor = self.getSupervisor(3, ["A", "B"])
+		self.assertEqual(supervisor.processes[0].getAdoptSlots(), [])
+		adopter = supervisor.processes[0]
+		supervisor.getSymbols = lambda ttl=None: ["A", "B", "C"]
+		self.assertTrue(supervisor.refreshSymbols())
+		# only worker 2 opens its spool, the adopter was never given it and keeps running
+		self.assertTrue(supervisor.processes[2].is_alive())
+		self.assertTrue(supervisor.processes[0] is adopter)
+
+	def testAdopterIsRestartedWhenTheOrphansChange(self):
+		supervisor = self.getSupervisor(2, ["A", "B", "C"])
+		adopter = supervisor.processes[0]
+		self.makeSpool(7)
+		# the new symbol goes to worker 1, the adopter's own symbols stay the same
+		supervisor.getSymbols = lambda ttl=None: ["A", "B", "C", "D"]
+		supervisor.refreshSymbols()
+		self.assertEqual(supervisor.assignment[1], ["B", "D"])
+		self.assertFalse(adopter.is_alive())
+		self.assertEqual(supervisor.processes[0].getAdoptSlots(), [7])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, json, threading, unittest, elasticsearch
+from elasticsearch.serializer import JSONSerializer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bulk_sink import BulkSink
+from doc_ids import ID_AUTO
+
+# stands in for elasticsearch.Elasticsearch, statuses are handed out per item in order of arrival
+class FakeEs:
+	def __init__(self, statuses=None, error=None):
+		self.transport = self
+		self.serializer = JSONSerializer()
+		self.statuses = statuses or []
+		self.error = error
+		self.bodies = []
+
+	def bulk(self, body):
+		self.bodies.append(body)
+		if self.error != None:
+			raise self.error
+		lines = body.splitlines()
+		items = []
+		for i in range(0, len(lines), 2):
+			status = self.statuses.pop(0) if len(self.statuses) > 0 else 201
+			items.append({ list(json.loads(lines[i]).keys())[0]: { "status": status } })
+		return { "errors": any([list(item.values())[0]["status"] >= 300 for item in items]), "items": items }
+
+class FakeSpool:
+	def __init__(self):
+		self.bodies = []
+
+	def appendBody(self, body):
+		self.bodies.append(body)
+
+class BulkSinkTest(unittest.TestCase):
+	def testFlushesWhenMaxDocsIsReached(self):
+		es = FakeEs()
+		sink = BulkSink(es, maxDocs=3, maxLatency=60)
+		sink.add({ "n": 1 }, "index", "type")
+		sink.add({ "n": 2 }, "index", "type")
+		self.assertEqual(len(es.bodies), 0)
+		sink.add({ "n": 3 }, "index", "type")
+		self.assertEqual(len(es.bodies), 1)
+		self.assertEqual(len(es.bodies[0].splitlines()), 6)
+		self.assertEqual(sink.getStats()["pending"], 0)
+
+	def testFullBatchIsSentWithoutHoldingTheLock(self):
+		es = FakeEs()
+		sink = BulkSink(es, maxDocs=1, maxLatency=60)
+		acquired = []
+		# another producer tries the lock while the batch add() filled is on its way
+		def tryLock():
+			if sink.lock.acquire(timeout=1):
+				acquired.append(True)
+				sink.lock.release()
+		bulk = es.bulk
+		def lockedBulk(body):
+			producer = threading.Thread(target=tryLock)
+			producer.start()
+			producer.join()
+			return bulk(body)
+		es.bulk = lockedBulk
+		sink.add({ "n": 1 }, "index", "type")
+		self.assertEqual(acquired, [True])
+		self.assertEqual(sink.getStats()["indexed"], 1)
+
+	def testFlushesWhenMaxBytesIsReached(self):
+		es = FakeEs()
+		sink = BulkSink(es, maxDocs=1000, maxBytes=400, maxLatency=60)
+		sink.add({ "text": "x" * 150 }, "index", "type")
+		self.assertEqual(len(es.bodies), 0)
+		sink.add({ "text": "y" * 150 }, "index", "type")
+		self.assertEqual(len(es.bodies), 1)
+
+	def testFlushesAfterMaxLatency(self):
+		es = FakeEs()
+		sink = BulkSink(es, maxDocs=1000, maxLatency=0.05)
+		sink.add({ "n": 1 }, "index", "type")
+		sink.timer.join(5)
+		self.assertEqual(len(es.bodies), 1)
+		self.assertEqual(sink.getStats()["indexed"], 1)
+
+	def testEmptyFlushWaitsForTheBatchTheTimerTook(self):
+		es = FakeEs()
+		sink = BulkSink(es, maxDocs=1000, maxLatency=0.01)
+		sending = threading.Event()
+		release = threading.Event()
+		bulk = es.bulk
+		def slowBulk(body):
+			sending.set()
+			release.wait(5)
+			return bulk(body)
+		es.bulk = slowBulk
+		sink.add({ "n": 1 }, "index", "type")
+		self.assertTrue(sending.wait(5))
+		threading.Timer(0.1, release.set).start()
+		# the batch is already gone, but flush returns only once the timer's request is counted
+		self.assertEqual(sink.flush(), 0)
+		self.assertEqual(sink.getStats()["indexed"], 1)
+
+	def testEmptyFlushSendsNothing(self):
+		es = FakeEs()
+		sink = BulkSink(es)
+		self.assertEqual(sink.flush(), 0)
+		self.assertEqual(len(es.bodies), 0)
+		self.assertEqual(sink.getStats()["flushes"], 0)
+
+	def testActionLines(self):
+		es = FakeEs()
+		sink = BulkSink(es, maxLatency=60)
+		sink.add({ "n": 1 }, "index", "type", "abc")
+		sink.add({ "n": 2 }, "index", "type")
+		sink.flush()
+		lines = es.bodies[0].splitlines()
+		self.assertEqual(json.loads(lines[0]), { "create": { "_index": "index", "_type": "type", "_id": "abc" } })
+		self.assertEqual(json.loads(lines[1]), { "n": 1 })
+		# content ids by default, so the second document gets one as well
+		self.assertEqual(len(json.loads(lines[2])["create"]["_id"]), 40)
+
+	def testAutoIdsAreSentAsIndexActions(self):
+		es = FakeEs()
+		sink = BulkSink(es, maxLatency=60, idStrategy=ID_AUTO)
+		sink.add({ "n": 1 }, "index", "type")
+		sink.flush()
+		self.assertEqual(json.loads(es.bodies[0].splitlines()[0]), { "index": { "_index": "index", "_type": "type" } })
+
+	def testItemResultsAreCountedSeparately(self):
+		failures = []
+		spool = FakeSpool()
+		es = FakeEs(statuses=[201, 409, 429, 400])
+		sink = BulkSink(es, maxLatency=60, spool=spool, onFailure=lambda *args: failures.append(args))
+		for n in range(4):
+			sink.add({ "n": n }, "index", "type")
+		self.assertEqual(sink.flush(), 1)
+		stats = sink.getStats()
+		self.assertEqual((stats["indexed"], stats["duplicate"], stats["spooled"], stats["failed"], stats["flushes"]), (1, 1, 1, 1, 1))
+		# only the throttled item is spooled, the rest of the batch was taken
+		self.assertEqual(len(spool.bodies), 1)
+		self.assertEqual(json.loads(spool.bodies[0].splitlines()[1]), { "n": 2 })
+		self.assertEqual(len(failures), 1)
+		self.assertEqual(failures[0][3], { "n": 3 })
+
+	def testUnreachableClusterSpoolsTheBatch(self):
+		spool = FakeSpool()
+		es = FakeEs(error=elasticsearch.exceptions.ConnectionError("N/A", "connection refused", None))
+		sink = BulkSink(es, maxLatency=60, spool=spool)
+		sink.add({ "n": 1 }, "index", "type")
+		sink.add({ "n": 2 }, "index", "type")
+		self.assertEqual(sink.flush(), 0)
+		self.assertEqual(spool.bodies, es.bodies)
+		self.assertEqual(sink.getStats()["spooled"], 2)
+
+	def testRejectedRequestIsReportedAsFailed(self):
+		failures = []
+		es = FakeEs(error=elasticsearch.exceptions.TransportError(400, "bad request"))
+		sink = BulkSink(es, maxLatency=60, spool=FakeSpool(), onFailure=lambda *args: failures.append(args))
+		sink.add({ "n": 1 }, "index", "type")
+		sink.flush()
+		self.assertEqual(sink.getStats()["failed"], 1)
+		self.assertEqual(len(failures), 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from candles import CandleAggregator, getCandleDto, WEEK_OFFSET
+from records import TradeRecord
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bitfinex"))
+from bitfinex import Bitfinex
+
+# 2016-10-17 00:00:00 UTC, a monday
+MONDAY = 1476662400
+
+class CandleAggregatorTest(unittest.TestCase):
+	def setUp(self):
+		self.published = []
+		self.candles = CandleAggregator(self.onCandle, intervals=[("1min", 60), ("5min", 300)])
+
+	def onCandle(self, currencyPair, intervalName, candle, closed):
+		self.published.append((currencyPair, intervalName, candle.start, candle.open, candle.high, candle.low, candle.close, candle.volume, candle.trades, closed))
+
+	def testTradesOfOneBucketMakeOneCandle(self):
+		self.candles.addTrade("BTCUSD", MONDAY + 1, 100, 1)
+		self.candles.addTrade("BTCUSD", MONDAY + 20, 105, -2)
+		self.candles.addTrade("BTCUSD", MONDAY + 40, 95, 0.5)
+		self.candles.addTrade("BTCUSD", MONDAY + 59.999, 98, 1)
+		self.assertEqual(self.published, [])
+		candle = self.candles.candles[("BTCUSD", "1min")]
+		self.assertEqual((candle.start, candle.open, candle.high, candle.low, candle.close, candle.volume, candle.trades), (MONDAY, 100, 105, 95, 98, 4.5, 4))
+
+	def testFirstTradeOfTheNextBucketClosesTheCandle(self):
+		self.candles.addTrade("BTCUSD", MONDAY + 10, 100, 1)
+		self.candles.addTrade("BTCUSD", MONDAY + 60, 101, 1)
+		self.assertEqual(self.published, [("BTCUSD", "1min", MONDAY, 100, 100, 100, 100, 1, 1, True)])
+		self.assertEqual(self.candles.candles[("BTCUSD", "1min")].start, MONDAY + 60)
+		# the 5 minute candle is still open
+		self.assertEqual(self.candles.candles[("BTCUSD", "5min")].trades, 2)
+
+	def testLateTradeDoesNotReopenAClosedBucket(self):
+		self.candles.addTrade("BTCUSD", MONDAY + 10, 100, 1)
+		self.candles.addTrade("BTCUSD", MONDAY + 70, 101, 1)
+		self.candles.addTrade("BTCUSD", MONDAY + 30, 99, 1)
+		self.candles.addTrade("BTCUSD", MONDAY + 130, 102, 1)
+		oneMinute = [entry for entry in self.published if entry[1] == "1min"]
+		self.assertEqual([(entry[2], entry[8]) for entry in oneMinute], [(MONDAY, 1), (MONDAY + 60, 1)])
+		# the late trade still lands in the 5 minute candle, whose bucket is open
+		self.assertEqual(self.candles.candles[("BTCUSD", "5min")].trades, 4)
+
+	def testLateTradeAfterCloseExpiredIsDropped(self):
+		self.candles.addTrade("BTCUSD", MONDAY + 10, 100, 1)
+		self.assertEqual(self.candles.closeExpired(MONDAY + 300), 2)
+		self.candles.addTrade("BTCUSD", MONDAY + 20, 99, 1)
+		self.assertEqual(self.candles.candles, {})
+		self.assertEqual(len(self.published), 2)
+
+	def testCloseExpiredOnlyClosesEndedCandles(self):
+		self.candles.addTrade("BTCUSD", MONDAY + 10, 100, 1)
+		self.assertEqual(self.candles.closeExpired(MONDAY + 59), 0)
+		self.assertEqual(self.candles.closeExpired(MONDAY + 60), 1)
+		self.assertEqual(self.published[0][1], "1min")
+		self.assertEqual(list(self.candles.candles.keys()), [("BTCUSD", "5min")])
+
+	def testPairsAreBucketedSeparately(self):
+		self.candles.addTrade("BTCUSD", MONDAY + 10, 100, 1)
+		self.candles.addTrade("LTCUSD", MONDAY + 70, 4, 1)
+		self.assertEqual(self.published, [])
+
+	def testWeeksStartOnMonday(self):
+		candles = CandleAggregator(self.onCandle, intervals=[("week", 604800)])
+		candles.addTrade("BTCUSD", MONDAY + 3 * 86400, 100, 1)
+		self.assertEqual(candles.candles[("BTCUSD", "week")].start, MONDAY)
+		self.assertEqual((MONDAY - WEEK_OFFSET) % 604800, 0)
+
+	def testOpenCandlesArePublishedWhileBuilding(self):
+		candles = CandleAggregator(self.onCandle, intervals=[("1min", 60)], openCandleInterval=0)
+		candles.addTrade("BTCUSD", MONDAY + 10, 100, 1)
+		self.assertEqual(len(self.published), 1)
+		self.assertEqual(self.published[0][-1], False)
+
+	def testCandleDto(self):
+		self.candles.addTrade("BTCUSD", MONDAY + 10, 100, 2)
+		dto = getCandleDto("BTCUSD", "1min", self.candles.candles[("BTCUSD", "1min")], True)
+		self.assertEqual(dto.timestamp, str(MONDAY * 1000))
+		self.assertEqual((dto.open_price, dto.close_price, dto.volume, dto.trade_count, dto.closed), (100.0, 100.0, 2.0, 1, True))
+		self.assertEqual(dto.date.isoformat(), "2016-10-17T00:00:00+00:00")
+
+# the trades the bitfinex connector feeds into its candles, without opening a connection
+class BitfinexCandleTradesTest(unittest.TestCase):
+	def setUp(self):
+		self.bitfinex = Bitfinex.__new__(Bitfinex)
+		self.bitfinex.candles = CandleAggregator(lambda *args: None, intervals=[("1min", 60)])
+		self.bitfinex.lastCandleTrades = {}
+
+	def getTrade(self, sequenceId, timestamp, orderId=None):
+		return TradeRecord(currency_pair="BTCUSD", sequence_id=sequenceId, order_id=orderId, timestamp=str(timestamp), price=100.0, volume=1.0)
+
+	def getTradeCount(self):
+		return self.bitfinex.candles.candles[("BTCUSD", "1min")].trades
+
+	def testSnapshotAndTradeUpdatesAreSkipped(self):
+		self.bitfinex.addTradesToCandles([self.getTrade("1", MONDAY + 1), self.getTrade("2", MONDAY + 2)], "BTCUSD")
+		self.assertEqual(self.bitfinex.candles.candles, {})
+		self.bitfinex.addTradesToCandles(self.getTrade("3", MONDAY + 3), "BTCUSD")
+		self.bitfinex.addTradesToCandles(self.getTrade("3", MONDAY + 3, orderId=42), "BTCUSD")
+		self.assertEqual(self.getTradeCount(), 1)
+
+	def testTradesSentAgainAfterAResubscribeAreCountedOnce(self):
+		for sequenceId, timestamp in [("1", MONDAY + 1), ("2", MONDAY + 2), ("3", MONDAY + 2)]:
+			self.bitfinex.addTradesToCandles(self.getTrade(sequenceId, timestamp), "BTCUSD")
+		# after the reconnect the exchange replays the trades around the drop before the new ones
+		for sequenceId, timestamp in [("2", MONDAY + 2), ("3", MONDAY + 2), ("4", MONDAY + 2), ("5", MONDAY + 5)]:
+			self.bitfinex.addTradesToCandles(self.getTrade(sequenceId, timestamp), "BTCUSD")
+		self.assertEqual(self.getTradeCount(), 5)
+
+if __name__ == "__main__":
+	unittest.main()
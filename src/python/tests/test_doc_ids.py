@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, json, hashlib, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from doc_ids import getContentId, getDocumentId, getBulkAction, isWritten, writeDocument, ID_CONTENT, ID_AUTO, ID_RANDOM
+from records import TradeRecord, FrameStamp, nextUuid
+
+class FakeEs:
+	def __init__(self, response):
+		self.response = response
+		self.calls = []
+
+	def create(self, **kwargs):
+		self.calls.append(("create", kwargs))
+		return self.response
+
+	def index(self, **kwargs):
+		self.calls.append(("index", kwargs))
+		return self.response
+
+class ContentIdTest(unittest.TestCase):
+	def getTrade(self, **fields):
+		values = { "uuid": nextUuid(), "date": FrameStamp(), "currency_pair": "BTCUSD", "sequence_id": "5", "order_id": 7, "price": 100.0 }
+		values.update(fields)
+		return TradeRecord(**values)
+
+	def testSameRecordGetsTheSameId(self):
+		# a retried or re-sent trade has a new uuid and frame date but the same exchange ids
+		self.assertEqual(getContentId("bitfinex", self.getTrade()), getContentId("bitfinex", self.getTrade(price=101.0)))
+
+	def testIdFieldsAndDocTypeChangeTheId(self):
+		trade = self.getTrade()
+		self.assertNotEqual(getContentId("bitfinex", trade), getContentId("bitfinex", self.getTrade(sequence_id="6")))
+		self.assertNotEqual(getContentId("bitfinex", trade), getContentId("okcoin", trade))
+
+	def testIdIsAStableSha1(self):
+		contentId = getContentId("okcoin", { "price": 1.5, "pair": "btc_usd", "uuid": "ignored" })
+		self.assertEqual(contentId, getContentId("okcoin", { "pair": "btc_usd", "price": 1.5, "uuid": "other" }))
+		# the doc type and the values of the sorted fields, so ids do not change between runs or versions
+		self.assertEqual(contentId, hashlib.sha1(b"okcoin|btc_usd|1.5").hexdigest())
+
+	def testDictKeyFields(self):
+		first = getContentId("okcoin", { "pair": "btc_usd", "price": 1.5, "volume": 2 }, ["pair", "price"])
+		self.assertEqual(first, getContentId("okcoin", { "pair": "btc_usd", "price": 1.5, "volume": 3 }, ["pair", "price"]))
+		self.assertNotEqual(first, getContentId("okcoin", { "pair": "btc_usd", "price": 1.25, "volume": 2 }, ["pair", "price"]))
+
+	def testFloatsKeepTheirPrecision(self):
+		self.assertNotEqual(getContentId("okcoin", { "price": 0.1 + 0.2 }), getContentId("okcoin", { "price": 0.3 }))
+
+class DocumentIdTest(unittest.TestCase):
+	def testStrategies(self):
+		dto = { "price": 1.0 }
+		self.assertEqual(getDocumentId(ID_CONTENT, "okcoin", dto), getContentId("okcoin", dto))
+		self.assertEqual(getDocumentId(ID_AUTO, "okcoin", dto), None)
+		self.assertNotEqual(getDocumentId(ID_RANDOM, "okcoin", dto), getDocumentId(ID_RANDOM, "okcoin", dto))
+		self.assertRaises(ValueError, getDocumentId, "sequential", "okcoin", dto)
+
+	def testBulkActions(self):
+		self.assertEqual(json.loads(getBulkAction("index", "type", "abc")), { "create": { "_index": "index", "_type": "type", "_id": "abc" } })
+		self.assertEqual(json.loads(getBulkAction("index", "type", None)), { "index": { "_index": "index", "_type": "type" } })
+
+	def testConflictCountsAsWritten(self):
+		self.assertTrue(isWritten({ "status": 409 }))
+		self.assertTrue(isWritten({ "created": True }))
+		self.assertTrue(isWritten({ "result": "created" }))
+		self.assertFalse(isWritten({ "status": 400 }))
+
+	def testWriteDocument(self):
+		es = FakeEs({ "status": 409 })
+		self.assertTrue(writeDocument(es, "index", "type", "abc", TradeRecord(price=1.0)))
+		self.assertEqual(es.calls[0][0], "create")
+		self.assertEqual(es.calls[0][1]["id"], "abc")
+		self.assertEqual(es.calls[0][1]["body"], '{"price":1.0}')
+		es = FakeEs({ "result": "created" })
+		self.assertTrue(writeDocument(es, "index", "type", None, { "price": 1.0 }))
+		self.assertEqual(es.calls[0][0], "index")
+
+if __name__ == "__main__":
+	unittest.main()
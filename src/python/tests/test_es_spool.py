@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, json, shutil, tempfile, unittest, elasticsearch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from es_spool import Spool, isRetryable, OFFSET_FILE_NAME
+
+# answers every bulk request with the next list of item statuses (all 201 once they run out)
+class FakeEs:
+	def __init__(self, responses=None, error=None):
+		self.responses = responses or []
+		self.error = error
+		self.bodies = []
+
+	def bulk(self, body):
+		self.bodies.append(body)
+		if self.error != None:
+			raise self.error
+		documents = len(body.splitlines()) // 2
+		statuses = self.responses.pop(0) if len(self.responses) > 0 else [201] * documents
+		return { "errors": any([status >= 300 for status in statuses]), "items": [{ "index": { "status": status } } for status in statuses] }
+
+	def getDocuments(self):
+		documents = []
+		for body in self.bodies:
+			documents.extend([json.loads(line) for line in body.splitlines()[1::2]])
+		return documents
+
+class SpoolTest(unittest.TestCase):
+	def setUp(self):
+		self.spoolDir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.spoolDir)
+
+	def readOffset(self):
+		with open(os.path.join(self.spoolDir, OFFSET_FILE_NAME)) as offsetFile:
+			return [int(value) for value in offsetFile.read().split()]
+
+	def testReplayWritesEverySpooledDocument(self):
+		spool = Spool(self.spoolDir)
+		for n in range(5):
+			spool.append("index", "type", "id" + str(n), { "n": n })
+		self.assertTrue(spool.hasPending())
+		es = FakeEs()
+		self.assertEqual(spool.replay(es, batchDocs=2), 5)
+		self.assertEqual([len(body.splitlines()) // 2 for body in es.bodies], [2, 2, 1])
+		self.assertEqual(es.getDocuments(), [{ "n": n } for n in range(5)])
+		self.assertFalse(spool.hasPending())
+		spool.close()
+
+	def testOffsetIsSavedAfterEveryBatch(self):
+		spool = Spool(self.spoolDir)
+		for n in range(4):
+			spool.append("index", "type", "id" + str(n), { "n": n })
+		es = FakeEs(responses=[[201, 201]])
+		# the second batch cannot be sent, the first one is acknowledged
+		bulk = es.bulk
+		def failSecond(body):
+			if len(es.bodies) == 1:
+				es.bodies.append(body)
+				raise elasticsearch.exceptions.ConnectionError("N/A", "connection refused", None)
+			return bulk(body)
+		es.bulk = failSecond
+		self.assertEqual(spool.replay(es, batchDocs=2), 2)
+		segment, offset = self.readOffset()
+		self.assertEqual(offset, len(es.bodies[0].encode("utf-8")))
+		spool.close()
+		# a restarted collector picks up at the saved offset
+		spool = Spool(self.spoolDir)
+		es = FakeEs()
+		self.assertEqual(spool.replay(es), 2)
+		self.assertEqual(es.getDocuments(), [{ "n": 2 }, { "n": 3 }])
+		spool.close()
+
+	def testTornRecordIsNotReplayed(self):
+		spool = Spool(self.spoolDir)
+		spool.append("index", "type", "id0", { "n": 0 })
+		spool.appendBody('{"create":{"_index":"index","_type":"type","_id":"id1"}}\n{"n":')
+		es = FakeEs()
+		self.assertEqual(spool.replay(es), 1)
+		self.assertEqual(es.getDocuments(), [{ "n": 0 }])
+		spool.close()
+
+	def testOnlyPushedBackItemsAreReplayedAgain(self):
+		spool = Spool(self.spoolDir)
+		for n in range(4):
+			spool.append("index", "type", None, { "n": n })
+		es = FakeEs(responses=[[201, 429, 201, 503]])
+		self.assertEqual(spool.replay(es), 2)
+		self.assertTrue(spool.hasPending())
+		self.assertEqual(spool.replay(es), 2)
+		# the accepted documents have no _id, sending them again would index them twice
+		self.assertEqual(es.getDocuments(), [{ "n": 0 }, { "n": 1 }, { "n": 2 }, { "n": 3 }, { "n": 1 }, { "n": 3 }])
+		self.assertFalse(spool.hasPending())
+		spool.close()
+
+	def testUnreachableClusterKeepsTheSpool(self):
+		spool = Spool(self.spoolDir)
+		spool.append("index", "type", "id0", { "n": 0 })
+		es = FakeEs(error=elasticsearch.exceptions.ConnectionError("N/A", "connection refused", None))
+		self.assertEqual(spool.replay(es), 0)
+		self.assertTrue(spool.hasPending())
+		spool.close()
+
+	def testSegmentsRotateAndOldestAreDropped(self):
+		spool = Spool(self.spoolDir, segmentBytes=100, maxBytes=250)
+		for n in range(10):
+			spool.append("index", "type", "id" + str(n), { "n": n })
+		self.assertTrue(len(spool.segments) > 1)
+		self.assertTrue(spool.totalBytes <= 250)
+		es = FakeEs()
+		spool.replay(es)
+		# the documents of the dropped segments are gone, the newest ones are kept
+		documents = es.getDocuments()
+		self.assertTrue(len(documents) < 10)
+		self.assertEqual(documents[-1], { "n": 9 })
+		spool.close()
+
+	def testIsRetryable(self):
+		self.assertTrue(isRetryable(elasticsearch.exceptions.ConnectionError("N/A", "connection refused", None)))
+		self.assertTrue(isRetryable(elasticsearch.exceptions.TransportError(503, "unavailable")))
+		self.assertFalse(isRetryable(elasticsearch.exceptions.TransportError(400, "bad request")))
+		self.assertTrue(isRetryable(429))
+		self.assertFalse(isRetryable(409))
+
+if __name__ == "__main__":
+	unittest.main()
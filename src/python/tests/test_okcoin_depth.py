@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "okcoin"))
+from okcoin_depth import DepthDiffer, CHANGE_SNAPSHOT, CHANGE_INSERT, CHANGE_UPDATE, CHANGE_DELETE
+
+FIRST_PUSH = { "bids": [["100.0", "1.0"], ["99.0", "2.0"]], "asks": [["101.0", "3.0"], ["102.0", "4.0"]] }
+
+class DepthDifferTest(unittest.TestCase):
+	def testFirstPushIsASnapshot(self):
+		differ = DepthDiffer(60)
+		changes = differ.diff("btc_usd", FIRST_PUSH, now=1000)
+		self.assertEqual(sorted(changes), sorted([
+			("BID", 100.0, 1.0, CHANGE_SNAPSHOT), ("BID", 99.0, 2.0, CHANGE_SNAPSHOT),
+			("ASK", 101.0, 3.0, CHANGE_SNAPSHOT), ("ASK", 102.0, 4.0, CHANGE_SNAPSHOT)
+		]))
+
+	def testOnlyChangedLevelsAreReturned(self):
+		differ = DepthDiffer(60)
+		differ.diff("btc_usd", FIRST_PUSH, now=1000)
+		changes = differ.diff("btc_usd", { "bids": [["100.0", "1.0"], ["99.0", "2.5"]], "asks": [["101.0", "3.0"], ["101.5", "1.0"]] }, now=1001)
+		self.assertEqual(sorted(changes), sorted([
+			("BID", 99.0, 2.5, CHANGE_UPDATE),
+			("ASK", 101.5, 1.0, CHANGE_INSERT),
+			("ASK", 102.0, 0.0, CHANGE_DELETE)
+		]))
+
+	def testUnchangedPushReturnsNothing(self):
+		differ = DepthDiffer(60)
+		differ.diff("btc_usd", FIRST_PUSH, now=1000)
+		self.assertEqual(differ.diff("btc_usd", FIRST_PUSH, now=1001), [])
+
+	def testSnapshotEverySnapshotInterval(self):
+		differ = DepthDiffer(60)
+		differ.diff("btc_usd", FIRST_PUSH, now=1000)
+		self.assertEqual(differ.diff("btc_usd", FIRST_PUSH, now=1059), [])
+		changes = differ.diff("btc_usd", FIRST_PUSH, now=1060)
+		self.assertEqual(len(changes), 4)
+		self.assertTrue(all([change[3] == CHANGE_SNAPSHOT for change in changes]))
+
+	def testPairsAreDiffedSeparately(self):
+		differ = DepthDiffer(60)
+		differ.diff("btc_usd", FIRST_PUSH, now=1000)
+		self.assertEqual(len(differ.diff("ltc_usd", FIRST_PUSH, now=1001)), 4)
+
+	def testResetWritesTheNextPushInFull(self):
+		differ = DepthDiffer(60)
+		differ.diff("btc_usd", FIRST_PUSH, now=1000)
+		differ.reset()
+		self.assertEqual(len(differ.diff("btc_usd", FIRST_PUSH, now=1001)), 4)
+
+	def testMalformedLevelsAreSkipped(self):
+		differ = DepthDiffer(60)
+		changes = differ.diff("btc_usd", { "bids": [["100.0"]], "asks": [["101.0", "3.0"]] }, now=1000)
+		self.assertEqual(changes, [("ASK", 101.0, 3.0, CHANGE_SNAPSHOT)])
+
+if __name__ == "__main__":
+	unittest.main()
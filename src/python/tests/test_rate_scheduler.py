@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, time, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rate_scheduler import TokenBucket, RateScheduler, FixedRateClock, getErrorStatus, MIN_RATE_FRACTION
+
+class TokenBucketTest(unittest.TestCase):
+	def testBurstIsFreeThenCallsRunIntoDebt(self):
+		bucket = TokenBucket(2.0, 3)
+		bucket.updatedAt = 100.0
+		self.assertEqual([bucket.reserve(1, 100.0) for i in range(3)], [0.0, 0.0, 0.0])
+		# every call past the burst waits for the tokens the calls before it still owe
+		self.assertEqual(bucket.reserve(1, 100.0), 0.5)
+		self.assertEqual(bucket.reserve(1, 100.0), 1.0)
+		self.assertEqual(bucket.reserve(2, 100.0), 2.0)
+
+	def testRefillIsCappedAtBurst(self):
+		bucket = TokenBucket(1.0, 2)
+		bucket.updatedAt = 100.0
+		bucket.reserve(2, 100.0)
+		self.assertEqual(bucket.reserve(1, 101.0), 0.0)
+		self.assertEqual(bucket.reserve(1, 1000.0), 0.0)
+		self.assertEqual(bucket.tokens, 1.0)
+
+	def testThrottleHalvesTheRateAndPauses(self):
+		bucket = TokenBucket(4.0, 4)
+		bucket.updatedAt = 100.0
+		bucket.throttle(10, 100.0)
+		self.assertEqual(bucket.rate, 2.0)
+		self.assertEqual(bucket.tokens, 0.0)
+		self.assertEqual(bucket.reserve(1, 101.0), 9.0)
+		self.assertEqual(bucket.throttleCount, 1)
+
+	def testThrottleStopsAtTheFloor(self):
+		bucket = TokenBucket(4.0, 4)
+		for i in range(10):
+			bucket.throttle(0, bucket.updatedAt)
+		self.assertEqual(bucket.rate, 4.0 * MIN_RATE_FRACTION)
+
+	def testRecoverWinsBackTheConfiguredRate(self):
+		bucket = TokenBucket(4.0, 4)
+		bucket.throttle(0, bucket.updatedAt)
+		bucket.recover(0.25)
+		self.assertEqual(bucket.rate, 3.0)
+		bucket.recover(0.25)
+		bucket.recover(0.25)
+		self.assertEqual(bucket.rate, 4.0)
+
+class RateSchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.scheduler = RateScheduler(limits={ "kraken": (1.0, 2), "okcoin": (1000.0, 10) }, costs={ "kraken": { "/0/public/Trades": 2 } }, cooldown=7)
+
+	def testCosts(self):
+		self.assertEqual(self.scheduler.getCost("kraken", "/0/public/Trades"), 2)
+		self.assertEqual(self.scheduler.getCost("kraken", "/0/public/Depth"), 1)
+		self.assertEqual(self.scheduler.getCost("okcoin", None), 1)
+
+	def testRoundSeconds(self):
+		self.assertEqual(self.scheduler.getRoundSeconds("kraken", "/0/public/Depth", 300), 300.0)
+		self.assertEqual(self.scheduler.getRoundSeconds("kraken", "/0/public/Trades", 3), 6.0)
+
+	def testExchangesShareNothing(self):
+		self.assertEqual(self.scheduler.acquire("kraken", "/0/public/Trades"), 0.0)
+		self.assertEqual(self.scheduler.acquire("bitfinex"), 0.0)
+		self.assertEqual(self.scheduler.getStats()["requests"], 2)
+
+	def testThrottledAnswerUsesRetryAfter(self):
+		now = time.time()
+		self.scheduler.report("kraken", 429, "30")
+		bucket = self.scheduler.getBucket("kraken")
+		self.assertEqual(bucket.rate, 0.5)
+		self.assertTrue(bucket.pausedUntil >= now + 30)
+		self.scheduler.report("kraken", 503, "soon")
+		self.assertTrue(bucket.pausedUntil < now + 31)
+		self.assertEqual(self.scheduler.getStats()["kraken_throttled"], 2)
+
+	def testSuccessRecoversAndErrorsDoNot(self):
+		bucket = self.scheduler.getBucket("kraken")
+		bucket.rate = 0.5
+		self.scheduler.report("kraken", 500)
+		self.scheduler.report("kraken", None)
+		self.assertEqual(bucket.rate, 0.5)
+		self.scheduler.report("kraken", 200)
+		self.assertTrue(bucket.rate > 0.5)
+
+	def testCallRetriesThrottledErrors(self):
+		calls = []
+		class ThrottledError(Exception):
+			code = 429
+		def fetch(value):
+			calls.append(value)
+			if len(calls) == 1:
+				raise ThrottledError()
+			return value
+		self.scheduler.cooldown = 0
+		self.assertEqual(self.scheduler.call("okcoin", None, fetch, "ticker"), "ticker")
+		self.assertEqual(calls, ["ticker", "ticker"])
+
+	def testCallRaisesOtherErrors(self):
+		def fetch():
+			raise ValueError("bad")
+		self.assertRaises(ValueError, self.scheduler.call, "okcoin", None, fetch)
+
+	def testGetErrorStatus(self):
+		class HttpError(Exception):
+			code = 503
+		class Response:
+			status_code = 429
+		class RequestsError(Exception):
+			response = Response()
+		self.assertEqual(getErrorStatus(HttpError()), 503)
+		self.assertEqual(getErrorStatus(RequestsError()), 429)
+		self.assertEqual(getErrorStatus(ValueError()), None)
+
+class FixedRateClockTest(unittest.TestCase):
+	def testFirstWaitReturnsRightAway(self):
+		clock = FixedRateClock(60)
+		start = time.time()
+		clock.wait()
+		self.assertTrue(time.time() - start < 1)
+		self.assertTrue(clock.nextTick > start + 59)
+
+	def testTicksDoNotDrift(self):
+		clock = FixedRateClock(0.05)
+		start = clock.nextTick
+		for i in range(4):
+			clock.wait()
+		self.assertAlmostEqual(clock.nextTick, start + 4 * 0.05, places=6)
+		self.assertEqual(clock.missedTicks, 0)
+
+	def testOverrunSkipsMissedTicks(self):
+		clock = FixedRateClock(10)
+		clock.nextTick = time.time() - 35
+		clock.wait()
+		self.assertEqual(clock.missedTicks, 3)
+		self.assertTrue(clock.nextTick > time.time())
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, time, unittest
+
+try:
+	from unittest import mock
+except ImportError:
+	# Python 2
+	import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from reconnect import ReconnectManager
+
+class ReconnectManagerTest(unittest.TestCase):
+	def setUp(self):
+		self.outages = []
+		self.bounds = []
+		# records the range the jitter picks from and picks 0, so the backoff can be checked without sleeping
+		def uniform(low, high):
+			self.bounds.append((low, high))
+			return 0
+		patcher = mock.patch("reconnect.random.uniform", side_effect=uniform)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def testFirstAttemptIsImmediateThenBackoffDoubles(self):
+		manager = ReconnectManager("bitfinex", baseDelay=0.5, maxDelay=3)
+		for attempt in range(6):
+			manager.waitForRetry()
+		self.assertEqual(self.bounds, [(0, 0.5), (0, 1.0), (0, 2.0), (0, 3), (0, 3)])
+
+	def testOutageIsPostedOnReconnect(self):
+		manager = ReconnectManager("okcoin", postOutage=self.outages.append)
+		manager.connected()
+		lastSeenAt = time.time() - 5
+		manager.disconnected("connection reset", lastSeenAt)
+		# a second report of the same drop does not move the start of the outage
+		manager.disconnected("closed", time.time())
+		failures = []
+		def connect():
+			if len(failures) < 2:
+				failures.append(1)
+				raise IOError("refused")
+		outage = manager.reconnect(connect)
+		self.assertEqual(self.outages, [outage])
+		self.assertEqual((outage.exchange, outage.reason, outage.attempts), ("okcoin", "connection reset", 3))
+		self.assertEqual(outage.started_at.seconds, lastSeenAt)
+		self.assertTrue(outage.duration >= 5)
+		self.assertEqual(manager.getStats()["outages"], 1)
+		self.assertFalse(manager.getStats()["disconnected"])
+
+	def testConnectedWithoutOutagePostsNothing(self):
+		manager = ReconnectManager("okcoin", postOutage=self.outages.append)
+		self.assertEqual(manager.connected(), None)
+		self.assertEqual(self.outages, [])
+
+	def testBackoffOnlyStartsOverAfterAStableConnection(self):
+		manager = ReconnectManager("bitfinex", stableSeconds=60)
+		manager.waitForRetry()
+		manager.waitForRetry()
+		manager.connected()
+		# dropped right after it opened, the next attempt keeps backing off
+		manager.disconnected("closed")
+		self.assertEqual(manager.waitForRetry(), 3)
+		manager.connected()
+		manager.connectedAt -= 60
+		manager.disconnected("closed")
+		self.assertEqual(manager.waitForRetry(), 1)
+
+class JitterTest(unittest.TestCase):
+	def testJitterStaysWithinTheBound(self):
+		manager = ReconnectManager("bitfinex", baseDelay=0.5, maxDelay=60)
+		manager.attempts = 5
+		delays = [manager.getDelay() for i in range(200)]
+		self.assertTrue(all([0 <= delay <= 4.0 for delay in delays]))
+		self.assertTrue(len(set(delays)) > 1)
+
+if __name__ == "__main__":
+	unittest.main()
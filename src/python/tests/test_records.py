@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, json, datetime, unittest
+from elasticsearch.serializer import JSONSerializer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from records import FrameStamp, TradeRecord, OrderRecord, nextUuid, toSource
+
+class FrameStampTest(unittest.TestCase):
+	def testJsonAndDateAgree(self):
+		stamp = FrameStamp(1476662400.25)
+		self.assertEqual(stamp.json, '"2016-10-17T00:00:00.250000+00:00"')
+		self.assertEqual('"' + stamp.getDate().isoformat() + '"', stamp.json)
+
+class RecordTest(unittest.TestCase):
+	def testToJsonWritesFieldsInOrderAndSkipsNone(self):
+		record = TradeRecord(uuid="u", currency_pair="BTCUSD", sequence_id="1", price=100.5, volume=-2.0, order_type="SELL")
+		self.assertEqual(record.toJson(), '{"uuid":"u","currency_pair":"BTCUSD","sequence_id":"1","price":100.5,"volume":-2.0,"order_type":"SELL"}')
+
+	def testToJsonMatchesJsonDumps(self):
+		stamp = FrameStamp(1476662400.5)
+		record = OrderRecord(uuid=nextUuid(), date=stamp, currency_pair="BTCUSD", timestamp="1476662400", price=0.1, count=3, volume=1e-08, order_type="BID", change_type=u"insert")
+		expected = record.toDict()
+		expected["date"] = stamp.json.strip('"')
+		self.assertEqual(json.loads(record.toJson()), expected)
+
+	def testNonFiniteFloatsAndOtherTypes(self):
+		record = TradeRecord(price=float("inf"), volume=True, timestamp=datetime.date(2016, 10, 17))
+		self.assertEqual(record.toJson(), '{"timestamp":"2016-10-17","price":Infinity,"volume":true}')
+
+	def testToDictTurnsTheStampIntoADatetime(self):
+		stamp = FrameStamp(1476662400)
+		self.assertEqual(TradeRecord(date=stamp, price=1.0).toDict(), { "date": stamp.getDate(), "price": 1.0 })
+
+	def testToSource(self):
+		serializer = JSONSerializer()
+		self.assertEqual(toSource(TradeRecord(price=1.0), serializer), '{"price":1.0}')
+		self.assertEqual(json.loads(toSource({ "price": 1.0 }, serializer)), { "price": 1.0 })
+
+class NextUuidTest(unittest.TestCase):
+	def testIdsAreUniqueAndUuidShaped(self):
+		ids = [nextUuid() for i in range(1000)]
+		self.assertEqual(len(set(ids)), 1000)
+		self.assertEqual(len(ids[0]), 36)
+		self.assertEqual(ids[0][:24], ids[-1][:24])
+
+if __name__ == "__main__":
+	unittest.main()
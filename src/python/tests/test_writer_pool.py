@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+import os, sys, threading, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from writer_pool import WriterPool, POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_SPILL
+
+class FakeSpool:
+	def __init__(self):
+		self.entries = []
+
+	def append(self, indexName, docType, docId, dto):
+		self.entries.append((indexName, docType, docId, dto))
+
+class WriterPoolTest(unittest.TestCase):
+	def setUp(self):
+		self.written = []
+		self.taken = threading.Event()
+		self.release = threading.Event()
+
+	# holds the only writer thread on the first document, so the queue behind it fills up
+	def write(self, dto, indexName=None, docType=None, docId=None):
+		self.taken.set()
+		self.release.wait(5)
+		self.written.append(dto)
+
+	def getBusyPool(self, maxSize, policy, spool=None):
+		pool = WriterPool(self.write, workers=1, maxSize=maxSize, policy=policy, spool=spool)
+		self.addCleanup(self.release.set)
+		pool.put("first", "index", "type", "1")
+		self.assertTrue(self.taken.wait(5))
+		return pool
+
+	def testUnknownPolicy(self):
+		self.assertRaises(ValueError, WriterPool, self.write, 1, 10, "discard")
+
+	def testSpillNeedsASpool(self):
+		self.assertRaises(ValueError, WriterPool, self.write, 1, 10, POLICY_SPILL)
+
+	def testDropOldestEvictsTheOldestQueuedDocument(self):
+		pool = self.getBusyPool(2, POLICY_DROP_OLDEST)
+		for dto in ["a", "b", "c", "d"]:
+			pool.put(dto, "index", "type", dto)
+		self.assertEqual(pool.getStats()["dropped"], 2)
+		self.release.set()
+		pool.close()
+		self.assertEqual(self.written, ["first", "c", "d"])
+		stats = pool.getStats()
+		self.assertEqual((stats["enqueued"], stats["written"], stats["high_water"], stats["depth"]), (5, 3, 2, 0))
+
+	def testSpillWritesToTheSpool(self):
+		spool = FakeSpool()
+		pool = self.getBusyPool(1, POLICY_SPILL, spool)
+		pool.put("a", "index", "type", "a")
+		pool.put("b", "index", "type", "b")
+		pool.put("c", "index", "type", "c")
+		self.assertEqual(spool.entries, [("index", "type", "b", "b"), ("index", "type", "c", "c")])
+		self.release.set()
+		pool.close()
+		self.assertEqual(self.written, ["first", "a"])
+		self.assertEqual(pool.getStats()["spilled"], 2)
+
+	def testCloseDrainsTheQueue(self):
+		pool = WriterPool(lambda dto: self.written.append(dto), workers=3, maxSize=100, policy=POLICY_BLOCK)
+		for n in range(50):
+			pool.put(n)
+		pool.close()
+		self.assertEqual(sorted(self.written), list(range(50)))
+		self.assertFalse(any([thread.is_alive() for thread in pool.threads]))
+		self.assertEqual(pool.getStats()["written"], 50)
+
+	def testFailedWriteIsCountedAndTheThreadKeepsGoing(self):
+		def write(dto):
+			if dto == 1:
+				raise IOError("cluster gone")
+			self.written.append(dto)
+		pool = WriterPool(write, workers=1, maxSize=10, policy=POLICY_BLOCK)
+		for n in range(3):
+			pool.put(n)
+		pool.close()
+		self.assertEqual(self.written, [0, 2])
+		self.assertEqual(pool.getStats()["failed"], 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+__author__ = "currentsea"
+__copyright__   = "Copyright 2016, currentsea"
+__license__ = "MIT"
+
+# Bounded queue between message decoding and elasticsearch indexing, drained
+# by a pool of writer threads so that a slow cluster never stalls the thread
+# reading frames off the websocket.  When the queue is full the configured
+# policy decides what happens to new documents:
+#   block       - the producer waits for room (nothing is lost)
+#   drop_oldest - the oldest queued document is discarded to make room
+#   spill       - the document is appended to the es_spool.Spool of the
+#                 caller and written by its replay thread, like any document
+#                 the cluster could not take.  The queued arguments have to be
+#                 (dto, indexName, docType, docId) for this policy.
+
+import threading
+
+try:
+	import queue
+except ImportError:
+	# Python 2
+	import Queue as queue
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_SPILL = "spill"
+POLICIES = [POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_SPILL]
+
+DEFAULT_WRITER_THREADS = 4
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_QUEUE_POLICY = POLICY_BLOCK
+
+class WriterPool:
+	def __init__(self, writeFn, workers=DEFAULT_WRITER_THREADS, maxSize=DEFAULT_QUEUE_SIZE, policy=DEFAULT_QUEUE_POLICY, spool=None):
+		if policy not in POLICIES:
+			raise ValueError("queue policy must be one of " + ", ".join(POLICIES))
+		if policy == POLICY_SPILL and spool == None:
+			raise ValueError("the spill queue policy needs a spool")
+		self.writeFn = writeFn
+		self.maxSize = maxSize
+		self.policy = policy
+		self.spool = spool
+		self.queue = queue.Queue(maxSize)
+		self.lock = threading.Lock()
+		self.statsLock = threading.Lock()
+		self.stats = { "enqueued": 0, "written": 0, "failed": 0, "dropped": 0, "spilled": 0, "high_water": 0 }
+		self.running = True
+		self.threads = []
+		for i in range(workers):
+			thread = threading.Thread(target=self.drain, name="es-writer-" + str(i))
+			thread.daemon = True
+			thread.start()
+			self.threads.append(thread)
+
+	def put(self, *args):
+		if self.policy == POLICY_BLOCK:
+			self.queue.put(args)
+		elif self.policy == POLICY_DROP_OLDEST:
+			with self.lock:
+				while True:
+					try:
+						self.queue.put_nowait(args)
+						break
+					except queue.Full:
+						try:
+							self.queue.get_nowait()
+							self.queue.task_done()
+							self.count("dropped")
+						except queue.Empty:
+							pass
+		else:
+			try:
+				self.queue.put_nowait(args)
+			except queue.Full:
+				self.spill(args)
+				return
+		depth = self.queue.qsize()
+		with self.statsLock:
+			self.stats["enqueued"] += 1
+			if depth > self.stats["high_water"]:
+				self.stats["high_water"] = depth
+
+	def count(self, statName):
+		with self.statsLock:
+			self.stats[statName] += 1
+
+	def spill(self, args):
+		dto, indexName, docType, docId = args
+		self.spool.append(indexName, docType, docId, dto)
+		self.count("spilled")
+
+	def drain(self):
+		while True:
+			try:
+				args = self.queue.get(timeout=0.5)
+			except queue.Empty:
+				if not self.running:
+					return
+				continue
+			try:
+				self.writeFn(*args)
+				self.count("written")
+			except Exception as e:
+				self.count("failed")
+				print("!! FATAL !!: WRITER THREAD FAILED TO INDEX DOCUMENT: " + str(e))
+			finally:
+				self.queue.task_done()
+
+	def getQueueDepth(self):
+		return self.queue.qsize()
+
+	def getStats(self):
+		with self.statsLock:
+			stats = dict(self.stats)
+		stats["depth"] = self.queue.qsize()
+		stats["capacity"] = self.maxSize
+		return stats
+
+	def close(self):
+		self.queue.join()
+		self.running = False
+		for thread in self.threads:
+			thread.join()